@@ -1,25 +1,78 @@
 from flask import Flask, session, render_template
 from routes.main import main_bp
 from routes.admin import admin_bp
+from werkzeug.security import generate_password_hash
 from dotenv import load_dotenv
 from flask_wtf.csrf import CSRFProtect
-from config import Config
+from config import Config, use_config
+from managers.product_manager import ProductManager
+from managers.order_manager import OrderManager
+from managers.customer_manager import CustomerManager
+from utils.email_outbox import get_outbox
+from utils import assets, compression, metrics
 import os
 
 load_dotenv()
 
-app = Flask(__name__)
-app.config.from_object(Config)
+csrf = CSRFProtect()
 
-csrf = CSRFProtect(app)
 
-# Register blueprints
-app.register_blueprint(main_bp)
-app.register_blueprint(admin_bp)
+def create_app(config=Config, preload=False):
+    """
+    Build the app from a config class (or object). The data stores and
+    process-wide singletons (outbox, stock ledger, carts, ...) are opened
+    from the same config, so a test config gets its own files.
+
+    Each store is loaded once here, so with `gunicorn --preload` the
+    parsed data is built in the master and shared copy-on-write by the
+    forked workers. The email sender thread starts right away, unless
+    `preload` says this process is a master that will fork workers
+    (gunicorn.conf.py); each worker then starts its own from post_fork.
+    """
+    use_config(config)
+    app = Flask(__name__)
+    app.config.from_object(config)
+    # Hashing is deliberately slow; set ADMIN_PASSWORD_HASH to skip it at boot
+    if not app.config.get("ADMIN_PASSWORD_HASH") and app.config.get("ADMIN_PASSWORD"):
+        app.config["ADMIN_PASSWORD_HASH"] = generate_password_hash(app.config["ADMIN_PASSWORD"])
+
+    csrf.init_app(app)
+
+    # Request timing, Server-Timing and /metrics (before the blueprints, so
+    # their before_request hooks are timed too)
+    metrics.init_app(app)
+
+    # gzip/brotli and ETag/304 for dynamic responses (after metrics, so the
+    # compression time is part of the request's timing)
+    compression.init_app(app)
+
+    # Fingerprinted static files from build_assets.py, served from /assets
+    assets.init_app(app)
+
+    # Load data on app startup
+    ProductManager.load_products()
+    OrderManager.load_orders()
+    CustomerManager.load_customers()
+
+    # Register blueprints
+    app.register_blueprint(main_bp)
+    app.register_blueprint(admin_bp)
+
+    # Deliver queued emails in the background, including any left from a
+    # previous run; the hook restarts the thread in forked workers
+    if not preload:
+        get_outbox().ensure_worker()
+
+    @app.before_request
+    def start_email_worker():
+        get_outbox().ensure_worker()
+
+    @app.errorhandler(404)
+    def page_not_found(e):
+        return render_template('404.html'), 404
+
+    return app
 
-@app.errorhandler(404)
-def page_not_found(e):
-    return render_template('404.html'), 404
 
 if __name__ == '__main__':
-    app.run(debug=True)
+    create_app().run(debug=True)
@@ -0,0 +1,169 @@
+"""
+Flash-sale checkout: many concurrent buyers of one product.
+
+    python -m benchmarks.flash_sale --buyers 150 --processes 4 --stock 1000
+    python -m benchmarks.flash_sale --engine sqlite --save-baseline
+
+Seeds a small catalog, gives one product --stock units, then starts
+--buyers virtual buyers spread over --processes worker processes, each
+with its own app instance on the shared data directory (like gunicorn
+workers). Every buyer puts one jar in the cart and checks out, over and
+over, until the product is sold out. Prints checkout throughput and
+latency, and fails if more jars were sold than were in stock or the
+stock ledger disagrees with the orders written. --baseline and
+--save-baseline work as in benchmarks.run.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+from benchmarks.harness import compare, load_baseline, print_table, save_baseline, summarize
+from benchmarks.run import DEFAULT_BASELINE, boot_app, configure_environment
+from benchmarks.seed import customer_email, seed
+
+
+def buy_until_sold_out(app, sku, customers, rng, results):
+    client = app.test_client()
+    from managers.product_manager import ProductManager
+
+    while True:
+        added = client.post("/add_to_cart", json={"id": sku}).get_json()
+        if not added["success"]:
+            level = ProductManager.stock(sku)
+            if level["on_hand"] == 0:
+                return
+            # Everything left is held by other checkouts; some may be released
+            time.sleep(0.001)
+            continue
+        cid = rng.randint(1, customers)
+        start = time.perf_counter()
+        response = client.post("/checkout/details", data={
+            "name": f"Flash Buyer {cid}", "email": customer_email(cid),
+            "phone": "03000000000", "address": "Flash Sale Street",
+        })
+        elapsed = time.perf_counter() - start
+        sold = response.status_code == 302 and response.location.endswith("/checkout/success")
+        results.append((elapsed, sold))
+
+
+def worker(data_dir, engine, sku, buyers, customers, seed_value, ready, go, queue):
+    """One worker process: boot the app, then run `buyers` buyer threads."""
+    configure_environment(data_dir, engine)
+    app, _ = boot_app(data_dir, engine)
+    results = []
+    threads = [
+        threading.Thread(target=buy_until_sold_out, args=(app, sku, customers, random.Random(seed_value + n), results))
+        for n in range(buyers)
+    ]
+    ready.put(os.getpid())
+    go.wait()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    queue.put(results)
+
+
+def sold_in_orders(sku, first_new_order):
+    """Units of `sku` in orders placed during the run, read back through OrderManager."""
+    from managers.order_manager import OrderManager
+
+    OrderManager.load_orders()
+    units = 0
+    for order in OrderManager.get_all():
+        if order["id"] < first_new_order:
+            continue
+        units += sum(item["quantity"] for item in order["items"] if item["id"] == sku)
+    return units
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--engine", choices=["json", "sqlite"], default="json")
+    parser.add_argument("--buyers", type=int, default=150, help="concurrent buyers in total")
+    parser.add_argument("--processes", type=int, default=4, help="worker processes the buyers are spread over")
+    parser.add_argument("--stock", type=int, default=1000, help="units of the sale product")
+    parser.add_argument("--orders", type=int, default=1000, help="orders seeded before the sale")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.5)
+    parser.add_argument("--min-delta-ms", type=float, default=0.05)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    data_dir = tempfile.mkdtemp(prefix="jam-flash-")
+    try:
+        counts = seed(data_dir, products=100, orders=args.orders, customers=300, seed=args.seed)
+        with open(os.path.join(data_dir, "products.json")) as f:
+            sku = next(p["id"] for p in json.load(f) if p["status"] == "available")
+
+        configure_environment(data_dir, args.engine)
+        if args.engine == "sqlite":
+            from managers.sqlite_storage import migrate_from_json
+            migrate_from_json(data_dir, os.environ["SQLITE_PATH"])
+        from managers.stock import StockLedger
+        StockLedger(os.environ["STOCK_DB_PATH"]).set(sku, args.stock)
+
+        # Spawned, not forked: each worker boots the app from scratch
+        ctx = multiprocessing.get_context("spawn")
+        ready, queue, go = ctx.Queue(), ctx.Queue(), ctx.Event()
+        processes = []
+        for n in range(args.processes):
+            buyers = args.buyers // args.processes + (n < args.buyers % args.processes)
+            p = ctx.Process(target=worker, args=(
+                data_dir, args.engine, sku, buyers, counts["customers"], args.seed + 1000 * n, ready, go, queue,
+            ))
+            p.start()
+            processes.append(p)
+        for _ in processes:
+            ready.get()
+
+        start = time.perf_counter()
+        go.set()
+        results = [r for _ in processes for r in queue.get()]
+        elapsed = time.perf_counter() - start
+        for p in processes:
+            p.join()
+
+        sold = sum(1 for _, ok in results if ok)
+        level = StockLedger(os.environ["STOCK_DB_PATH"]).get(sku)
+        in_orders = sold_in_orders(sku, args.orders + 1)
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+    stats = {"checkout": summarize([seconds for seconds, _ in results], elapsed)}
+    print_table(stats)
+    print(f"\n{args.buyers} buyers in {args.processes} processes ({args.engine}): "
+          f"{sold} of {args.stock} units sold in {elapsed:.2f}s ({sold / elapsed:.1f} checkouts/s), "
+          f"{len(results) - sold} checkouts turned away")
+    print(f"ledger: {level['on_hand']} on hand, {level['reserved']} held; orders contain {in_orders} units")
+
+    failures = []
+    if sold != args.stock or in_orders != sold:
+        failures.append(f"sold {sold}, orders contain {in_orders}, stock was {args.stock}")
+    if level["on_hand"] != 0 or level["reserved"] != 0:
+        failures.append(f"ledger left at {level}")
+    for failure in failures:
+        print(f"OVERSOLD/INCONSISTENT: {failure}")
+
+    key = f"flash/{args.engine}"
+    if args.save_baseline and not failures:
+        save_baseline(args.baseline, key, stats, calibration=1.0)
+        print(f"Saved baseline {key} to {args.baseline}")
+        return 0
+    baseline = load_baseline(args.baseline).get(key)
+    regressions = compare(stats, 1.0, baseline, args.tolerance, args.min_delta_ms) if baseline else []
+    for name, metric, old, new in regressions:
+        print(f"REGRESSION {name}: {metric} {old} -> {new}")
+    return 1 if failures or regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,165 @@
+"""Timing, percentile and baseline helpers shared by the benchmark scripts."""
+import gc
+import json
+import os
+import resource
+import sys
+import time
+import tracemalloc
+
+# Metrics compared against the baseline; a higher value is worse for all of them
+GATED_METRICS = ("p50_ms", "p95_ms", "peak_kb")
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, round(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[rank]
+
+
+def summarize(latencies, elapsed):
+    """Stats for a list of per-operation latencies in seconds."""
+    ordered = sorted(latencies)
+    result = {
+        "ops": len(ordered),
+        "ops_per_sec": round(len(ordered) / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(percentile(ordered, 50) * 1000, 4),
+        "p95_ms": round(percentile(ordered, 95) * 1000, 4),
+        "p99_ms": round(percentile(ordered, 99) * 1000, 4),
+        "max_ms": round(ordered[-1] * 1000, 4) if ordered else 0.0,
+    }
+    return result
+
+
+def best_of(rounds):
+    """Combine per-round stats, keeping each metric's best value (timeit-style)."""
+    best = dict(rounds[0])
+    for stats in rounds[1:]:
+        for metric, value in stats.items():
+            if metric == "ops_per_sec":
+                best[metric] = max(best[metric], value)
+            elif metric.endswith("_ms"):
+                best[metric] = min(best[metric], value)
+    return best
+
+
+def measure(fn, iterations, setup=None, rounds=3, warmup=5, memory_iterations=20):
+    """
+    Time `fn(state)` over `rounds` x `iterations` calls, where `state`
+    comes from `setup()` (run untimed before every call), and report the
+    best round for each metric so one noisy stretch doesn't fail a run.
+    A separate, shorter pass under tracemalloc records the peak memory
+    the calls allocate, so the tracing overhead stays out of the latencies.
+    """
+    def call():
+        state = setup() if setup else None
+        start = time.perf_counter()
+        fn(state)
+        return time.perf_counter() - start
+
+    for _ in range(warmup):
+        call()
+
+    per_round = []
+    for _ in range(rounds):
+        gc.collect()
+        latencies = [call() for _ in range(iterations)]
+        per_round.append(summarize(latencies, sum(latencies)))
+    stats = best_of(per_round)
+
+    gc.collect()
+    tracemalloc.start()
+    try:
+        peak = 0
+        for _ in range(min(memory_iterations, iterations)):
+            state = setup() if setup else None
+            tracemalloc.reset_peak()
+            base = tracemalloc.get_traced_memory()[0]
+            fn(state)
+            peak = max(peak, tracemalloc.get_traced_memory()[1] - base)
+    finally:
+        tracemalloc.stop()
+    stats["peak_kb"] = round(peak / 1024, 1)
+    return stats
+
+
+def calibrate(repeat=5):
+    """
+    Seconds for a fixed pure-Python workload (best of `repeat`). Stored
+    with a baseline so timings can be compared across runs on a machine
+    whose speed drifts (frequency scaling, noisy neighbours).
+    """
+    data = [{"id": i, "name": f"item {i}", "price": i * 0.5} for i in range(2000)]
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(10):
+            json.loads(json.dumps(data))
+            sorted(data, key=lambda d: -d["price"])
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def max_rss_kb():
+    """Peak resident set size of this process so far, in KiB."""
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss // 1024 if sys.platform == "darwin" else rss
+
+
+# -------------------------
+# Baselines
+# -------------------------
+def load_baseline(path):
+    if not path or not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_baseline(path, key, results, calibration):
+    """Store `results` under `key` (e.g. "json/100k"), keeping other keys' entries."""
+    baseline = load_baseline(path)
+    baseline[key] = {"calibration_s": calibration, "results": results}
+    with open(path, "w") as f:
+        json.dump(baseline, f, indent=2, sort_keys=True)
+        f.write("\n")
+
+
+def compare(results, calibration, baseline, tolerance, min_delta_ms=0.05):
+    """
+    Regressions of `results` against a saved `baseline` entry:
+    [(benchmark, metric, baseline value, new value)] for every gated
+    metric that grew by more than `tolerance` (0.2 = 20%). If this run's
+    calibration workload was slower than the baseline's, the allowed
+    timings grow with it; a faster machine never tightens them. Timing
+    changes smaller than `min_delta_ms` are never reported.
+    """
+    speed = max(1.0, calibration / baseline["calibration_s"])
+    regressions = []
+    for name, stats in results.items():
+        previous = baseline["results"].get(name)
+        if not previous:
+            continue
+        for metric in GATED_METRICS:
+            old, new = previous.get(metric), stats.get(metric)
+            if old is None or new is None:
+                continue
+            if metric.endswith("_ms"):
+                allowed = max(old * speed * (1 + tolerance), old + min_delta_ms)
+            else:
+                # Ignore sub-KiB noise around zero
+                allowed = max(old, 1.0) * (1 + tolerance)
+            if new > allowed:
+                regressions.append((name, metric, old, new))
+    return regressions
+
+
+def print_table(results):
+    columns = ("ops_per_sec", "p50_ms", "p95_ms", "p99_ms", "peak_kb")
+    width = max(len(name) for name in results) + 2
+    print(f"{'benchmark':<{width}}" + "".join(f"{c:>14}" for c in columns))
+    for name, stats in results.items():
+        print(f"{name:<{width}}" + "".join(f"{stats.get(c, ''):>14}" for c in columns))
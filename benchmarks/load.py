@@ -0,0 +1,168 @@
+"""
+Concurrent load test against a running server.
+
+    python -m benchmarks.load --url http://127.0.0.1:5000 --users 20 --duration 30
+
+Each virtual user loops through a shopper session (storefront, product
+page, add to cart, update cart, cart page, and every --checkout-every
+loops a checkout) with its own cookies and CSRF token. With
+--admin-password the users also page through /admin/orders. Prints
+overall throughput plus p50/p95/p99 latency per endpoint; --baseline /
+--save-baseline work as in benchmarks.run.
+
+Point the server at a seeded data directory (see benchmarks.seed), not
+at production data: the checkouts place real orders.
+"""
+import argparse
+import http.cookiejar
+import json
+import random
+import re
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import defaultdict
+
+from benchmarks.harness import compare, load_baseline, print_table, save_baseline, summarize
+from benchmarks.run import DEFAULT_BASELINE
+
+CSRF_META = re.compile(r'<meta name="csrf-token" content="([^"]+)"')
+PRODUCT_LINK = re.compile(r'href="/product/(\d+)"')
+
+
+class VirtualUser:
+    def __init__(self, base_url, record, rng):
+        self.base_url = base_url.rstrip("/")
+        self.record = record
+        self.rng = rng
+        self.csrf = None
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar())
+        )
+
+    def request(self, name, path, data=None, json_body=None):
+        headers = {}
+        body = None
+        if json_body is not None:
+            body = json.dumps(json_body).encode()
+            headers["Content-Type"] = "application/json"
+        elif data is not None:
+            body = urllib.parse.urlencode(data).encode()
+        if body is not None and self.csrf:
+            headers["X-CSRFToken"] = self.csrf
+        req = urllib.request.Request(self.base_url + path, data=body, headers=headers)
+        start = time.perf_counter()
+        try:
+            with self.opener.open(req, timeout=30) as response:
+                text = response.read().decode("utf-8", "replace")
+                ok = response.status < 400
+        except urllib.error.HTTPError as e:
+            text, ok = "", False
+            e.close()
+        except OSError:
+            text, ok = "", False
+        self.record(name, time.perf_counter() - start, ok)
+        match = CSRF_META.search(text)
+        if match:
+            self.csrf = match.group(1)
+        return text
+
+    def shop(self, checkout):
+        page = self.request("GET /", "/")
+        product_ids = PRODUCT_LINK.findall(page) or ["1"]
+        pid = int(self.rng.choice(product_ids))
+        self.request("GET /product/<id>", f"/product/{pid}")
+        self.request("POST /add_to_cart", "/add_to_cart", json_body={"id": pid})
+        self.request("POST /update_cart", "/update_cart", json_body={"id": pid, "action": "increase"})
+        self.request("GET /cart", "/cart")
+        if checkout:
+            n = self.rng.randrange(1, 10**6)
+            self.request("POST /checkout/details", "/checkout/details", data={
+                "name": f"Load User {n}", "email": f"load{n}@example.com",
+                "phone": "03000000000", "address": "Load Test Street", "csrf_token": self.csrf or "",
+            })
+
+    def login_admin(self, username, password):
+        self.request("GET /admin/login", "/admin/login")
+        self.request("POST /admin/login", "/admin/login", data={
+            "username": username, "password": password, "csrf_token": self.csrf or "",
+        })
+
+    def browse_orders(self):
+        self.request("GET /admin/orders", f"/admin/orders?page={self.rng.randint(1, 20)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://127.0.0.1:5000")
+    parser.add_argument("--users", type=int, default=10, help="concurrent virtual users")
+    parser.add_argument("--duration", type=float, default=30, help="seconds to run")
+    parser.add_argument("--checkout-every", type=int, default=5, help="check out on every Nth loop (0 = never)")
+    parser.add_argument("--admin-username", default="admin")
+    parser.add_argument("--admin-password", help="also load /admin/orders, logged in with these credentials")
+    parser.add_argument("--name", default="load", help="baseline key for this scenario")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.5)
+    parser.add_argument("--min-delta-ms", type=float, default=0.05)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    latencies = defaultdict(list)
+    errors = defaultdict(int)
+    lock = threading.Lock()
+
+    def record(name, seconds, ok):
+        with lock:
+            latencies[name].append(seconds)
+            if not ok:
+                errors[name] += 1
+
+    deadline = time.monotonic() + args.duration
+
+    def run_user(n):
+        user = VirtualUser(args.url, record, random.Random(args.seed + n))
+        if args.admin_password:
+            user.login_admin(args.admin_username, args.admin_password)
+        loop = 0
+        while time.monotonic() < deadline:
+            loop += 1
+            user.shop(checkout=bool(args.checkout_every) and loop % args.checkout_every == 0)
+            if args.admin_password:
+                user.browse_orders()
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=run_user, args=(n,)) for n in range(args.users)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+
+    results = {name: summarize(values, elapsed) for name, values in sorted(latencies.items())}
+    total = sum(len(v) for v in latencies.values())
+    print_table(results)
+    print(f"\n{total} requests in {elapsed:.1f}s ({total / elapsed:.1f} req/s) with {args.users} users")
+    for name, count in errors.items():
+        print(f"ERRORS {name}: {count}")
+
+    key = f"load/{args.name}"
+    if args.save_baseline:
+        save_baseline(args.baseline, key, results, calibration=1.0)
+        print(f"Saved baseline {key} to {args.baseline}")
+        return 0
+    baseline = load_baseline(args.baseline).get(key)
+    if not baseline:
+        print(f"No baseline for {key} in {args.baseline}; run with --save-baseline to record one.")
+        return 1 if errors else 0
+    regressions = compare(results, 1.0, baseline, args.tolerance, args.min_delta_ms)
+    for name, metric, old, new in regressions:
+        print(f"REGRESSION {name}: {metric} {old} -> {new}")
+    return 1 if regressions or errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,259 @@
+"""
+Micro-benchmarks of the storefront and admin hot paths, run in-process
+against the Flask test client.
+
+    python -m benchmarks.run --scale 1k
+    python -m benchmarks.run --scale 100k --engine sqlite --save-baseline
+    python -m benchmarks.run --scale 100k --tolerance 0.3
+    python -m benchmarks.run --scale 1k --check     # in CI
+
+Each run seeds a fresh data set in a temporary directory (or reuses
+--data-dir) and points the app at it, so nothing under data/ is touched.
+It prints throughput, p50/p95/p99 latency and peak allocated memory per
+benchmark. Results are compared with the stored baseline for the same
+engine and scale: a benchmark whose p50, p95 or peak memory grew by more
+than --tolerance is reported and the run exits with status 1.
+
+Baselines are machine-specific; record them with --save-baseline on the
+machine that runs the comparison. Without a baseline the run only
+reports; with --check (implied when the CI environment variable is set)
+a missing baseline, or a benchmark missing from it, fails the run with
+status 2, so a gate can't pass by having nothing to compare against.
+"""
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+from benchmarks.harness import (
+    calibrate, compare, load_baseline, max_rss_kb, measure, print_table, save_baseline
+)
+from benchmarks.seed import customer_email, scale_args, scale_counts, seed
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+
+class DiscardSMTP:
+    """SMTP stand-in for the outbox worker, so benchmarks never send mail."""
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def starttls(self):
+        pass
+
+    def login(self, *args):
+        pass
+
+    def noop(self):
+        return (250, b"ok")
+
+    def send_message(self, message):
+        return {}
+
+    def quit(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def configure_environment(data_dir, engine):
+    """Point config.py at `data_dir`; must run before the app is imported."""
+    os.environ.update({
+        "DATA_DIR": data_dir,
+        "STORAGE_ENGINE": engine,
+        "SQLITE_PATH": os.path.join(data_dir, "store.db"),
+        "ANALYTICS_DB_PATH": os.path.join(data_dir, "analytics.db"),
+        "OUTBOX_PATH": os.path.join(data_dir, "outbox.db"),
+        "CART_DB_PATH": os.path.join(data_dir, "carts.db"),
+        "STOCK_DB_PATH": os.path.join(data_dir, "stock.db"),
+    })
+    os.environ.setdefault("SECRET_KEY", "benchmark")
+    os.environ.setdefault("ADMIN_USERNAME", "admin")
+    os.environ.setdefault("ADMIN_PASSWORD", "benchmark")
+
+
+def boot_app(data_dir, engine):
+    """Build the app against the seeded data. Returns (app, seconds taken)."""
+    if engine == "sqlite" and not os.path.exists(os.environ["SQLITE_PATH"]):
+        from managers.sqlite_storage import migrate_from_json
+        migrate_from_json(data_dir, os.environ["SQLITE_PATH"])
+
+    from config import Config
+
+    class BenchmarkConfig(Config):
+        WTF_CSRF_ENABLED = False
+
+    # Emails are queued as usual but never leave the machine
+    from utils import email_outbox
+    email_outbox._outbox = email_outbox.EmailOutbox(os.environ["OUTBOX_PATH"], smtp_factory=DiscardSMTP)
+    email_outbox._outbox_config = BenchmarkConfig
+
+    start = time.perf_counter()
+    from app import create_app
+    app = create_app(BenchmarkConfig)
+    elapsed = time.perf_counter() - start
+
+    # The app builds the dashboard aggregates in the background on first
+    # use; build them up front so that doesn't run during the timings
+    from managers.order_manager import OrderManager
+    OrderManager.rebuild_analytics(only_if_missing=True, wait=True)
+    return app, elapsed
+
+
+def build_benchmarks(app, counts, rng):
+    """{name: (fn(state), setup() -> state)} for every hot path."""
+    from managers.cart_manager import CartManager
+    from managers.order_manager import OrderManager
+    from managers.pricing import PricingEngine
+    from managers.product_manager import ProductManager
+
+    product_ids = [p["id"] for p in ProductManager.get_all() if p.get("status") != "out-of-stock"]
+    customer_ids = range(1, counts["customers"] + 1)
+
+    def random_cart():
+        return {str(pid): rng.randint(1, 5) for pid in rng.sample(product_ids, min(5, len(product_ids)))}
+
+    def random_user():
+        cid = rng.choice(customer_ids)
+        return {"name": f"Customer {cid}", "email": customer_email(cid), "phone": "03000000000", "address": "Benchmark Street"}
+
+    def expect(response, status):
+        assert response.status_code == status, (response.status_code, response.data[:200])
+
+    # Shopper with a few items in the cart
+    shopper = app.test_client()
+    for pid in rng.sample(product_ids, min(3, len(product_ids))):
+        shopper.post("/add_to_cart", json={"id": pid})
+
+    admin = app.test_client()
+    with admin.session_transaction() as s:
+        s["is_admin"] = True
+    pages = max(1, min(50, counts["orders"] // 20))
+
+    def add_order_setup():
+        items, total, _ = PricingEngine.line_items(random_cart())
+        return random_user(), items, total
+
+    def checkout_setup():
+        for pid in rng.sample(product_ids, min(3, len(product_ids))):
+            shopper.post("/add_to_cart", json={"id": pid})
+        return random_user()
+
+    return {
+        "build_cart_details": (
+            lambda cart: CartManager.build_cart_details(cart),
+            random_cart,
+        ),
+        "add_order": (
+            lambda args: OrderManager.add_order(*args),
+            add_order_setup,
+        ),
+        "get_by_email": (
+            lambda email: list(OrderManager.get_by_email(email)),
+            lambda: customer_email(rng.choice(customer_ids)),
+        ),
+        "POST /update_cart": (
+            lambda body: expect(shopper.post("/update_cart", json=body), 200),
+            lambda: {"id": rng.choice(product_ids), "action": rng.choice(["increase", "decrease"])},
+        ),
+        "POST /cart/batch (10 ops)": (
+            lambda body: expect(shopper.post("/cart/batch", json=body), 200),
+            lambda: {"operations": [
+                {"op": "update", "id": rng.choice(product_ids), "quantity": rng.randint(1, 5)} for _ in range(10)
+            ]},
+        ),
+        "POST /checkout/details": (
+            lambda user: expect(shopper.post("/checkout/details", data=user), 302),
+            checkout_setup,
+        ),
+        "GET /admin/orders": (
+            lambda page: expect(admin.get(f"/admin/orders?page={page}"), 200),
+            lambda: rng.randint(1, pages),
+        ),
+        "GET /admin/orders?status&sort=total": (
+            lambda page: expect(admin.get(f"/admin/orders?status=shipped&sort=total&page={page}"), 200),
+            lambda: rng.randint(1, max(1, pages // 4)),
+        ),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    scale_args(parser)
+    parser.add_argument("--engine", choices=["json", "sqlite"], default="json")
+    parser.add_argument("--iterations", type=int, default=200, help="timed calls per round")
+    parser.add_argument("--rounds", type=int, default=3, help="rounds per benchmark; the best is reported")
+    parser.add_argument("--only", help="comma-separated benchmark names to run")
+    parser.add_argument("--data-dir", help="seed here, or reuse a directory seeded earlier (it gets written to)")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true", help="store these results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.5, help="allowed growth before a metric fails (0.5 = 50%%)")
+    parser.add_argument("--min-delta-ms", type=float, default=0.05, help="timing changes smaller than this never fail")
+    parser.add_argument("--check", action="store_true", default=bool(os.environ.get("CI")),
+                        help="fail (status 2) when there is no baseline to compare with; default when $CI is set")
+    args = parser.parse_args()
+
+    counts = scale_counts(args)
+    key = f"{args.engine}/{args.scale}"
+    if counts != scale_counts(argparse.Namespace(scale=args.scale, products=None, orders=None, customers=None)):
+        key = f"{args.engine}/p{counts['products']}-o{counts['orders']}-c{counts['customers']}"
+
+    data_dir = args.data_dir or tempfile.mkdtemp(prefix="jam-bench-")
+    try:
+        if not os.path.exists(os.path.join(data_dir, "orders.json")):
+            start = time.perf_counter()
+            seed(data_dir, seed=args.seed, **counts)
+            print(f"Seeded {key} in {time.perf_counter() - start:.1f}s ({data_dir})")
+
+        configure_environment(data_dir, args.engine)
+        app, boot_seconds = boot_app(data_dir, args.engine)
+        print(f"App started in {boot_seconds:.2f}s, max RSS {max_rss_kb() / 1024:.0f} MiB")
+
+        benchmarks = build_benchmarks(app, counts, random.Random(args.seed))
+        if args.only:
+            wanted = {name.strip() for name in args.only.split(",")}
+            benchmarks = {name: b for name, b in benchmarks.items() if name in wanted}
+
+        # Calibrate around the run so a machine-wide slowdown isn't read as a regression
+        calibration = calibrate()
+        results = {}
+        for name, (fn, setup) in benchmarks.items():
+            results[name] = measure(fn, args.iterations, setup=setup, rounds=args.rounds)
+        calibration = (calibration + calibrate()) / 2
+        print()
+        print_table(results)
+        print(f"\nmax RSS {max_rss_kb() / 1024:.0f} MiB, calibration {calibration * 1000:.1f} ms")
+    finally:
+        if not args.data_dir:
+            shutil.rmtree(data_dir, ignore_errors=True)
+
+    if args.save_baseline:
+        save_baseline(args.baseline, key, results, calibration)
+        print(f"Saved baseline {key} to {args.baseline}")
+        return 0
+
+    baseline = load_baseline(args.baseline).get(key)
+    if not baseline:
+        print(f"No baseline for {key} in {args.baseline}; run with --save-baseline to record one.")
+        return 2 if args.check else 0
+    missing = sorted(set(results) - set(baseline["results"]))
+    for name in missing:
+        print(f"No baseline for {name} in {key}; run with --save-baseline to record one.")
+    if missing and args.check:
+        return 2
+    regressions = compare(results, calibration, baseline, args.tolerance, args.min_delta_ms)
+    for name, metric, old, new in regressions:
+        print(f"REGRESSION {name}: {metric} {old} -> {new}")
+    if regressions:
+        return 1
+    print(f"No regressions against {key} baseline (tolerance {args.tolerance:.0%}).")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
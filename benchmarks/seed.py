@@ -0,0 +1,164 @@
+"""
+Synthetic catalog, orders and customers for benchmarks.
+
+    python -m benchmarks.seed --scale 100k --data-dir /tmp/jam-bench
+
+Writes products.json, orders.json and customers.json in the same shape
+the app stores them. Everything is derived from `--seed`, so a given
+scale always produces the same data.
+"""
+import argparse
+import json
+import os
+import random
+from datetime import datetime, timedelta
+
+# orders -> (products, customers)
+SCALES = {
+    "1k": {"products": 100, "orders": 1_000, "customers": 300},
+    "100k": {"products": 2_000, "orders": 100_000, "customers": 20_000},
+    "1m": {"products": 10_000, "orders": 1_000_000, "customers": 200_000},
+}
+
+FRUITS = [
+    "Strawberry", "Raspberry", "Blueberry", "Apricot", "Peach", "Plum", "Cherry", "Fig",
+    "Orange", "Lemon", "Mango", "Quince", "Grape", "Blackberry", "Gooseberry", "Rhubarb",
+]
+KINDS = ["Jam", "Preserve", "Jelly", "Marmalade", "Conserve"]
+STATUSES = ["pending", "shipped", "delivered", "cancelled"]
+FIRST_NAMES = ["Ali", "Sara", "Omar", "Ayesha", "Bilal", "Hina", "Usman", "Zara", "Hamza", "Mariam"]
+LAST_NAMES = ["Khan", "Ahmed", "Malik", "Hussain", "Raza", "Shah", "Iqbal", "Butt"]
+
+START = datetime(2023, 1, 1)
+
+
+def customer_email(cid):
+    return f"customer{cid}@example.com"
+
+
+def make_products(count, rng):
+    products = []
+    for pid in range(1, count + 1):
+        fruit, kind = rng.choice(FRUITS), rng.choice(KINDS)
+        other = rng.choice(FRUITS).lower()
+        products.append({
+            "id": pid,
+            "name": f"{fruit} {kind} No. {pid}",
+            "description": f"Homemade {fruit.lower()} {kind.lower()} with a hint of {other}.",
+            "price": round(rng.uniform(3, 15), 2),
+            "image": f"https://picsum.photos/id/{100 + pid % 50}/200/150",
+            "status": "out-of-stock" if rng.random() < 0.05 else "available",
+        })
+    return products
+
+
+def make_customers(count, rng):
+    customers = []
+    for cid in range(1, count + 1):
+        customers.append({
+            "id": cid,
+            "name": f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}",
+            "email": customer_email(cid),
+            "phone": f"03{rng.randrange(10**8, 10**9)}",
+            "address": f"House {rng.randrange(1, 500)}, Street {rng.randrange(1, 60)}",
+            "orders": [],
+        })
+    return customers
+
+
+def make_order(oid, total_orders, products, customers, rng):
+    customer = customers[rng.randrange(len(customers))]
+    items = []
+    for product in rng.sample(products, min(len(products), rng.randint(1, 4))):
+        quantity = rng.randint(1, 5)
+        items.append({
+            "id": product["id"],
+            "name": product["name"],
+            "description": product["description"],
+            "price": product["price"],
+            "image": product["image"],
+            "quantity": quantity,
+            "subtotal": round(product["price"] * quantity, 2),
+        })
+    # Spread order dates over two years, oldest order first
+    when = START + timedelta(minutes=int(oid * 2 * 365 * 24 * 60 / total_orders))
+    return customer, {
+        "id": oid,
+        "user": {k: customer[k] for k in ("name", "email", "phone", "address")},
+        "items": items,
+        "total": round(sum(i["subtotal"] for i in items), 2),
+        "datetime": when.strftime("%Y-%m-%d %H:%M:%S"),
+        "status": rng.choice(STATUSES),
+    }
+
+
+def _write_array(path, records):
+    """Write a JSON array one record per line, without holding the text in memory."""
+    with open(path, "w") as f:
+        f.write("[\n")
+        for n, record in enumerate(records):
+            if n:
+                f.write(",\n")
+            f.write(json.dumps(record))
+        f.write("\n]\n")
+
+
+def seed(data_dir, products=100, orders=1_000, customers=300, seed=0):
+    """Write a synthetic data set into `data_dir`. Returns the counts written."""
+    os.makedirs(data_dir, exist_ok=True)
+    rng = random.Random(seed)
+    product_list = make_products(products, rng)
+    customer_list = make_customers(customers, rng)
+
+    # Orders are generated oldest first but stored newest first, as the app does
+    order_lines_path = os.path.join(data_dir, ".orders.tmp")
+    offsets = []
+    with open(order_lines_path, "w") as f:
+        for oid in range(1, orders + 1):
+            customer, order = make_order(oid, orders, product_list, customer_list, rng)
+            customer["orders"].append(oid)
+            offsets.append(f.tell())
+            f.write(json.dumps(order) + "\n")
+
+    with open(order_lines_path) as src, open(os.path.join(data_dir, "orders.json"), "w") as out:
+        out.write("[\n")
+        for n, offset in enumerate(reversed(offsets)):
+            src.seek(offset)
+            if n:
+                out.write(",\n")
+            out.write(src.readline().rstrip("\n"))
+        out.write("\n]\n")
+    os.remove(order_lines_path)
+
+    _write_array(os.path.join(data_dir, "products.json"), product_list)
+    _write_array(os.path.join(data_dir, "customers.json"), (c for c in customer_list if c["orders"]))
+    return {"products": products, "orders": orders, "customers": sum(1 for c in customer_list if c["orders"])}
+
+
+def scale_args(parser):
+    parser.add_argument("--scale", choices=sorted(SCALES), default="1k")
+    parser.add_argument("--products", type=int, help="override the scale's product count")
+    parser.add_argument("--orders", type=int, help="override the scale's order count")
+    parser.add_argument("--customers", type=int, help="override the scale's customer count")
+    parser.add_argument("--seed", type=int, default=0)
+
+
+def scale_counts(args):
+    counts = dict(SCALES[args.scale])
+    for name in counts:
+        if getattr(args, name) is not None:
+            counts[name] = getattr(args, name)
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    scale_args(parser)
+    parser.add_argument("--data-dir", required=True)
+    args = parser.parse_args()
+    counts = seed(args.data_dir, seed=args.seed, **scale_counts(args))
+    print(f"Seeded {args.data_dir}: " + ", ".join(f"{n} {name}" for name, n in counts.items()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,29 @@
+"""
+Fingerprint and precompress the files in static/ for production.
+
+    python build_assets.py [--static-dir static]
+
+Writes hashed copies, .gz/.br variants and manifest.json to static/dist/.
+Run it on every deploy, before starting the app; templates pick up the
+new names at startup. Install the brotli package to also get .br files.
+"""
+import argparse
+import os
+
+from utils.assets import DIST, brotli, build
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--static-dir", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "static"))
+    args = parser.parse_args()
+
+    manifest = build(args.static_dir)
+    for name, hashed in sorted(manifest.items()):
+        print(f"{name} -> {DIST}/{hashed}")
+    if brotli is None:
+        print("brotli not installed: wrote .gz variants only")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,9 +3,69 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
 class Config:
     SECRET_KEY = os.getenv("SECRET_KEY")
 
+    # Admin login. Hashing ADMIN_PASSWORD costs a PBKDF2 run per boot; set
+    # ADMIN_PASSWORD_HASH (werkzeug's generate_password_hash output) instead
+    ADMIN_USERNAME = os.getenv("ADMIN_USERNAME")
+    ADMIN_PASSWORD = os.getenv("ADMIN_PASSWORD")
+    ADMIN_PASSWORD_HASH = os.getenv("ADMIN_PASSWORD_HASH")
+
+    # Storage engine for products/orders/customers: "json" or "sqlite"
+    STORAGE_ENGINE = os.getenv("STORAGE_ENGINE", "json")
+    DATA_DIR = os.getenv("DATA_DIR", os.path.join(BASE_DIR, "data"))
+    SQLITE_PATH = os.getenv("SQLITE_PATH", os.path.join(DATA_DIR, "store.db"))
+    # Order journal entries kept before they are compacted into orders.json
+    JOURNAL_COMPACT_THRESHOLD = int(os.getenv("JOURNAL_COMPACT_THRESHOLD", 500))
+
+    # Outgoing email queue
+    OUTBOX_PATH = os.getenv("OUTBOX_PATH", os.path.join(DATA_DIR, "outbox.db"))
+    EMAIL_MAX_ATTEMPTS = int(os.getenv("EMAIL_MAX_ATTEMPTS", 5))
+    EMAIL_RETRY_BASE_SECONDS = int(os.getenv("EMAIL_RETRY_BASE_SECONDS", 30))
+    # Seconds before a stalled SMTP connect/command gives up
+    EMAIL_SMTP_TIMEOUT = float(os.getenv("EMAIL_SMTP_TIMEOUT", 30))
+
+    # Precomputed sales aggregates for the admin dashboard
+    ANALYTICS_DB_PATH = os.getenv("ANALYTICS_DB_PATH", os.path.join(DATA_DIR, "analytics.db"))
+
+    # Uploaded product images and their pre-generated variants
+    IMAGE_DIR = os.getenv("IMAGE_DIR", os.path.join(DATA_DIR, "images"))
+
+    # Per-product stock ledger; checkout holds expire after STOCK_HOLD_SECONDS
+    STOCK_DB_PATH = os.getenv("STOCK_DB_PATH", os.path.join(DATA_DIR, "stock.db"))
+    STOCK_HOLD_SECONDS = int(os.getenv("STOCK_HOLD_SECONDS", 900))
+
+    # Public order tracking: per-email result cache and per-client rate limit
+    TRACKING_CACHE_SIZE = int(os.getenv("TRACKING_CACHE_SIZE", 4096))
+    TRACKING_CACHE_TTL = int(os.getenv("TRACKING_CACHE_TTL", 30))
+    TRACKING_RATE_PER_MINUTE = float(os.getenv("TRACKING_RATE_PER_MINUTE", 30))
+    TRACKING_BURST = int(os.getenv("TRACKING_BURST", 10))
+
+    # Cart storage: "session" (signed cookie) or "server" (LRU + SQLite, cookie holds an id)
+    CART_BACKEND = os.getenv("CART_BACKEND", "session")
+    CART_DB_PATH = os.getenv("CART_DB_PATH", os.path.join(DATA_DIR, "carts.db"))
+    CART_CACHE_SIZE = int(os.getenv("CART_CACHE_SIZE", 10000))
+    CART_CACHE_TTL = int(os.getenv("CART_CACHE_TTL", 1800))
+
+    # Instrumentation: Server-Timing header, /metrics (admin session or
+    # "Authorization: Bearer <METRICS_TOKEN>"), and a directory where each
+    # worker publishes its metrics so /metrics reports the whole server
+    SERVER_TIMING = os.getenv("SERVER_TIMING", "1") == "1"
+    METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+    METRICS_DIR = os.getenv("METRICS_DIR")
+    # Sampling profiler: dump folded stacks for requests slower than this (0 = off)
+    PROFILE_SLOW_REQUEST_MS = int(os.getenv("PROFILE_SLOW_REQUEST_MS", 0))
+    PROFILE_INTERVAL_MS = int(os.getenv("PROFILE_INTERVAL_MS", 5))
+    PROFILE_DIR = os.getenv("PROFILE_DIR", os.path.join(DATA_DIR, "profiles"))
+
+    # Dynamic compression of text responses larger than COMPRESS_MIN_SIZE bytes
+    COMPRESS_MIN_SIZE = int(os.getenv("COMPRESS_MIN_SIZE", 500))
+    COMPRESS_LEVEL = int(os.getenv("COMPRESS_LEVEL", 6))
+    COMPRESS_BROTLI_QUALITY = int(os.getenv("COMPRESS_BROTLI_QUALITY", 4))
+
     # Security cookies
     SESSION_COOKIE_HTTPONLY = True
     SESSION_COOKIE_SAMESITE = "Lax"
@@ -21,3 +81,18 @@ class ProductionConfig(Config):
 
 class DevelopmentConfig(Config):
     DEBUG = True
+
+
+# The config the data stores and process-wide singletons (outbox, stock
+# ledger, analytics, carts, images) are built from. create_app(config)
+# switches it; scripts that never build an app get Config.
+_active = Config
+
+
+def active_config():
+    return _active
+
+
+def use_config(config):
+    global _active
+    _active = config
@@ -0,0 +1,25 @@
+# gunicorn.conf.py -- picked up automatically by `gunicorn` (run from this directory)
+import gc
+import os
+
+wsgi_app = "app:create_app(preload=True)"
+bind = os.getenv("GUNICORN_BIND", "127.0.0.1:8000")
+workers = int(os.getenv("WEB_CONCURRENCY", 4))
+
+# Build the app (and parse every store) once in the master; forked workers
+# share those pages copy-on-write instead of each loading their own copy
+preload_app = True
+
+
+def pre_fork(server, worker):
+    # Move everything loaded so far out of the collector's reach, so the
+    # workers' garbage collections don't write to (and copy) shared pages
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    # Threads don't survive a fork: start this worker's email sender now
+    # rather than on its first request
+    from utils.email_outbox import get_outbox
+
+    get_outbox().ensure_worker()
@@ -0,0 +1,346 @@
+# managers/analytics.py
+import json
+import threading
+import time
+from array import array
+from collections import defaultdict
+from contextlib import contextmanager
+
+from managers.records import json_default
+from managers.sqlite_storage import connect
+
+# Orders in this status don't count towards revenue, units or customer spend
+CANCELLED = "cancelled"
+
+
+def _cents(amount):
+    return int(round(float(amount) * 100))
+
+
+class SalesAnalytics:
+    """
+    Materialized sales aggregates kept in SQLite.
+
+    Revenue per day, orders per status, units and revenue per product and
+    spend per customer are adjusted by each new order and status change,
+    so reading them costs the same however long the order history is.
+    Amounts are stored in integer cents. `rebuild()` recomputes everything
+    from the orders in one pass, e.g. after a crash between an order write
+    and its aggregate update; `start_rebuild()` runs it in the background,
+    one worker process at a time. Orders recorded while a rebuild is
+    counting are also logged to sales_pending and replayed on top of its
+    result, so none are lost when it replaces the tables.
+    """
+
+    # A rebuild claim older than this is assumed to belong to a dead worker
+    REBUILD_TIMEOUT = 3600
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS sales_daily (
+                day TEXT PRIMARY KEY,
+                orders INTEGER NOT NULL DEFAULT 0,
+                revenue_cents INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE TABLE IF NOT EXISTS sales_status (
+                status TEXT PRIMARY KEY,
+                orders INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE TABLE IF NOT EXISTS sales_products (
+                product_id TEXT PRIMARY KEY,
+                name TEXT NOT NULL,
+                units INTEGER NOT NULL DEFAULT 0,
+                revenue_cents INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE TABLE IF NOT EXISTS sales_customers (
+                email TEXT PRIMARY KEY,
+                name TEXT NOT NULL,
+                orders INTEGER NOT NULL DEFAULT 0,
+                revenue_cents INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE TABLE IF NOT EXISTS sales_meta (
+                key TEXT PRIMARY KEY,
+                value TEXT
+            );
+            CREATE TABLE IF NOT EXISTS sales_pending (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                kind TEXT NOT NULL,
+                order_id INTEGER,
+                old_status TEXT,
+                body TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_sales_products_revenue ON sales_products (revenue_cents);
+            CREATE INDEX IF NOT EXISTS idx_sales_customers_revenue ON sales_customers (revenue_cents);
+        """)
+
+    @property
+    def conn(self):
+        return connect(self.db_path)
+
+    @contextmanager
+    def _transaction(self):
+        conn = self.conn
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    # -------------------------
+    # Incremental updates
+    # -------------------------
+    @staticmethod
+    def _contribution(order):
+        """
+        The revenue-side rows one order adds, as
+        (day, cents, {product id: [name, units, cents]}, (email, name)).
+        """
+        products = {}
+        for item in order.get("items", []):
+            entry = products.setdefault(str(item["id"]), [item.get("name", ""), 0, 0])
+            entry[1] += item.get("quantity", 0)
+            entry[2] += _cents(item.get("subtotal", 0))
+        user = order.get("user", {})
+        customer = ((user.get("email") or "").lower(), user.get("name", ""))
+        return order.get("datetime", "")[:10], _cents(order.get("total", 0)), products, customer
+
+    def _apply(self, conn, order, sign):
+        """Add (sign=1) or take away (sign=-1) an order's revenue contribution."""
+        day, cents, products, (email, name) = self._contribution(order)
+        conn.execute(
+            "INSERT INTO sales_daily (day, orders, revenue_cents) VALUES (?, ?, ?) "
+            "ON CONFLICT (day) DO UPDATE SET orders = orders + excluded.orders, "
+            "revenue_cents = revenue_cents + excluded.revenue_cents",
+            (day, sign, sign * cents),
+        )
+        conn.executemany(
+            "INSERT INTO sales_products (product_id, name, units, revenue_cents) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT (product_id) DO UPDATE SET name = excluded.name, "
+            "units = units + excluded.units, revenue_cents = revenue_cents + excluded.revenue_cents",
+            [(pid, pname, sign * units, sign * pcents) for pid, (pname, units, pcents) in products.items()],
+        )
+        conn.execute(
+            "INSERT INTO sales_customers (email, name, orders, revenue_cents) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT (email) DO UPDATE SET name = excluded.name, "
+            "orders = orders + excluded.orders, revenue_cents = revenue_cents + excluded.revenue_cents",
+            (email, name, sign, sign * cents),
+        )
+
+    @staticmethod
+    def _count_status(conn, status, delta):
+        conn.execute(
+            "INSERT INTO sales_status (status, orders) VALUES (?, ?) "
+            "ON CONFLICT (status) DO UPDATE SET orders = orders + excluded.orders",
+            (status, delta),
+        )
+
+    def _add_order(self, conn, order):
+        status = (order.get("status") or "").lower()
+        self._count_status(conn, status, 1)
+        if status != CANCELLED:
+            self._apply(conn, order, 1)
+
+    def _change_status(self, conn, order, old):
+        new = (order.get("status") or "").lower()
+        self._count_status(conn, old, -1)
+        self._count_status(conn, new, 1)
+        if old == CANCELLED:
+            self._apply(conn, order, 1)
+        elif new == CANCELLED:
+            self._apply(conn, order, -1)
+
+    def _log_pending(self, conn, kind, order, old=None):
+        """Keep a change for the running rebuild to replay (no-op when none is running)."""
+        if self.is_rebuilding():
+            conn.execute(
+                "INSERT INTO sales_pending (kind, order_id, old_status, body) VALUES (?, ?, ?, ?)",
+                (kind, order.get("id"), old, json.dumps(order, default=json_default)),
+            )
+
+    def record_order(self, order):
+        """Account for a newly placed order."""
+        with self._transaction() as conn:
+            self._add_order(conn, order)
+            self._log_pending(conn, "new", order)
+
+    def record_status_changes(self, changes):
+        """Account for status changes, given [(order, old status)] with the order already updated."""
+        with self._transaction() as conn:
+            for order, old in changes:
+                old = (old or "").lower()
+                if old == (order.get("status") or "").lower():
+                    continue
+                self._change_status(conn, order, old)
+                self._log_pending(conn, "status", order, old)
+
+    # -------------------------
+    # Rebuild
+    # -------------------------
+    def is_built(self):
+        return self.conn.execute("SELECT 1 FROM sales_meta WHERE key = 'built'").fetchone() is not None
+
+    def is_rebuilding(self):
+        row = self.conn.execute("SELECT value FROM sales_meta WHERE key = 'rebuilding'").fetchone()
+        return row is not None and float(row[0]) > time.time() - self.REBUILD_TIMEOUT
+
+    def start_rebuild(self, orders_fn, only_if_missing=False):
+        """
+        rebuild(orders_fn()) in a background thread, unless the aggregates
+        are already built (with `only_if_missing`) or any worker process
+        is rebuilding them already. Returns the thread, or None.
+        """
+        with self._transaction() as conn:
+            if only_if_missing and self.is_built():
+                return None
+            if self.is_rebuilding():
+                return None
+            # Changes are logged from here on; anything left by a dead rebuild is stale
+            conn.execute("DELETE FROM sales_pending")
+            conn.execute("INSERT OR REPLACE INTO sales_meta (key, value) VALUES ('rebuilding', ?)", (str(time.time()),))
+
+        def run():
+            try:
+                self.rebuild(orders_fn(), only_if_missing=only_if_missing)
+            finally:
+                self.conn.execute("DELETE FROM sales_meta WHERE key = 'rebuilding'")
+
+        thread = threading.Thread(target=run, name="analytics-rebuild", daemon=True)
+        thread.start()
+        return thread
+
+    def rebuild(self, orders, only_if_missing=False):
+        """
+        Recompute every aggregate from an iterable of orders in a single
+        pass. Only the aggregates are held in memory, not the orders (plus
+        a 2-byte status code per order id, to replay pending changes).
+        """
+        daily = defaultdict(lambda: [0, 0])
+        statuses = defaultdict(int)
+        products = {}
+        customers = {}
+        codes = {}
+        seen = array("H")
+        for order in orders:
+            status = (order.get("status") or "").lower()
+            statuses[status] += 1
+            oid = order.get("id")
+            if isinstance(oid, int) and oid >= 0:
+                if oid >= len(seen):
+                    seen.frombytes(bytes(2 * (max(oid + 1, 2 * len(seen)) - len(seen))))
+                seen[oid] = codes.setdefault(status, len(codes) + 1)
+            if status == CANCELLED:
+                continue
+            day, cents, lines, (email, name) = self._contribution(order)
+            daily[day][0] += 1
+            daily[day][1] += cents
+            for pid, (pname, units, pcents) in lines.items():
+                entry = products.setdefault(pid, [pname, 0, 0])
+                entry[0] = pname
+                entry[1] += units
+                entry[2] += pcents
+            entry = customers.setdefault(email, [name, 0, 0])
+            entry[0] = name
+            entry[1] += 1
+            entry[2] += cents
+
+        with self._transaction() as conn:
+            # Another worker may have built it while we were counting
+            if only_if_missing and self.is_built():
+                return
+            for table in ("sales_daily", "sales_status", "sales_products", "sales_customers"):
+                conn.execute(f"DELETE FROM {table}")
+            conn.executemany("INSERT INTO sales_daily VALUES (?, ?, ?)",
+                             [(day, n, cents) for day, (n, cents) in daily.items()])
+            conn.executemany("INSERT INTO sales_status VALUES (?, ?)", list(statuses.items()))
+            conn.executemany("INSERT INTO sales_products VALUES (?, ?, ?, ?)",
+                             [(pid, *entry) for pid, entry in products.items()])
+            conn.executemany("INSERT INTO sales_customers VALUES (?, ?, ?, ?)",
+                             [(email, *entry) for email, entry in customers.items()])
+            self._replay_pending(conn, seen, {code: status for status, code in codes.items()})
+            conn.execute("DELETE FROM sales_meta WHERE key = 'rebuilding'")
+            conn.execute("INSERT OR REPLACE INTO sales_meta (key, value) VALUES ('built', datetime('now'))")
+
+    def _replay_pending(self, conn, seen, statuses):
+        """
+        Apply the changes logged while the orders were being counted, in
+        order, skipping those the counted orders already reflect: a new
+        order that was counted, or a status change whose old status isn't
+        the order's status as counted (or as left by an earlier replay).
+        """
+        replayed = {}
+        rows = conn.execute("SELECT kind, order_id, old_status, body FROM sales_pending ORDER BY seq").fetchall()
+        for kind, oid, old, body in rows:
+            order = json.loads(body)
+            if oid in replayed:
+                current = replayed[oid]
+            else:
+                current = statuses.get(seen[oid]) if isinstance(oid, int) and 0 <= oid < len(seen) else None
+            if kind == "new":
+                if current is None:
+                    self._add_order(conn, order)
+                    replayed[oid] = (order.get("status") or "").lower()
+            elif current == old:
+                self._change_status(conn, order, old)
+                replayed[oid] = (order.get("status") or "").lower()
+        conn.execute("DELETE FROM sales_pending")
+
+    # -------------------------
+    # Reads
+    # -------------------------
+    def revenue_per_day(self, date_from=None, date_to=None):
+        rows = self.conn.execute(
+            "SELECT day, orders, revenue_cents FROM sales_daily "
+            "WHERE day >= ? AND day <= ? ORDER BY day",
+            (date_from or "", date_to or "9999-12-31"),
+        ).fetchall()
+        return [{"day": day, "orders": n, "revenue": cents / 100} for day, n, cents in rows]
+
+    def orders_per_status(self):
+        rows = self.conn.execute("SELECT status, orders FROM sales_status WHERE orders > 0 ORDER BY status")
+        return dict(rows.fetchall())
+
+    def top_products(self, limit=10):
+        rows = self.conn.execute(
+            "SELECT product_id, name, units, revenue_cents FROM sales_products "
+            "WHERE units > 0 ORDER BY revenue_cents DESC LIMIT ?",
+            (limit,),
+        ).fetchall()
+        return [{"id": pid, "name": name, "units": units, "revenue": cents / 100}
+                for pid, name, units, cents in rows]
+
+    def top_customers(self, limit=10):
+        rows = self.conn.execute(
+            "SELECT email, name, orders, revenue_cents FROM sales_customers "
+            "WHERE orders > 0 ORDER BY revenue_cents DESC LIMIT ?",
+            (limit,),
+        ).fetchall()
+        return [{"email": email, "name": name, "orders": n, "revenue": cents / 100}
+                for email, name, n, cents in rows]
+
+    def summary(self):
+        """Totals across all days: orders placed and revenue from orders that weren't cancelled."""
+        (orders,) = self.conn.execute("SELECT COALESCE(SUM(orders), 0) FROM sales_status").fetchone()
+        (cents,) = self.conn.execute("SELECT COALESCE(SUM(revenue_cents), 0) FROM sales_daily").fetchone()
+        return {"orders": orders, "revenue": cents / 100}
+
+
+_analytics = None
+_analytics_config = None
+_analytics_lock = threading.Lock()
+
+
+def get_analytics():
+    """The process-wide aggregate store for the active config."""
+    global _analytics, _analytics_config
+    from config import active_config
+
+    config = active_config()
+    if _analytics_config is not config:
+        with _analytics_lock:
+            if _analytics_config is not config:
+                _analytics = SalesAnalytics(config.ANALYTICS_DB_PATH)
+                _analytics_config = config
+    return _analytics
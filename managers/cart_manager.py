@@ -1,4 +1,7 @@
-import json
+from decimal import Decimal
+
+from managers.cart_store import get_cart_backend
+from managers.pricing import PricingEngine
 from managers.product_manager import ProductManager
 
 class CartManager:
@@ -7,100 +10,235 @@ class CartManager:
     - Adding/removing/updating items
     - Calculating totals
     - Building cart details for templates
+
+    The cart lives in the cookie session or server-side, depending on
+    CART_BACKEND (see managers/cart_store.py).
+
+    Running totals are kept next to the cart ('cart_totals') and adjusted by the
+    delta of each change, stamped with the catalog version they were
+    priced against. If the catalog changed since, reads reprice the cart
+    without writing, and the next change to the cart stores fresh totals.
     """
 
+    @staticmethod
+    def _load(session):
+        """Cart state ('cart' and 'cart_totals') from the configured backend."""
+        return get_cart_backend().load(session)
+
+    @staticmethod
+    def _update(session, change):
+        """
+        Apply change(state) to the cart state and store it. Returns what
+        change() returned. With server-side carts, change() may run again on
+        a fresher copy if another request saved the cart concurrently.
+        """
+        return get_cart_backend().update(session, change)
+
     @staticmethod
     def get_cart(session):
         """Get cart from session, ensure it's a dict"""
-        if 'cart' not in session:
-            session['cart'] = {}
-        return session['cart']
+        state = CartManager._load(session)
+        if 'cart' not in state:
+            state['cart'] = {}
+        return state['cart']
+
+    @staticmethod
+    def available(product_id):
+        """Units of a product that can still be sold, or None if stock isn't tracked."""
+        stock = ProductManager.stock(product_id)
+        return None if stock is None else stock["available"]
+
+    @staticmethod
+    def product_id(value):
+        """The cart key (str id) for a product id from a request, or None if there's no such product."""
+        product_id = str(value)
+        if not product_id.isdigit() or ProductManager.get(int(product_id)) is None:
+            return None
+        return product_id
+
+    @staticmethod
+    def _set_quantity(state, product_id, qty):
+        """
+        Set one line's quantity in `state` (0 removes it) and keep the
+        running totals in step. An increase is capped at the units in
+        stock. Returns the quantity actually set.
+        """
+        cart = state.setdefault('cart', {})
+        old_qty = cart.get(product_id, 0)
+        if qty > old_qty:
+            available = CartManager.available(product_id)
+            if available is not None:
+                qty = max(old_qty, min(qty, available))
+        if qty > 0:
+            cart[product_id] = qty
+        else:
+            qty = 0
+            cart.pop(product_id, None)
+        CartManager._adjust_totals(state, product_id, qty - old_qty)
+        return qty
 
     @staticmethod
     def add_to_cart(session, product_id):
-        """Add a product to the cart or increase quantity by 1"""
-        cart = CartManager.get_cart(session)
-        cart[product_id] = cart.get(product_id, 0) + 1
-        session.modified = True
+        """
+        Add a product to the cart or increase quantity by 1. Returns False
+        (and changes nothing) if that would be more than is in stock.
+        """
+        def change(state):
+            old_qty = state.get('cart', {}).get(product_id, 0)
+            return CartManager._set_quantity(state, product_id, old_qty + 1) != old_qty
+
+        return CartManager._update(session, change)
 
     @staticmethod
     def update_cart(session, product_id, action):
         """Increase or decrease product quantity in cart"""
-        cart = CartManager.get_cart(session)
-        if product_id in cart:
-            if action == 'increase':
-                cart[product_id] += 1
-            elif action == 'decrease':
-                cart[product_id] = max(1, cart[product_id] - 1)
-        else:
+        def change(state):
+            old_qty = state.get('cart', {}).get(product_id, 0)
             if action == 'increase':
-                cart[product_id] = 1
-        session.modified = True
+                CartManager._set_quantity(state, product_id, old_qty + 1)
+            elif action == 'decrease' and old_qty:
+                CartManager._set_quantity(state, product_id, max(1, old_qty - 1))
+
+        CartManager._update(session, change)
 
     @staticmethod
     def remove_item(session, product_id):
         """Remove a product from the cart"""
-        cart = CartManager.get_cart(session)
-        if product_id in cart:
-            cart.pop(product_id)
-            session.modified = True
+        def change(state):
+            if product_id in state.get('cart', {}):
+                CartManager._set_quantity(state, product_id, 0)
+
+        CartManager._update(session, change)
+
+    # -------------------------
+    # Batches
+    # -------------------------
+    MAX_BATCH_OPERATIONS = 100
+    MAX_LINE_QUANTITY = 999
+
+    @staticmethod
+    def _parse_operation(operation):
+        """(op, product id, quantity) from one batch entry; raises ValueError."""
+        if not isinstance(operation, dict):
+            raise ValueError("Each operation must be an object.")
+        op = operation.get("op")
+        if op not in ("add", "update", "remove"):
+            raise ValueError(f"Unknown operation: {op!r}.")
+        if op == "remove":
+            return op, str(operation.get("id")), 0
+        product_id = CartManager.product_id(operation.get("id"))
+        if product_id is None:
+            raise ValueError(f"Unknown product: {operation.get('id')}.")
+        qty = operation.get("quantity", 1 if op == "add" else None)
+        lowest = 1 if op == "add" else 0
+        if type(qty) is not int or not lowest <= qty <= CartManager.MAX_LINE_QUANTITY:
+            raise ValueError(f"Invalid quantity for product {product_id}.")
+        return op, product_id, qty
+
+    @staticmethod
+    def apply_batch(session, operations):
+        """
+        Apply a list of cart operations with one load and one save:
+
+            {"op": "add", "id": 3, "quantity": 2}     # quantity defaults to 1
+            {"op": "update", "id": 3, "quantity": 5}  # 0 removes the line
+            {"op": "remove", "id": 3}
+
+        Every operation is validated first; if any is malformed, ValueError
+        is raised and the cart is left untouched. Increases are capped at
+        the units in stock. Returns {product id: final quantity} for the
+        products the batch touched.
+        """
+        if not isinstance(operations, list) or not operations:
+            raise ValueError("Expected a non-empty list of operations.")
+        if len(operations) > CartManager.MAX_BATCH_OPERATIONS:
+            raise ValueError(f"At most {CartManager.MAX_BATCH_OPERATIONS} operations per batch.")
+        parsed = [CartManager._parse_operation(operation) for operation in operations]
+
+        def change(state):
+            quantities = {}
+            for op, product_id, qty in parsed:
+                if op == "add":
+                    qty += state.get('cart', {}).get(product_id, 0)
+                quantities[product_id] = CartManager._set_quantity(
+                    state, product_id, min(qty, CartManager.MAX_LINE_QUANTITY)
+                )
+            return quantities
+
+        return CartManager._update(session, change)
 
     @staticmethod
     def clear_cart(session):
         """Empty the cart"""
-        session.pop('cart', None)
-        session.modified = True
+        get_cart_backend().clear(session)
+
+    # -------------------------
+    # Totals
+    # -------------------------
+    @staticmethod
+    def _store_totals(state, total, total_qty):
+        state['cart_totals'] = {
+            "amount": str(total),
+            "qty": total_qty,
+            "version": ProductManager.catalog_version()
+        }
+
+    @staticmethod
+    def _adjust_totals(state, product_id, delta):
+        """Apply a quantity change to the running totals without repricing the cart."""
+        if not delta:
+            return
+        totals = state.get('cart_totals')
+        if not totals or totals["version"] != ProductManager.catalog_version():
+            # Stale or missing: the cart is being saved anyway, so reprice it
+            # in full and store totals for later reads
+            CartManager._store_totals(state, *PricingEngine.totals(state.get('cart', {})))
+            return
+        price = PricingEngine.unit_price(product_id)
+        if price is None:
+            return
+        CartManager._store_totals(
+            state,
+            Decimal(totals["amount"]) + price * delta,
+            totals["qty"] + delta
+        )
 
     @staticmethod
     def get_totals(session):
-        """Return total price and total quantity of items in cart"""
-        cart = CartManager.get_cart(session)
-        total = 0
-        total_qty = 0
-        for product in ProductManager.get_all():
-            pid = str(product['id'])
-            if pid in cart:
-                qty = cart[pid]
-                total += product['price'] * qty
-                total_qty += qty
-        return round(total, 2), total_qty
+        """Return total price (Decimal) and total quantity of items in cart"""
+        state = CartManager._load(session)
+        if not state.get('cart'):
+            return Decimal("0.00"), 0
+        totals = state.get('cart_totals')
+        if totals and totals["version"] == ProductManager.catalog_version():
+            return Decimal(totals["amount"]), totals["qty"]
+
+        # Not saved here: a read must not write (and, server-side, bump the
+        # cart's revision); the next change to the cart stores fresh totals
+        return PricingEngine.totals(state.get('cart', {}))
 
     @staticmethod
     def get_total_qty(session):
         """Return total quantity of items in cart"""
-        cart = CartManager.get_cart(session)
-        return sum(cart.values())
+        return CartManager.get_totals(session)[1]
 
     @staticmethod
     def build_cart_details(cart):
         """
         Build a detailed cart product list for templates:
-        Returns: cart_products[], total price, total quantity
+        Returns: cart_products[], total price (Decimal), total quantity
+        """
+        return PricingEngine.line_items(cart)
+
+    @staticmethod
+    def reserve_stock(cart_products):
+        """
+        Hold stock for the priced cart lines at checkout. Returns a hold id
+        for OrderManager.add_order(); raises OutOfStock.
         """
-        cart_products = []
-        total = 0
-        total_qty = 0
-        for product in ProductManager.get_all():
-            pid = str(product['id'])
-            qty = cart.get(pid, 0)
-            if qty > 0:
-                subtotal = round(product['price'] * qty, 2)
-                cart_products.append({
-                    "id": product['id'],
-                    "name": product['name'],
-                    "description": product.get('description', ''),
-                    "price": product['price'],
-                    "image": product.get('image', ''),
-                    "quantity": qty,
-                    "subtotal": subtotal
-                })
-                total += subtotal
-                total_qty += qty
-        total = round(total, 2)
-        return cart_products, total, total_qty
+        return ProductManager.reserve({item["id"]: item["quantity"] for item in cart_products})
 
     @staticmethod
     def load_cart_from_session(session):
         """Initialize cart if not present"""
-        if 'cart' not in session:
-            session['cart'] = {}
+        CartManager.get_cart(session)
@@ -0,0 +1,150 @@
+# managers/cart_store.py
+import json
+import secrets
+import time
+
+from managers.sqlite_storage import connect
+from utils.cache import LRUCache
+
+
+class SessionCartBackend:
+    """Default: the cart lives in Flask's signed cookie session."""
+
+    def load(self, session):
+        return session
+
+    def update(self, session, change):
+        result = change(session)
+        session.modified = True
+        return result
+
+    def clear(self, session):
+        session.pop('cart', None)
+        session.pop('cart_totals', None)
+        session.modified = True
+
+
+class ServerCartBackend:
+    """
+    Carts stored server-side, keyed by an opaque id in the session.
+
+    The cookie only carries `cart_sid` and a revision number, so it stays
+    a few dozen bytes however big the cart is. Carts are cached in an
+    in-process LRU with a TTL and written through to SQLite, which also
+    lets other worker processes and restarts see them. The revision in
+    the session tells a worker when its cached copy is out of date.
+
+    `load()` returns a private copy of the cart. `update()` writes with a
+    compare-and-swap on the stored revision: if another request (a second
+    tab, another worker) saved the cart since it was read, the change is
+    applied again on top of that cart instead of overwriting it.
+    """
+
+    # Clean out abandoned carts every this many writes
+    PURGE_EVERY = 1000
+
+    def __init__(self, db_path, maxsize=10000, ttl=1800, retention_days=30):
+        self.db_path = db_path
+        self.cache = LRUCache(maxsize=maxsize, ttl=ttl)
+        self.retention = retention_days * 86400
+        self._writes = 0
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS carts (
+                sid TEXT PRIMARY KEY,
+                rev INTEGER NOT NULL,
+                data TEXT NOT NULL,
+                updated_at REAL NOT NULL
+            )
+        """)
+
+    @property
+    def conn(self):
+        return connect(self.db_path)
+
+    def _read(self, sid, rev=None):
+        """(revision, JSON text) of a cart: the cached copy if it is at `rev`, else the stored one."""
+        cached = self.cache.get(sid)
+        if cached is not None and cached[0] == rev:
+            return cached
+        row = self.conn.execute("SELECT rev, data FROM carts WHERE sid = ?", (sid,)).fetchone()
+        cached = (row[0], row[1]) if row else (0, "{}")
+        self.cache.set(sid, cached)
+        return cached
+
+    def _store(self, sid, rev, data):
+        """Write a cart read at revision `rev`; False if it has been saved since."""
+        now = time.time()
+        if rev == 0:
+            cursor = self.conn.execute(
+                "INSERT OR IGNORE INTO carts (sid, rev, data, updated_at) VALUES (?, 1, ?, ?)", (sid, data, now)
+            )
+        else:
+            cursor = self.conn.execute(
+                "UPDATE carts SET rev = rev + 1, data = ?, updated_at = ? WHERE sid = ? AND rev = ?",
+                (data, now, sid, rev),
+            )
+        return cursor.rowcount == 1
+
+    def load(self, session):
+        sid = session.get('cart_sid')
+        if not sid:
+            return {}
+        return json.loads(self._read(sid, session.get('cart_rev', 0))[1])
+
+    def update(self, session, change):
+        """
+        Apply change(state) to the cart and store it, unless it changed
+        nothing. Returns what change() returned.
+        """
+        sid = session.get('cart_sid') or secrets.token_urlsafe(18)
+        rev = session.get('cart_rev', 0)
+        while True:
+            rev, text = self._read(sid, rev)
+            state = json.loads(text)
+            result = change(state)
+            data = json.dumps(state)
+            if data == text:
+                return result
+            if self._store(sid, rev, data):
+                break
+            # Saved by another request since we read it: start again from
+            # the stored copy (each lost race means someone else's write won)
+            rev = None
+
+        self.cache.set(sid, (rev + 1, data))
+        session['cart_sid'] = sid
+        session['cart_rev'] = rev + 1
+        self._writes += 1
+        if self._writes % self.PURGE_EVERY == 0:
+            self.conn.execute("DELETE FROM carts WHERE updated_at < ?", (time.time() - self.retention,))
+        return result
+
+    def clear(self, session):
+        sid = session.pop('cart_sid', None)
+        session.pop('cart_rev', None)
+        if sid:
+            self.cache.pop(sid)
+            self.conn.execute("DELETE FROM carts WHERE sid = ?", (sid,))
+
+
+_backend = None
+_backend_config = None
+
+
+def get_cart_backend():
+    """The cart backend selected by CART_BACKEND in the active config."""
+    global _backend, _backend_config
+    from config import active_config
+
+    config = active_config()
+    if _backend_config is not config:
+        if config.CART_BACKEND == "server":
+            _backend = ServerCartBackend(
+                config.CART_DB_PATH,
+                maxsize=config.CART_CACHE_SIZE,
+                ttl=config.CART_CACHE_TTL,
+            )
+        else:
+            _backend = SessionCartBackend()
+        _backend_config = config
+    return _backend
@@ -1,70 +1,107 @@
 # managers/customer_manager.py
-import json
-import os
-
-BASE_DIR = os.path.dirname(os.path.dirname(__file__))
-CUSTOMERS_FILE = os.path.join(BASE_DIR, "data", "customers.json")
+from config import active_config
+from managers.records import Customer
+from managers.storage import open_collection
+from utils.metrics import timed
 
 
 class CustomerManager:
-    customers = []
+    _customers = None
+    # Config the collection was opened with; create_app() with another one reopens it
+    _config = None
+
+    COLLECTION_OPTIONS = {
+        "record_type": Customer,
+        "newest_first": True,
+        "email_of": lambda c: c.get("email", ""),
+        "fields": {
+            "name": lambda c: (c.get("name") or "").lower(),
+            "order_count": lambda c: len(c.get("orders", [])),
+        },
+    }
 
     @classmethod
+    @timed("customers.load")
     def load_customers(cls):
-        """Load customers from JSON file into memory."""
-        if not os.path.exists(CUSTOMERS_FILE):
-            with open(CUSTOMERS_FILE, 'w') as f:
-                json.dump([], f)
-
-        with open(CUSTOMERS_FILE, 'r') as f:
-            cls.customers = json.load(f)
+        """Open the customers collection for the configured storage engine (once per process)."""
+        if cls._customers is not None and cls._config is active_config():
+            cls._customers.sync()
+            return
+        customers = open_collection("customers", **cls.COLLECTION_OPTIONS)
+        customers.load()
+        cls._customers = customers
+        cls._config = active_config()
 
     @classmethod
+    @timed("customers.save")
     def save_customers(cls):
         """Save current customers to JSON file."""
-        with open(CUSTOMERS_FILE, 'w') as f:
-            json.dump(cls.customers, f, indent=4)
+        cls._customers.save()
+
+    @classmethod
+    @timed("customers.sync")
+    def sync(cls):
+        """Reload if another worker process changed the customers."""
+        cls._customers.sync()
 
     @classmethod
     def get_all(cls):
-        return cls.customers
+        return cls._customers.all()
+
+    @classmethod
+    def count(cls):
+        return cls._customers.count()
 
     @classmethod
     def get(cls, cid):
         """Get a single customer by ID"""
-        return next((c for c in cls.customers if str(c["id"]) == str(cid)), None)
+        return cls._customers.get(cid)
+
+    @classmethod
+    def query(cls, email=None, sort=None, descending=True, offset=0, limit=50):
+        """
+        One page of customers for the admin listing, newest first unless
+        sorted by "name" or "order_count". Returns (customers, has_more).
+        """
+        filters = {"email": email} if email else {}
+        sort = sort if sort in ("name", "order_count") else None
+        return cls._customers.query(filters, sort=sort, descending=descending, offset=offset, limit=limit)
+
+    @classmethod
+    def scan(cls, email=None):
+        """Yield every (matching) customer in id order, without building a list."""
+        return cls._customers.scan({"email": email} if email else {}, descending=False)
 
     @classmethod
+    @timed("customers.write")
     def add_or_update_customer(cls, user_data, order_id):
         """
         Add a new customer or update existing one.
         Returns the customer record.
         """
-        existing_customer = next(
-            (c for c in cls.customers if c["email"].lower() == user_data["email"].lower()), None
-        )
+        with cls._customers.transaction():
+            existing_customer = cls.get_by_email(user_data["email"])
 
-        if existing_customer:
-            # Append new order ID
-            existing_customer["orders"].append(order_id)
-        else:
-            # Create new customer
-            next_id = (cls.customers[0]["id"] + 1) if cls.customers else 1
-            new_customer = {
-                "id": next_id,
-                "name": user_data["name"],
-                "email": user_data["email"],
-                "phone": user_data["phone"],
-                "address": user_data["address"],
-                "orders": [order_id]
-            }
-            cls.customers.insert(0, new_customer)
-            existing_customer = new_customer
+            if existing_customer:
+                # Append new order ID
+                cls._customers.update(existing_customer, orders=existing_customer["orders"] + [order_id])
+            else:
+                # Create new customer
+                new_customer = Customer(
+                    id=cls._customers.next_id(),
+                    name=user_data["name"],
+                    email=user_data["email"],
+                    phone=user_data["phone"],
+                    address=user_data["address"],
+                    orders=[order_id]
+                )
+                cls._customers.insert(new_customer)
+                existing_customer = new_customer
 
-        cls.save_customers()
         return existing_customer
 
     @classmethod
     def get_by_email(cls, email):
         """Get a customer by email."""
-        return next((c for c in cls.customers if c["email"].lower() == email.lower()), None)
+        matches = cls._customers.find_by_email(email)
+        return matches[0] if matches else None
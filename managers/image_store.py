@@ -0,0 +1,160 @@
+# managers/image_store.py
+import hashlib
+import io
+import json
+import os
+import re
+import shutil
+import threading
+
+from PIL import Image, ImageOps
+
+
+class InvalidImage(ValueError):
+    """The upload isn't an image we accept."""
+
+
+# Leading bytes -> (format, file extension)
+SIGNATURES = (
+    (b"\xff\xd8\xff", ("jpeg", "jpg")),
+    (b"\x89PNG\r\n\x1a\n", ("png", "png")),
+    (b"GIF87a", ("gif", "gif")),
+    (b"GIF89a", ("gif", "gif")),
+)
+KEY_PATTERN = re.compile(r"^[0-9a-f]{20}$")
+VARIANT_PATTERN = re.compile(r"^(original|\d+)\.(jpg|png|gif|webp)$")
+
+
+def _sniff(data):
+    for signature, kind in SIGNATURES:
+        if data.startswith(signature):
+            return kind
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "webp", "webp"
+    return None
+
+
+class ImageStore:
+    """
+    Uploaded product images on local disk.
+
+    Each upload goes in a directory named after the hash of its bytes:
+    the original, plus every width in WIDTHS (up to the original's) in a
+    JPEG or PNG fallback and in WebP, all generated once at upload time.
+    A changed image gets a new directory, so the files never change and
+    can be cached for good. `save()` returns the metadata kept on the
+    product as "images", which templates turn into srcset lists.
+    """
+
+    WIDTHS = (160, 320, 640, 1024)
+    MAX_BYTES = 8 * 1024 * 1024
+    MAX_PIXELS = 40_000_000
+    JPEG_QUALITY = 82
+    WEBP_QUALITY = 80
+
+    def __init__(self, root):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def path(self, key, filename):
+        """File path for a stored variant, or None if the key or name is malformed."""
+        if not KEY_PATTERN.match(key) or not VARIANT_PATTERN.match(filename):
+            return None
+        return os.path.join(self.root, key, filename)
+
+    def save(self, data):
+        """Store an upload (bytes) and its variants. Raises InvalidImage."""
+        if len(data) > self.MAX_BYTES:
+            raise InvalidImage(f"Images can be at most {self.MAX_BYTES // (1024 * 1024)} MB.")
+        kind = _sniff(data)
+        if kind is None:
+            raise InvalidImage("Upload a JPEG, PNG, GIF or WebP image.")
+
+        key = hashlib.sha256(data).hexdigest()[:20]
+        directory = os.path.join(self.root, key)
+        meta_path = os.path.join(directory, "meta.json")
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                return json.load(f)
+
+        tmp_dir = f"{directory}.tmp-{os.getpid()}-{threading.get_ident()}"
+        os.makedirs(tmp_dir, exist_ok=True)
+        try:
+            original = f"original.{kind[1]}"
+            with open(os.path.join(tmp_dir, original), "wb") as f:
+                f.write(data)
+            meta = {"key": key, "original": original, **self._variants(data, tmp_dir)}
+            with open(os.path.join(tmp_dir, "meta.json"), "w") as f:
+                json.dump(meta, f)
+
+            # Publish the finished directory in one step; a concurrent upload
+            # of the same file may have won the race, which is just as good
+            try:
+                os.rename(tmp_dir, directory)
+            except OSError:
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+        except BaseException:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+        return meta
+
+    def _variants(self, data, directory):
+        try:
+            image = Image.open(io.BytesIO(data))
+            if image.width * image.height > self.MAX_PIXELS:
+                raise InvalidImage("That image has too many pixels.")
+            image = ImageOps.exif_transpose(image)
+            image.load()
+        except InvalidImage:
+            raise
+        except Exception as e:
+            raise InvalidImage("That file couldn't be read as an image.") from e
+
+        has_alpha = image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info)
+        image = image.convert("RGBA" if has_alpha else "RGB")
+        fallback = "png" if has_alpha else "jpg"
+        widths = sorted({min(w, image.width) for w in self.WIDTHS})
+        for width in widths:
+            height = max(1, round(image.height * width / image.width))
+            resized = image if width == image.width else image.resize((width, height), Image.LANCZOS)
+            if fallback == "jpg":
+                resized.save(os.path.join(directory, f"{width}.jpg"), "JPEG",
+                             quality=self.JPEG_QUALITY, optimize=True, progressive=True)
+            else:
+                resized.save(os.path.join(directory, f"{width}.png"), "PNG", optimize=True)
+            resized.save(os.path.join(directory, f"{width}.webp"), "WEBP", quality=self.WEBP_QUALITY, method=6)
+        largest = widths[-1]
+        return {
+            "fallback": fallback,
+            "widths": widths,
+            "width": largest,
+            "height": max(1, round(image.height * largest / image.width)),
+        }
+
+
+def variant_name(images, width=None, webp=False):
+    """File name of one variant from a product's "images" metadata (the original if none fit)."""
+    widths = images.get("widths") or []
+    if not widths:
+        return images["original"]
+    chosen = widths[-1] if width is None else next((w for w in widths if w >= width), widths[-1])
+    return f"{chosen}.{'webp' if webp else images['fallback']}"
+
+
+_store = None
+_store_config = None
+_store_lock = threading.Lock()
+
+
+def get_image_store():
+    """The process-wide image store for the active config."""
+    global _store, _store_config
+    from config import active_config
+
+    config = active_config()
+    if _store_config is not config:
+        with _store_lock:
+            if _store_config is not config:
+                _store = ImageStore(config.IMAGE_DIR)
+                _store_config = config
+    return _store
@@ -0,0 +1,525 @@
+# managers/lazy_storage.py
+import json
+import os
+import tempfile
+from array import array
+from bisect import bisect_left, bisect_right
+from heapq import merge
+from itertools import islice
+
+from managers.records import json_default
+from managers.storage import JournalStore, JsonCollection, _split_filters
+from utils.cache import LRUCache
+
+
+def iter_array_spans(f, chunk_size=1 << 20):
+    """
+    Yield (offset, length, element) for each element of the top-level JSON
+    array in the binary file `f`, reading it in chunks rather than whole.
+    """
+    decoder = json.JSONDecoder()
+    # Decoded as latin-1 so character positions are byte offsets; elements
+    # holding non-ASCII text are re-decoded as UTF-8 below.
+    buf, base, pos = "", 0, 0
+    started = eof = False
+
+    def refill():
+        nonlocal buf, base, pos, eof
+        chunk = f.read(chunk_size)
+        eof = not chunk
+        buf = buf[pos:] + chunk.decode("latin-1")
+        base += pos
+        pos = 0
+
+    while True:
+        while True:
+            while pos < len(buf) and buf[pos] in " \t\r\n,":
+                pos += 1
+            if pos < len(buf) or eof:
+                break
+            refill()
+        if pos >= len(buf):
+            return
+        if not started:
+            if buf[pos] != "[":
+                raise ValueError(f"{getattr(f, 'name', 'snapshot')} is not a JSON array")
+            started = True
+            pos += 1
+            continue
+        if buf[pos] == "]":
+            return
+        try:
+            element, end = decoder.raw_decode(buf, pos)
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            refill()
+            continue
+        text = buf[pos:end]
+        if not text.isascii():
+            element = json.loads(text.encode("latin-1").decode("utf-8"))
+        yield base + pos, end - pos, element
+        pos = end
+
+
+class SnapshotIndex:
+    """
+    What is kept in memory for a snapshot whose bodies stay on disk: per
+    record its id, byte span in the file, email and queryable field keys,
+    plus positions pre-sorted by id, email and each field. Everything is
+    held in flat arrays (strings as codes into sorted tables), so a million
+    orders take tens of MB and load from the sidecar file in milliseconds.
+    """
+
+    FORMAT = 1
+
+    def __init__(self, ids, offsets, lengths, emails, email_codes, fields, orders, file=None):
+        self.ids = ids
+        self.offsets = offsets
+        self.lengths = lengths
+        # Sorted unique lower-cased emails; email_codes[pos] indexes into it
+        self.emails = emails
+        self.email_codes = email_codes
+        # name -> (sorted table of str values, codes) or (None, float values)
+        self.fields = fields
+        # "id", "email" and each field name -> positions sorted by that key, then id
+        self.orders = orders
+        self.file = file
+        self.max_id = max(ids) if ids else 0
+
+    def __len__(self):
+        return len(self.ids)
+
+    # -------------------------
+    # Building
+    # -------------------------
+    @classmethod
+    def from_entries(cls, entries, email_of, fields):
+        """Build from (offset, length, record) triples, e.g. while writing or scanning a snapshot."""
+        ids, offsets, lengths = array("q"), array("q"), array("i")
+        raw_emails = []
+        raw_values = {name: [] for name in fields}
+        for offset, length, record in entries:
+            ids.append(record["id"])
+            offsets.append(offset)
+            lengths.append(length)
+            raw_emails.append((email_of(record) or "").lower() if email_of else "")
+            for name, key_of in fields.items():
+                raw_values[name].append(key_of(record))
+
+        emails, email_codes = cls._encode(raw_emails)
+        encoded = {}
+        for name, values in raw_values.items():
+            if all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in values):
+                encoded[name] = (None, array("d", values))
+            else:
+                encoded[name] = cls._encode([v if isinstance(v, str) else str(v) for v in values])
+
+        index = cls(ids, offsets, lengths, emails, email_codes, encoded, {})
+        positions = range(len(ids))
+        index.orders["id"] = array("i", sorted(positions, key=ids.__getitem__))
+        index.orders["email"] = array("i", sorted(positions, key=lambda p: (email_codes[p], ids[p])))
+        for name, (_, keys) in encoded.items():
+            index.orders[name] = array("i", sorted(positions, key=lambda p: (keys[p], ids[p])))
+        return index
+
+    @staticmethod
+    def _encode(values):
+        table = sorted(set(values))
+        code_of = {value: code for code, value in enumerate(table)}
+        return table, array("i", (code_of[v] for v in values))
+
+    # -------------------------
+    # Sidecar file
+    # -------------------------
+    def _arrays(self):
+        yield "ids", self.ids
+        yield "offsets", self.offsets
+        yield "lengths", self.lengths
+        yield "email_codes", self.email_codes
+        for name, (_, keys) in self.fields.items():
+            yield f"field:{name}", keys
+        for name, positions in self.orders.items():
+            yield f"order:{name}", positions
+
+    def write(self, path, signature):
+        """Atomically write the index, tagged with the snapshot file signature it describes."""
+        arrays = list(self._arrays())
+        header = {
+            "format": self.FORMAT,
+            "signature": list(signature),
+            "emails": self.emails,
+            "tables": {name: table for name, (table, _) in self.fields.items()},
+            "arrays": [[name, a.typecode, len(a)] for name, a in arrays],
+        }
+        directory = os.path.dirname(os.path.abspath(path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-", suffix=".idx")
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(json.dumps(header).encode() + b"\n")
+                for _, a in arrays:
+                    a.tofile(f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    @classmethod
+    def read(cls, path, signature, field_names):
+        """The index stored at `path` if it describes `signature`, else None."""
+        try:
+            with open(path, 'rb') as f:
+                header = json.loads(f.readline())
+                if (header.get("format") != cls.FORMAT or header.get("signature") != list(signature)
+                        or sorted(header["tables"]) != sorted(field_names)):
+                    return None
+                arrays = {}
+                for name, typecode, count in header["arrays"]:
+                    a = array(typecode)
+                    a.fromfile(f, count)
+                    arrays[name] = a
+        except (OSError, ValueError, EOFError, KeyError):
+            return None
+
+        fields = {name: (header["tables"][name], arrays[f"field:{name}"]) for name in field_names}
+        orders = {name[len("order:"):]: a for name, a in arrays.items() if name.startswith("order:")}
+        return cls(arrays["ids"], arrays["offsets"], arrays["lengths"], header["emails"],
+                   arrays["email_codes"], fields, orders)
+
+    # -------------------------
+    # Lookups
+    # -------------------------
+    def body(self, pos):
+        """Read and parse one record from the snapshot file."""
+        return json.loads(os.pread(self.file.fileno(), self.lengths[pos], self.offsets[pos]))
+
+    def position(self, rid):
+        order = self.orders["id"]
+        i = bisect_left(order, rid, key=self.ids.__getitem__)
+        if i < len(order) and self.ids[order[i]] == rid:
+            return order[i]
+        return None
+
+    def email_positions(self, email):
+        i = bisect_left(self.emails, email)
+        if i == len(self.emails) or self.emails[i] != email:
+            return []
+        order = self.orders["email"]
+        codes = self.email_codes
+        start = bisect_left(order, i, key=codes.__getitem__)
+        end = bisect_right(order, i, key=codes.__getitem__)
+        return order[start:end]
+
+    def value(self, name, pos):
+        table, keys = self.fields[name]
+        return keys[pos] if table is None else table[keys[pos]]
+
+    def span(self, name, low, high):
+        """Slice bounds into orders[name] of the positions whose key is within [low, high]."""
+        order = self.orders[name]
+        if name == "id":
+            key = self.ids.__getitem__
+        else:
+            key = lambda p: self.value(name, p)
+        start = bisect_left(order, low, key=key) if low is not None else 0
+        end = bisect_right(order, high, key=key) if high is not None else len(order)
+        return start, max(start, end)
+
+
+class LazyJournalStore(JournalStore):
+    """
+    JournalStore whose snapshot is written one record per line, with a
+    SnapshotIndex sidecar (`<path>.idx`) describing it. `load()` returns the
+    index instead of the parsed snapshot. Without a matching sidecar (e.g.
+    an older or hand-edited orders.json) the snapshot is scanned once,
+    incrementally, and the sidecar written for the next start.
+    """
+
+    def __init__(self, path, journal_path, email_of=None, fields=None):
+        super().__init__(path, journal_path)
+        self.index_path = path + ".idx"
+        self.email_of = email_of
+        self.fields = fields or {}
+
+    @staticmethod
+    def _fd_signature(f):
+        st = os.fstat(f.fileno())
+        return (st.st_ino, st.st_size, st.st_mtime_ns)
+
+    def _empty_index(self):
+        return SnapshotIndex.from_entries([], self.email_of, self.fields)
+
+    def _read_snapshot(self):
+        try:
+            f = open(self.path, 'rb')
+        except FileNotFoundError:
+            return self._empty_index()
+        signature = self._fd_signature(f)
+        index = SnapshotIndex.read(self.index_path, signature, list(self.fields))
+        if index is None:
+            index = SnapshotIndex.from_entries(iter_array_spans(f), self.email_of, self.fields)
+            index.write(self.index_path, signature)
+        # Bodies are read through this handle, so they stay valid after
+        # the file is replaced by a compaction, until we reload.
+        index.file = f
+        return index
+
+    def _write_temp(self, data):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-", suffix=".json")
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                def written():
+                    f.write(b"[\n")
+                    for n, record in enumerate(data):
+                        if n:
+                            f.write(b",\n")
+                        line = json.dumps(record, default=json_default).encode()
+                        yield f.tell(), len(line), record
+                        f.write(line)
+                    f.write(b"\n]\n")
+
+                # Indexed as it is written, without holding the records
+                index = SnapshotIndex.from_entries(written(), self.email_of, self.fields)
+                f.flush()
+                os.fsync(f.fileno())
+                signature = self._fd_signature(f)
+            # The rename keeps inode, size and mtime, so the sidecar matches
+            # the snapshot once it is in place.
+            index.write(self.index_path, signature)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+        return tmp_path
+
+
+class _LazyState:
+    """A snapshot index plus the records changed since it was written."""
+
+    def __init__(self, index, cache_size):
+        self.index = index
+        # id -> current record, for records created or changed since the snapshot
+        self.overlay = {}
+        # snapshot ids whose snapshot body is out of date (changed or deleted)
+        self.shadowed = set()
+        self.bodies = LRUCache(maxsize=cache_size)
+
+
+class LazyJsonCollection(JsonCollection):
+    """
+    Journaled collection that keeps only a SnapshotIndex in memory and
+    reads record bodies from the snapshot file when they are asked for.
+
+    Records created or changed since the last compaction (at most
+    `compact_threshold` journal entries) are held in full in an overlay.
+    Recently read bodies are kept in a small LRU. Compaction writes a
+    fresh snapshot and index and swaps them in, emptying the overlay.
+    """
+
+    BODY_CACHE_SIZE = 4096
+
+    def __init__(self, path, journal_path, newest_first=False, email_of=None,
+                 fields=None, compact_threshold=500, record_type=None):
+        super().__init__(path, journal_path, newest_first=newest_first, email_of=email_of,
+                         fields=fields, compact_threshold=compact_threshold, record_type=record_type)
+        self.store = LazyJournalStore(path, journal_path, email_of=email_of, fields=self.fields)
+        self.state = _LazyState(self.store._empty_index(), self.BODY_CACHE_SIZE)
+
+    # -------------------------
+    # Load and Sync
+    # -------------------------
+    def load(self):
+        index, entries = self.store.load()
+        state = _LazyState(index, self.BODY_CACHE_SIZE)
+        for entry in entries:
+            self._apply(entry, state)
+        # Swap in one assignment so concurrent readers see old or new, never half.
+        self.state = state
+
+    def save(self):
+        with self.store.lock():
+            self.sync()
+            self.store.save(self._iter_records(self.state, self.newest_first))
+            self.load()
+
+    def compact(self):
+        """Fold the journal into a fresh snapshot and index, then switch to them."""
+        try:
+            with self.store.lock():
+                self.sync()
+                state = self.state
+                done = self.store.compact(lambda: self._frozen_records(state))
+            if done:
+                with self.store.lock():
+                    self.load()
+        finally:
+            self._compacting = False
+
+    def _frozen_records(self, state):
+        """Records as of now, for serializing outside the lock while writers carry on."""
+        frozen = _LazyState(state.index, 0)
+        frozen.overlay = dict(state.overlay)
+        frozen.shadowed = set(state.shadowed)
+        return self._iter_records(frozen, self.newest_first)
+
+    # -------------------------
+    # Queries
+    # -------------------------
+    def all(self):
+        return _LazyRecords(self, self.state)
+
+    def get(self, rid, state=None):
+        state = state or self.state
+        rid = self._id_key(rid)
+        if rid is None:
+            return None
+        record = state.overlay.get(rid)
+        if record is not None or rid in state.shadowed:
+            return record
+        record = state.bodies.get(rid)
+        if record is None:
+            pos = state.index.position(rid)
+            if pos is None:
+                return None
+            record = self._wrap(state.index.body(pos))
+            state.bodies.set(rid, record)
+        return record
+
+    def find_by_email(self, email):
+        state = self.state
+        key = email.lower()
+        ids = [state.index.ids[p] for p in state.index.email_positions(key)]
+        records = [self.get(rid, state) for rid in ids if rid not in state.shadowed]
+        records += [r for r in state.overlay.values() if self._email_key(r) == key]
+        records.sort(key=lambda r: r["id"], reverse=self.newest_first)
+        return records
+
+    def query(self, filters=None, sort=None, descending=True, offset=0, limit=50):
+        """
+        Same contract as JsonCollection.query. Filtering, ordering and
+        skipping run on the in-memory keys; only the returned page of
+        bodies is read from disk.
+        """
+        email, ranges = _split_filters(filters)
+        if email is not None:
+            return super().query(filters, sort, descending, offset, limit)
+        state = self.state
+        page = list(islice(self._stream(state, sort, descending, ranges), offset, offset + limit + 1))
+        return [self._materialize(state, e) for e in page[:limit]], len(page) > limit
+
+    def scan(self, filters=None, sort=None, descending=True, chunk_size=500):
+        email, ranges = _split_filters(filters)
+        if email is not None:
+            yield from super().scan(filters, sort, descending, chunk_size)
+            return
+        state = self.state
+        for entry in self._stream(state, sort, descending, ranges):
+            yield self._materialize(state, entry)
+
+    def next_id(self):
+        state = self.state
+        return max(state.index.max_id, max(state.overlay, default=0)) + 1
+
+    def _iter_records(self, state, descending):
+        return (self._materialize(state, e) for e in self._stream(state, None, descending, {}))
+
+    def _materialize(self, state, entry):
+        _, rid, source = entry
+        # Snapshot entries carry their position, overlay entries the record
+        return self.get(rid, state) if isinstance(source, int) else source
+
+    def _stream(self, state, sort, descending, ranges):
+        """
+        Yield (key, id, snapshot position or record) in (key, id) order,
+        merging the snapshot index with the overlay and applying `ranges`.
+        """
+        index = state.index
+        name = sort or "id"
+        low, high = ranges.get(sort, (None, None)) if sort else (None, None)
+        rest = {n: bounds for n, bounds in ranges.items() if n != sort}
+        key_of = self.fields[sort] if sort else (lambda r: r["id"])
+
+        def snapshot():
+            start, end = index.span(name, low, high)
+            order = index.orders[name]
+            positions = range(end - 1, start - 1, -1) if descending else range(start, end)
+            for i in positions:
+                pos = order[i]
+                rid = index.ids[pos]
+                if rid in state.shadowed:
+                    continue
+                if rest and not all(_within(index.value(n, pos), b) for n, b in rest.items()):
+                    continue
+                yield (index.value(sort, pos) if sort else rid), rid, pos
+
+        overlay = [
+            (key_of(r), r["id"], r) for r in list(state.overlay.values())
+            if _within(key_of(r), (low, high)) and self._matches(r, rest)
+        ]
+        overlay.sort(key=lambda e: e[:2], reverse=descending)
+        return merge(snapshot(), overlay, key=lambda e: e[:2], reverse=descending)
+
+    # -------------------------
+    # Mutations
+    # -------------------------
+    def _apply(self, entry, state=None):
+        """Apply one journal entry to the overlay. Replays are idempotent."""
+        state = state or self.state
+        op = entry["op"]
+        if op == "create":
+            record = self._wrap(entry["record"])
+            if self.get(record["id"], state) is None:
+                state.overlay[record["id"]] = record
+        elif op == "update":
+            self._update_record(self.get(entry["id"], state), entry["fields"], state)
+        elif op == "update_many":
+            for rid in entry["ids"]:
+                self._update_record(self.get(rid, state), entry["fields"], state)
+        elif op == "delete":
+            rid = self._id_key(entry["id"])
+            state.overlay.pop(rid, None)
+            if state.index.position(rid) is not None:
+                state.shadowed.add(rid)
+
+    def _update_record(self, record, fields, state=None):
+        if record is None:
+            return
+        state = state or self.state
+        record.update(fields)
+        state.overlay[record["id"]] = record
+        if state.index.position(record["id"]) is not None:
+            state.shadowed.add(record["id"])
+        state.bodies.pop(record["id"])
+
+
+def _within(value, bounds):
+    low, high = bounds
+    return (low is None or value >= low) and (high is None or value <= high)
+
+
+class _LazyRecords:
+    """all(): every record in list order, read from disk as it is iterated."""
+
+    def __init__(self, collection, state):
+        self.collection = collection
+        self.state = state
+
+    def __len__(self):
+        state = self.state
+        in_snapshot = len(state.index) - len(state.shadowed)
+        return in_snapshot + len(state.overlay)
+
+    def __iter__(self):
+        return self.collection._iter_records(self.state, self.collection.newest_first)
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            return list(islice(iter(self), item.start, item.stop, item.step))
+        if item < 0:
+            item += len(self)
+        for record in islice(iter(self), item, None):
+            return record
+        raise IndexError(item)
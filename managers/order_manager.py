@@ -1,59 +1,221 @@
 # managers/order_manager.py
-import json
-import os
 from datetime import datetime
 
-BASE_DIR = os.path.dirname(os.path.dirname(__file__))
-ORDERS_FILE = os.path.join(BASE_DIR, "data", "orders.json")
+from config import active_config
+from managers.analytics import get_analytics
+from managers.product_manager import ProductManager
+from managers.records import Order
+from managers.storage import open_collection
+from utils.metrics import timed
 
 
 class OrderManager:
-    orders = []
+    # JSON engine: orders.json snapshot + append-only orders.journal.jsonl
+    _orders = None
+    # Config the collection was opened with; create_app() with another one reopens it
+    _config = None
+    # Callbacks run after orders are added or updated in this process:
+    # fn(event, orders, previous_version)
+    _listeners = []
 
+    # Indexed so the admin listing can filter and sort without a full scan
+    COLLECTION_OPTIONS = {
+        "record_type": Order,
+        "newest_first": True,
+        "email_of": lambda o: o.get("user", {}).get("email", ""),
+        "fields": {
+            "status": lambda o: (o.get("status") or "").lower(),
+            "datetime": lambda o: o.get("datetime", ""),
+            "total": lambda o: o.get("total", 0),
+        },
+    }
+
+    # -------------------------
+    # Load and Save
+    # -------------------------
     @classmethod
+    @timed("orders.load")
     def load_orders(cls):
-        """Load orders from JSON file into memory."""
-        if not os.path.exists(ORDERS_FILE):
-            with open(ORDERS_FILE, 'w') as f:
-                json.dump([], f)
-
-        with open(ORDERS_FILE, 'r') as f:
-            cls.orders = json.load(f)
+        """
+        Open the orders collection for the configured storage engine, once
+        per process; later calls only sync. With the JSON engine only an
+        index of the orders is kept in memory.
+        """
+        if cls._orders is not None and cls._config is active_config():
+            cls._orders.sync()
+            return
+        orders = open_collection("orders", journaled=True, lazy=True, **cls.COLLECTION_OPTIONS)
+        orders.load()
+        cls._orders = orders
+        cls._config = active_config()
 
     @classmethod
+    @timed("orders.save")
     def save_orders(cls):
-        """Save current orders to JSON file."""
-        with open(ORDERS_FILE, 'w') as f:
-            json.dump(cls.orders, f, indent=4)
-
-    @classmethod
-    def add_order(cls, user_data, items, total):
-        """Add a new order and return it."""
-        next_id = (cls.orders[0]["id"] + 1) if cls.orders else 1
-
-        order = {
-            "id": next_id,
-            "user": user_data,
-            "items": items,
-            "total": round(total, 2),
-            "datetime": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-            "status": "Pending"
-        }
-
-        cls.orders.insert(0, order)
-        cls.save_orders()
+        """Write a full snapshot of the current orders."""
+        cls._orders.save()
+
+    @classmethod
+    @timed("orders.sync")
+    def sync(cls):
+        """Pick up orders written by other worker processes."""
+        cls._orders.sync()
+
+    @classmethod
+    def subscribe(cls, callback):
+        """
+        Register fn(event, orders, previous_version), called after "add" and
+        "update" with the list of orders written. `previous_version` is the
+        collection version the write was applied on top of.
+        """
+        cls._listeners.append(callback)
+
+    @classmethod
+    def _notify(cls, event, orders, previous_version):
+        for callback in cls._listeners:
+            callback(event, orders, previous_version)
+
+    @classmethod
+    def version(cls):
+        """Changes whenever any order is added or updated (in any worker)."""
+        return cls._orders.version
+
+    @classmethod
+    @timed("orders.compact")
+    def compact(cls):
+        """Fold the order journal into a fresh snapshot (JSON engine only)."""
+        if hasattr(cls._orders, "compact"):
+            cls._orders.compact()
+
+    # -------------------------
+    # Orders
+    # -------------------------
+    @classmethod
+    @timed("orders.add")
+    def add_order(cls, user_data, items, total, reservation=None):
+        """
+        Add a new order and return it. `reservation` is a stock hold from
+        ProductManager.reserve(), sold before the order is stored: if it
+        expired and the units are gone, OutOfStock is raised and no order
+        is written. If storing the order fails the units are put back.
+        """
+        if reservation is not None:
+            try:
+                ProductManager.commit_reservation(reservation)
+            except BaseException:
+                ProductManager.release_reservation(reservation)
+                raise
+        try:
+            with cls._orders.transaction():
+                previous = cls.version()
+                order = Order(
+                    id=cls._orders.next_id(),
+                    user=user_data,
+                    items=items,
+                    total=round(float(total), 2),
+                    datetime=datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                    status="Pending"
+                )
+                cls._orders.insert(order)
+        except BaseException:
+            if reservation is not None:
+                ProductManager.restock({item["id"]: item["quantity"] for item in items})
+            raise
+        get_analytics().record_order(order)
+        cls._notify("add", [order], previous)
         return order
 
+    @classmethod
+    @timed("orders.update")
+    def update_status(cls, oid, status):
+        """Change an order's status. Returns the order, or None if it doesn't exist."""
+        with cls._orders.transaction():
+            previous = cls.version()
+            order = cls._orders.get(oid)
+            if not order:
+                return None
+            old_status = order["status"]
+            cls._orders.update(order, status=status)
+        get_analytics().record_status_changes([(order, old_status)])
+        cls._notify("update", [order], previous)
+        return order
+
+    @classmethod
+    @timed("orders.update")
+    def update_status_many(cls, oids, status):
+        """Change the status of several orders in one write. Returns the updated orders."""
+        with cls._orders.transaction():
+            previous = cls.version()
+            orders = cls._orders.get_many(oids)
+            old_statuses = [o["status"] for o in orders]
+            if orders:
+                cls._orders.update_many(orders, status=status)
+        get_analytics().record_status_changes(zip(orders, old_statuses))
+        if orders:
+            cls._notify("update", orders, previous)
+        return orders
+
+    @classmethod
+    def rebuild_analytics(cls, only_if_missing=False, wait=False):
+        """
+        Recompute the dashboard aggregates from every order, in the
+        background unless `wait`. Returns False if that isn't needed
+        (`only_if_missing`) or another rebuild is already running.
+        """
+        thread = get_analytics().start_rebuild(cls._orders.all, only_if_missing=only_if_missing)
+        if thread is not None and wait:
+            thread.join()
+        return thread is not None
+
     @classmethod
     def get_all(cls):
-        return cls.orders
+        return cls._orders.all()
+
+    @classmethod
+    def count(cls):
+        return cls._orders.count()
 
     @classmethod
     def get_by_email(cls, email):
-        return [o for o in cls.orders if o.get("user", {}).get("email", "").lower() == email.lower()]
-    
+        return cls._orders.find_by_email(email)
+
     @classmethod
     def get(cls, oid):
-        return next((o for o in cls.orders if str(o["id"]) == str(oid)), None)
+        return cls._orders.get(oid)
 
+    @staticmethod
+    def _filters(status=None, email=None, date_from=None, date_to=None):
+        """Collection filters for the admin listing and exports. Dates are "YYYY-MM-DD", inclusive."""
+        filters = {}
+        if status:
+            filters["status"] = status.lower()
+        if email:
+            filters["email"] = email
+        if date_from or date_to:
+            filters["datetime"] = (
+                f"{date_from} 00:00:00" if date_from else None,
+                f"{date_to} 23:59:59" if date_to else None,
+            )
+        return filters
+
+    @classmethod
+    def query(cls, status=None, email=None, date_from=None, date_to=None,
+              sort="date", descending=True, offset=0, limit=50):
+        """
+        One page of orders for the admin listing, sorted by "date" or
+        "total". Returns (orders, has_more).
+        """
+        filters = cls._filters(status, email, date_from, date_to)
+        sort = "total" if sort == "total" else "datetime"
+        return cls._orders.query(filters, sort=sort, descending=descending, offset=offset, limit=limit)
 
+    @classmethod
+    def scan(cls, status=None, email=None, date_from=None, date_to=None):
+        """Yield every matching order, oldest first, without building a list."""
+        filters = cls._filters(status, email, date_from, date_to)
+        return cls._orders.scan(filters, sort="datetime", descending=False)
+
+    @classmethod
+    def get_many(cls, oids):
+        """Orders for a list of ids (e.g. a customer's order history)."""
+        return cls._orders.get_many(oids)
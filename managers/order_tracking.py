@@ -0,0 +1,68 @@
+# managers/order_tracking.py
+import threading
+
+from config import Config
+from managers.order_manager import OrderManager
+from utils.cache import LRUCache
+
+
+class OrderTracking:
+    """
+    Cached order lookups for the public tracking page.
+
+    Results (including "no orders") are kept per email for a short TTL.
+    Orders written by this process drop just their customers' entries;
+    a write by another worker shows up as a version we haven't seen and
+    drops everything, so a cached result is never older than the orders
+    this process has synced.
+    """
+
+    _cache = LRUCache(maxsize=Config.TRACKING_CACHE_SIZE, ttl=Config.TRACKING_CACHE_TTL)
+    _version = None
+    _lock = threading.Lock()
+
+    @classmethod
+    def configure(cls, maxsize, ttl):
+        """Replace the cache with an empty one of the given size and TTL."""
+        with cls._lock:
+            cls._cache = LRUCache(maxsize=maxsize, ttl=ttl)
+            cls._version = None
+
+    @staticmethod
+    def _email_key(email):
+        return (email or "").strip().lower()
+
+    @classmethod
+    def _check_version(cls):
+        """Clear the cache if the orders changed in a way we weren't told about."""
+        version = OrderManager.version()
+        if version != cls._version:
+            cls._cache.clear()
+            cls._version = version
+
+    @classmethod
+    def orders_for(cls, email):
+        """The orders placed with `email`, newest first, as a tuple."""
+        key = cls._email_key(email)
+        with cls._lock:
+            cls._check_version()
+            orders = cls._cache.get(key)
+            version = cls._version
+        if orders is None:
+            orders = tuple(OrderManager.get_by_email(key))
+            with cls._lock:
+                # Don't cache a result an order change may have overtaken meanwhile
+                if cls._version == version:
+                    cls._cache.set(key, orders)
+        return orders
+
+    @classmethod
+    def on_order_change(cls, event, orders, previous_version):
+        """OrderManager listener: forget the results for the customers whose orders changed."""
+        with cls._lock:
+            if cls._version != previous_version:
+                cls._cache.clear()
+            else:
+                for order in orders:
+                    cls._cache.pop(cls._email_key(order.get("user", {}).get("email")))
+            cls._version = OrderManager.version()
@@ -0,0 +1,79 @@
+# managers/pricing.py
+from decimal import Decimal
+
+from managers.product_manager import ProductManager
+
+CENTS = Decimal("0.01")
+
+
+class PricingEngine:
+    """
+    Prices carts against an id-keyed product map instead of walking the
+    whole catalog. The map is built once per catalog version and rebuilt
+    lazily after ProductManager changes a product.
+
+    Amounts are decimal.Decimal so line totals add up exactly.
+    """
+
+    _price_map = {}
+    _map_version = None
+
+    @classmethod
+    def price_map(cls):
+        """{product id as str: (Decimal price, product)} for the current catalog."""
+        version = ProductManager.catalog_version()
+        if version != cls._map_version:
+            cls._price_map = {
+                str(p["id"]): (Decimal(str(p["price"])), p)
+                for p in ProductManager.get_all()
+            }
+            cls._map_version = version
+        return cls._price_map
+
+    @classmethod
+    def unit_price(cls, product_id):
+        """Decimal price of one product, or None if it is not in the catalog."""
+        entry = cls.price_map().get(str(product_id))
+        return entry[0] if entry else None
+
+    @classmethod
+    def totals(cls, cart):
+        """Return (Decimal total, total quantity) for a {product id: qty} cart."""
+        prices = cls.price_map()
+        total = Decimal(0)
+        total_qty = 0
+        for pid, qty in cart.items():
+            entry = prices.get(pid)
+            if entry and qty > 0:
+                total += entry[0] * qty
+                total_qty += qty
+        return total.quantize(CENTS), total_qty
+
+    @classmethod
+    def line_items(cls, cart):
+        """
+        Return (cart_products, Decimal total, total quantity).
+        Each line is a plain dict so it can be stored on an order as-is.
+        """
+        prices = cls.price_map()
+        cart_products = []
+        total = Decimal(0)
+        total_qty = 0
+        for pid, qty in cart.items():
+            entry = prices.get(pid)
+            if not entry or qty <= 0:
+                continue
+            price, product = entry
+            subtotal = price * qty
+            cart_products.append({
+                "id": product['id'],
+                "name": product['name'],
+                "description": product.get('description', ''),
+                "price": product['price'],
+                "image": product.get('image', ''),
+                "quantity": qty,
+                "subtotal": float(subtotal)
+            })
+            total += subtotal
+            total_qty += qty
+        return cart_products, total.quantize(CENTS), total_qty
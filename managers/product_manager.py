@@ -1,42 +1,85 @@
-import json
-import os
-
-BASE_DIR = os.path.dirname(os.path.dirname(__file__))
-PRODUCTS_FILE = os.path.join(BASE_DIR, "data", "products.json")
+from config import active_config
+from managers.records import Product
+from managers.stock import get_stock
+from managers.storage import open_collection
+from utils.metrics import timed
 
 
 class ProductManager:
-    products = []
+    _products = None
+    # Config the collection was opened with; create_app() with another one reopens it
+    _config = None
+    # Callbacks run after every add/update/delete in this process:
+    # fn(event, product, previous_version)
+    _listeners = []
+
+    COLLECTION_OPTIONS = {"record_type": Product}
 
     # -------------------------
     # Load and Save
     # -------------------------
     @classmethod
+    @timed("products.load")
     def load_products(cls):
-        file_path = os.path.abspath(PRODUCTS_FILE)
-        if os.path.exists(file_path):
-            with open(file_path, 'r') as f:
-                cls.products = json.load(f)
-        else:
-            cls.products = []
+        """Open the products collection for the configured storage engine (once per process)."""
+        if cls._products is not None and cls._config is active_config():
+            cls._products.sync()
+            return
+        products = open_collection("products", **cls.COLLECTION_OPTIONS)
+        products.load()
+        cls._products = products
+        cls._config = active_config()
 
     @classmethod
+    @timed("products.save")
     def save_products(cls):
-        file_path = os.path.abspath(PRODUCTS_FILE)
-        with open(file_path, 'w') as f:
-            json.dump(cls.products, f, indent=4)
+        cls._products.save()
+
+    @classmethod
+    @timed("products.sync")
+    def sync(cls):
+        """Reload if another worker process changed the products."""
+        cls._products.sync()
+
+    @classmethod
+    def subscribe(cls, callback):
+        """
+        Register fn(event, product, previous_version), called after "add",
+        "update" and "delete". `previous_version` is the catalog version the
+        change was applied on top of, so a listener that has seen exactly
+        that version can apply the change alone instead of rebuilding.
+        """
+        cls._listeners.append(callback)
+
+    @classmethod
+    def _notify(cls, event, product, previous_version):
+        for callback in cls._listeners:
+            callback(event, product, previous_version)
+
+    @classmethod
+    def catalog_version(cls):
+        """Changes whenever any product is added, edited or deleted (in any worker)."""
+        return cls._products.version
 
     # -------------------------
     # Basic Getters
     # -------------------------
     @classmethod
     def get_all(cls):
-        return cls.products
+        return cls._products.all()
+
+    @classmethod
+    def count(cls):
+        return cls._products.count()
 
     @classmethod
     def get(cls, pid):
-        product = next((p for p in cls.products if p["id"] == pid), None)
-        return product
+        return cls._products.get(pid)
+
+    @classmethod
+    def get_many(cls, pids):
+        """Products for the given ids, in the same order, skipping unknown ids."""
+        return cls._products.get_many(pids)
 
     # -------------------------
     # Admin Functions
@@ -44,45 +87,120 @@ class ProductManager:
     @classmethod
     def generate_id(cls):
         """Create safe auto-increment ID based on last product."""
-        if not cls.products:
-            return 1
-        return cls.products[-1]["id"] + 1
+        return cls._products.next_id()
 
     @classmethod
+    @timed("products.write")
     def add_product(cls, product_data):
         """Add a new product (admin)"""
-        new_product = {
-            "id": cls.generate_id(),
-            "name": product_data.get("name"),
-            "description": product_data.get("description"),
-            "price": float(product_data.get("price")),
-            "image": product_data.get("image"),
-            "status": "available"
-        }
-
-        cls.products.append(new_product)
-        cls.save_products()
+        with cls._products.transaction():
+            previous = cls.catalog_version()
+            new_product = Product(
+                id=cls.generate_id(),
+                name=product_data.get("name"),
+                description=product_data.get("description"),
+                price=float(product_data.get("price")),
+                image=product_data.get("image"),
+                status="available"
+            )
+            if product_data.get("images"):
+                new_product["images"] = product_data["images"]
+            cls._products.insert(new_product)
+        cls._notify("add", new_product, previous)
         return new_product
 
     @classmethod
+    @timed("products.write")
     def update_product(cls, pid, updated_data):
         """Edit a product"""
-        product = cls.get(pid)
-        if not product:
-            return None
+        with cls._products.transaction():
+            previous = cls.catalog_version()
+            product = cls.get(pid)
+            if not product:
+                return None
 
-        product["name"] = updated_data.get("name", product["name"])
-        product["description"] = updated_data.get("description", product["description"])
-        product["price"] = float(updated_data.get("price", product["price"]))
-        product["image"] = updated_data.get("image", product["image"])
-        product["status"] = updated_data.get("status", product["status"])
-
-        cls.save_products()
+            fields = dict(
+                name=updated_data.get("name", product["name"]),
+                description=updated_data.get("description", product["description"]),
+                price=float(updated_data.get("price", product["price"])),
+                image=updated_data.get("image", product["image"]),
+                status=updated_data.get("status", product["status"]),
+            )
+            if "images" in updated_data:
+                fields["images"] = updated_data["images"]
+            cls._products.update(product, **fields)
+        cls._notify("update", product, previous)
         return product
 
     @classmethod
+    @timed("products.write")
     def delete_product(cls, pid):
         """Delete product from list + save"""
-        cls.products = [p for p in cls.products if p["id"] != pid]
-        cls.save_products()
+        with cls._products.transaction():
+            previous = cls.catalog_version()
+            product = cls.get(pid)
+            cls._products.delete(pid)
+        get_stock().set(pid, None)
+        if product:
+            cls._notify("delete", product, previous)
         return True
+
+    # -------------------------
+    # Stock
+    # -------------------------
+    @classmethod
+    def stock(cls, pid):
+        """{"on_hand", "reserved", "available"} units, or None if stock isn't tracked."""
+        return get_stock().get(pid)
+
+    @classmethod
+    def stock_levels(cls):
+        """{product id: stock} for every product whose stock is tracked."""
+        return get_stock().levels()
+
+    @classmethod
+    def set_stock(cls, pid, on_hand):
+        """
+        Set units on hand (None stops tracking) and mark the product
+        available or out of stock to match.
+        """
+        level = get_stock().set(pid, on_hand)
+        if level is not None:
+            cls._mark_status(pid, "available" if level["available"] > 0 else "out-of-stock")
+        return level
+
+    @classmethod
+    def reserve(cls, lines):
+        """
+        Hold {product id: quantity} for a checkout, all lines or none.
+        Returns a hold id; raises OutOfStock. Safe across worker processes.
+        """
+        return get_stock().reserve(lines)
+
+    @classmethod
+    def commit_reservation(cls, hold_id):
+        """
+        Turn a hold into a sale; products that just sold out are marked out
+        of stock. Raises OutOfStock if the hold expired and its units are gone.
+        """
+        for pid in get_stock().commit(hold_id):
+            cls._mark_status(pid, "out-of-stock")
+
+    @classmethod
+    def release_reservation(cls, hold_id):
+        get_stock().release(hold_id)
+
+    @classmethod
+    def restock(cls, lines):
+        """Put sold {product id: quantity} back on hand and mark those products available again."""
+        get_stock().restock(lines)
+        for pid in lines:
+            level = cls.stock(pid)
+            if level is not None and level["available"] > 0:
+                cls._mark_status(pid, "available")
+
+    @classmethod
+    def _mark_status(cls, pid, status):
+        product = cls.get(pid)
+        if product is not None and product.get("status") != status:
+            cls.update_product(pid, {"status": status})
@@ -0,0 +1,151 @@
+# managers/records.py
+import sys
+from collections.abc import MutableMapping
+
+
+class Record(MutableMapping):
+    """
+    Base for stored records: known fields live in __slots__ instead of a
+    per-record dict, behind a dict-like interface so existing code
+    (`order["id"]`, `.get()`, `.update()`) and templates keep working.
+
+    Slot names are the JSON keys, with a trailing "_" where the key would
+    shadow a mapping method (e.g. `items_` for "items"). Keys that have no
+    slot are kept in `_extra`, which is only allocated when needed, so
+    `to_dict()` round-trips any stored JSON losslessly.
+    """
+
+    __slots__ = ("_extra",)
+    # JSON key -> slot name, filled in for each subclass
+    _slot_of = {}
+    # key -> record type for a nested dict, or [record type] for a list of them
+    NESTED = {}
+    # String fields whose values repeat across records share one object
+    INTERNED = frozenset()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        slots = [s for klass in reversed(cls.__mro__) for s in klass.__dict__.get("__slots__", ())]
+        cls._slot_of = {s[:-1] if s.endswith("_") else s: s for s in slots if s != "_extra"}
+
+    def __init__(self, data=(), **fields):
+        self._extra = None
+        self.update(data, **fields)
+
+    @classmethod
+    def from_dict(cls, data):
+        """A record from parsed JSON; records of this type are returned as-is."""
+        return data if isinstance(data, cls) else cls(data)
+
+    def to_dict(self):
+        """Plain JSON-ready dict, nested records included."""
+        return {key: _plain(value) for key, value in self.items()}
+
+    def _coerce(self, key, value):
+        nested = self.NESTED.get(key)
+        if nested is not None:
+            if isinstance(nested, list):
+                if not isinstance(value, list):
+                    return value
+                return [nested[0].from_dict(v) if isinstance(v, dict) else v for v in value]
+            return nested.from_dict(value) if isinstance(value, dict) else value
+        if key in self.INTERNED and type(value) is str:
+            return sys.intern(value)
+        return value
+
+    # -------------------------
+    # Mapping interface
+    # -------------------------
+    def __getitem__(self, key):
+        slot = self._slot_of.get(key)
+        if slot is not None:
+            try:
+                return getattr(self, slot)
+            except AttributeError:
+                raise KeyError(key) from None
+        if self._extra and key in self._extra:
+            return self._extra[key]
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        slot = self._slot_of.get(key)
+        if slot is None:
+            if self._extra is None:
+                self._extra = {}
+            self._extra[key] = value
+        else:
+            setattr(self, slot, self._coerce(key, value))
+
+    def __delitem__(self, key):
+        slot = self._slot_of.get(key)
+        try:
+            if slot is not None:
+                delattr(self, slot)
+            else:
+                del self._extra[key]
+        except (AttributeError, KeyError, TypeError):
+            raise KeyError(key) from None
+
+    def __iter__(self):
+        for key, slot in self._slot_of.items():
+            if hasattr(self, slot):
+                yield key
+        if self._extra:
+            yield from self._extra
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.to_dict()!r})"
+
+
+def _plain(value):
+    if isinstance(value, Record):
+        return value.to_dict()
+    if isinstance(value, list):
+        return [_plain(v) for v in value]
+    return value
+
+
+def json_default(obj):
+    """`default=` hook so json.dump() can write records."""
+    if isinstance(obj, Record):
+        return obj.to_dict()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+# -------------------------
+# Record types
+# -------------------------
+class Product(Record):
+    # "images": uploaded-image metadata from managers/image_store.py, if any
+    __slots__ = ("id", "name", "description", "price", "image", "images", "status")
+    INTERNED = frozenset({"status"})
+
+
+class Contact(Record):
+    """Customer details as captured on an order."""
+    __slots__ = ("name", "email", "phone", "address")
+    # Repeat customers' orders share one copy of each string
+    INTERNED = frozenset({"name", "email", "phone", "address"})
+
+
+class OrderItem(Record):
+    """
+    One order line. The product name, description and image are interned,
+    so every line of the same product points at one shared copy rather
+    than each embedding its own.
+    """
+    __slots__ = ("id", "name", "description", "price", "image", "quantity", "subtotal")
+    INTERNED = frozenset({"name", "description", "image"})
+
+
+class Order(Record):
+    __slots__ = ("id", "user", "items_", "total", "datetime", "status")
+    NESTED = {"user": Contact, "items": [OrderItem]}
+    INTERNED = frozenset({"status"})
+
+
+class Customer(Record):
+    __slots__ = ("id", "name", "email", "phone", "address", "orders")
@@ -0,0 +1,302 @@
+# managers/search.py
+import math
+import re
+import sys
+import threading
+from array import array
+from bisect import bisect_left, insort
+from heapq import heappush, heappushpop, merge, nlargest
+
+from managers.product_manager import ProductManager
+
+_WORD = re.compile(r"[^\W_]+")
+
+# Postings are packed into one int: (MAX_WEIGHT - weight) << 32 | doc id,
+# so an ascending array lists a term's documents best-first.
+MAX_WEIGHT = 0xFFFF
+_DOC_MASK = 0xFFFFFFFF
+
+# BM25-style term-frequency saturation
+K1 = 1.2
+
+
+def tokenize(text):
+    """Case-folded words (runs of letters and digits) in `text`."""
+    return _WORD.findall((text or "").casefold())
+
+
+class _Clause:
+    """
+    One query word: the terms it matches (a single term, or every
+    vocabulary term starting with it) with their idf.
+    """
+
+    def __init__(self, index, terms):
+        self.index = index
+        self.terms = [(term, index.idf(term)) for term in terms]
+        self.max_score = max(
+            idf * _saturate(MAX_WEIGHT - (index.postings[term][0] >> 32))
+            for term, idf in self.terms
+        )
+
+    def score(self, doc_terms):
+        """Best score among this clause's terms for one document, or None if none occur."""
+        best = None
+        for term, idf in self.terms:
+            weight = doc_terms.get(term)
+            if weight is not None:
+                score = idf * _saturate(weight)
+                if best is None or score > best:
+                    best = score
+        return best
+
+    def docs(self):
+        """Set of ids of every matching document."""
+        postings = self.index.postings
+        docs = set()
+        for term, _ in self.terms:
+            docs.update(map(_DOC_MASK.__and__, postings[term]))
+        return docs
+
+    def stream(self):
+        """(score, doc id) for every matching document, highest score (then lowest id) first."""
+        postings = self.index.postings
+
+        def entries(term, idf):
+            for key in postings[term]:
+                yield idf * _saturate(MAX_WEIGHT - (key >> 32)), key & _DOC_MASK
+
+        if len(self.terms) == 1:
+            return entries(*self.terms[0])
+        return merge(*(entries(term, idf) for term, idf in self.terms), key=lambda e: (-e[0], e[1]))
+
+
+def _saturate(weight):
+    return weight * (K1 + 1) / (weight + K1)
+
+
+class InvertedIndex:
+    """
+    Term -> documents index with incremental add/remove.
+
+    Each term's postings are a packed array sorted by weight, so the best
+    matches for a query come off the front and a search can stop as soon
+    as no later document could make the top results. The vocabulary is a
+    sorted list, which makes every term starting with a prefix one bisect
+    away (type-ahead on the word still being typed).
+    """
+
+    # Prefix matches considered per query word, most common terms first
+    MAX_EXPANSIONS = 50
+    MAX_PREFIX_SCAN = 2000
+    # Postings the threshold algorithm may read before a search falls back
+    # to intersecting whole clauses
+    SCAN_BUDGET = 400
+
+    def __init__(self, field_weights):
+        # field -> weight of one occurrence of a word in that field
+        self.field_weights = field_weights
+        self.postings = {}
+        self.vocabulary = []
+        # doc id -> {term: weight}, to score candidates and remove documents exactly
+        self.doc_terms = {}
+
+    def __len__(self):
+        return len(self.doc_terms)
+
+    @classmethod
+    def build(cls, field_weights, docs):
+        """Index [(doc id, doc)] in one pass, sorting each term's postings once."""
+        index = cls(field_weights)
+        lists = {}
+        for doc_id, doc in docs:
+            terms = index.doc_terms[doc_id] = index._weights(doc)
+            for term, weight in terms.items():
+                lists.setdefault(term, []).append((MAX_WEIGHT - weight) << 32 | doc_id)
+        index.postings = {term: array("q", sorted(keys)) for term, keys in lists.items()}
+        index.vocabulary = sorted(index.postings)
+        return index
+
+    # -------------------------
+    # Updates
+    # -------------------------
+    def add(self, doc_id, doc):
+        """Index `doc` (a mapping with the weighted fields) under an integer id."""
+        self.remove(doc_id)
+        terms = self.doc_terms[doc_id] = self._weights(doc)
+        for term, weight in terms.items():
+            if term not in self.postings:
+                self.postings[term] = array("q")
+                insort(self.vocabulary, term)
+            insort(self.postings[term], (MAX_WEIGHT - weight) << 32 | doc_id)
+
+    def remove(self, doc_id):
+        terms = self.doc_terms.pop(doc_id, None)
+        if not terms:
+            return
+        for term, weight in terms.items():
+            entries = self.postings[term]
+            key = (MAX_WEIGHT - weight) << 32 | doc_id
+            i = bisect_left(entries, key)
+            if i < len(entries) and entries[i] == key:
+                del entries[i]
+            if not entries:
+                del self.postings[term]
+                del self.vocabulary[bisect_left(self.vocabulary, term)]
+
+    def _weights(self, doc):
+        """{term: weight} for one document; terms are interned so documents share them."""
+        weights = {}
+        for field, field_weight in self.field_weights.items():
+            for term in tokenize(doc.get(field)):
+                weights[term] = weights.get(term, 0) + field_weight
+        return {
+            sys.intern(term): weight if weight < MAX_WEIGHT else MAX_WEIGHT
+            for term, weight in weights.items()
+        }
+
+    # -------------------------
+    # Queries
+    # -------------------------
+    def idf(self, term):
+        df = len(self.postings[term])
+        return math.log(1 + (len(self.doc_terms) - df + 0.5) / (df + 0.5))
+
+    def expand(self, prefix):
+        """Vocabulary terms starting with `prefix`, most frequent first."""
+        start = bisect_left(self.vocabulary, prefix)
+        matches = []
+        for term in self.vocabulary[start:start + self.MAX_PREFIX_SCAN]:
+            if not term.startswith(prefix):
+                break
+            matches.append(term)
+        if len(matches) > self.MAX_EXPANSIONS:
+            matches.sort(key=lambda t: len(self.postings[t]), reverse=True)
+            del matches[self.MAX_EXPANSIONS:]
+        return matches
+
+    def search(self, query, limit=20, prefix=True):
+        """
+        Top `limit` (doc id, score) pairs for documents containing every
+        word of `query`. With `prefix`, the last word also matches longer
+        terms ("straw" finds "strawberry") unless the query ends in a
+        space or punctuation.
+        """
+        words = list(dict.fromkeys(tokenize(query)))
+        if not words or limit <= 0:
+            return []
+        partial = words.pop() if prefix and query[-1].isalnum() else None
+
+        clauses = []
+        for word in words:
+            if word not in self.postings:
+                return []
+            clauses.append(_Clause(self, [word]))
+        if partial is not None:
+            expansions = self.expand(partial)
+            if not expansions:
+                return []
+            clauses.append(_Clause(self, expansions))
+
+        # Threshold algorithm: read every clause best-first in turn and score
+        # each new document in full. No unseen document can beat the sum of
+        # the clauses' current scores, and once any clause runs out every
+        # document matching all of them has been seen.
+        streams = [clause.stream() for clause in clauses]
+        frontier = [clause.max_score for clause in clauses]
+        top, seen = [], set()
+        budget = self.SCAN_BUDGET
+        while True:
+            for i, stream in enumerate(streams):
+                entry = next(stream, None)
+                if entry is None:
+                    return self._ranked(top)
+                frontier[i], doc_id = entry
+                if doc_id in seen:
+                    continue
+                seen.add(doc_id)
+                total = self._score(clauses, doc_id)
+                if total is not None:
+                    if len(top) < limit:
+                        heappush(top, (total, -doc_id))
+                    else:
+                        heappushpop(top, (total, -doc_id))
+            if len(top) == limit and top[0][0] >= sum(frontier):
+                return self._ranked(top)
+            budget -= len(streams)
+            if budget <= 0:
+                # Frequent words that rarely score high together (e.g. both
+                # common, but seldom both in a name): score just the overlap
+                candidates = set.intersection(*(clause.docs() for clause in clauses))
+                return self._ranked(nlargest(
+                    limit, ((self._score(clauses, doc_id), -doc_id) for doc_id in candidates)
+                ))
+
+    def _score(self, clauses, doc_id):
+        doc_terms = self.doc_terms[doc_id]
+        total = 0
+        for clause in clauses:
+            score = clause.score(doc_terms)
+            if score is None:
+                return None
+            total += score
+        return total
+
+    @staticmethod
+    def _ranked(top):
+        return [(-neg_id, total) for total, neg_id in sorted(top, reverse=True)]
+
+
+class ProductSearch:
+    """
+    Full-text search over product names and descriptions.
+
+    The index is built from the catalog on first use and then kept in step
+    by ProductManager's change notifications, one product at a time. If
+    another worker changed the catalog in between, the versions no longer
+    line up and the index is rebuilt on the next search instead.
+    """
+
+    # A word in the name counts three times as much as one in the description
+    FIELD_WEIGHTS = {"name": 3, "description": 1}
+    MAX_QUERY_LENGTH = 200
+
+    _index = None
+    _version = None
+    _lock = threading.Lock()
+
+    @classmethod
+    def rebuild(cls):
+        version = ProductManager.catalog_version()
+        cls._index = InvertedIndex.build(
+            cls.FIELD_WEIGHTS, ((int(p["id"]), p) for p in ProductManager.get_all())
+        )
+        cls._version = version
+
+    @classmethod
+    def on_product_change(cls, event, product, previous_version):
+        """ProductManager listener: apply one add/update/delete to the index."""
+        with cls._lock:
+            if cls._index is None:
+                return
+            if cls._version != previous_version:
+                # Missed someone else's change: rebuild on the next search
+                cls._version = None
+                return
+            pid = int(product["id"])
+            if event == "delete":
+                cls._index.remove(pid)
+            else:
+                cls._index.add(pid, product)
+            cls._version = ProductManager.catalog_version()
+
+    @classmethod
+    def search(cls, query, limit=20):
+        """[(product, score)] best match first; the last word is matched as a prefix."""
+        query = (query or "")[:cls.MAX_QUERY_LENGTH]
+        with cls._lock:
+            if cls._index is None or cls._version != ProductManager.catalog_version():
+                cls.rebuild()
+            hits = cls._index.search(query, limit)
+        scores = dict(hits)
+        return [(p, scores[int(p["id"])]) for p in ProductManager.get_many([pid for pid, _ in hits])]
@@ -0,0 +1,333 @@
+# managers/sqlite_storage.py
+import json
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+from managers.records import json_default
+
+_local = threading.local()
+# Connections opened before a fork (e.g. a gunicorn --preload master).
+# SQLite connections must not be used, or closed, across a fork, so the
+# child just keeps them referenced and opens its own.
+_inherited = []
+
+
+def _after_fork():
+    global _local
+    _inherited.append(_local)
+    _local = threading.local()
+
+
+os.register_at_fork(after_in_child=_after_fork)
+
+
+def connect(db_path):
+    """One connection per thread and database file, in WAL mode."""
+    conns = getattr(_local, "conns", None)
+    if conns is None:
+        conns = _local.conns = {}
+    conn = conns.get(db_path)
+    if conn is None:
+        # Autocommit mode; transactions are opened explicitly with BEGIN.
+        conn = sqlite3.connect(db_path, isolation_level=None, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conns[db_path] = conn
+    return conn
+
+
+class SqliteCollection:
+    """
+    Records stored one row each in a SQLite table.
+
+    Rows keep the full record as JSON in `body`, next to indexed `id`,
+    lower-cased `email` and one column per queryable field, so lookups
+    and writes touch single rows and nothing has to be loaded at startup.
+    """
+
+    def __init__(self, db_path, table, newest_first=False, email_of=None, fields=None, record_type=None):
+        self.db_path = db_path
+        self.table = table
+        self.newest_first = newest_first
+        self.email_of = email_of
+        self.fields = fields or {}
+        self.record_type = record_type
+        self._order = "DESC" if newest_first else "ASC"
+        # Mirrors the table's row in collection_versions as of the last sync/write
+        self.version = 0
+
+    @property
+    def conn(self):
+        return connect(self.db_path)
+
+    # -------------------------
+    # Load and Sync
+    # -------------------------
+    def load(self):
+        """Create the table if needed. Does not read any rows."""
+        self.conn.executescript(f"""
+            CREATE TABLE IF NOT EXISTS {self.table} (
+                id INTEGER PRIMARY KEY,
+                email TEXT,
+                body TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_{self.table}_email ON {self.table} (email);
+            CREATE TABLE IF NOT EXISTS collection_versions (
+                name TEXT PRIMARY KEY,
+                version INTEGER NOT NULL
+            );
+            INSERT OR IGNORE INTO collection_versions (name, version) VALUES ('{self.table}', 0);
+        """)
+        self._add_field_columns()
+        self.sync()
+
+    def _add_field_columns(self):
+        """Add (and backfill) a column plus index for each queryable field."""
+        existing = {row[1] for row in self.conn.execute(f"PRAGMA table_info({self.table})")}
+        missing = [name for name in self.fields if name not in existing]
+        if not missing:
+            return
+        with self.transaction():
+            for name in missing:
+                self.conn.execute(f"ALTER TABLE {self.table} ADD COLUMN {name}")
+                self.conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{self.table}_{name} ON {self.table} ({name}, id)")
+            rows = self.conn.execute(f"SELECT id, body FROM {self.table}").fetchall()
+            self.conn.executemany(
+                f"UPDATE {self.table} SET {', '.join(f'{n} = ?' for n in missing)} WHERE id = ?",
+                [[self.fields[n](json.loads(body)) for n in missing] + [rid] for rid, body in rows],
+            )
+
+    def sync(self):
+        """
+        Readers always see committed rows; only refresh `version` so
+        caches built on this collection notice writes by other processes.
+        """
+        row = self.conn.execute(
+            "SELECT version FROM collection_versions WHERE name = ?", (self.table,)
+        ).fetchone()
+        self.version = row[0] if row else 0
+
+    def _bump_version(self):
+        self.conn.execute(
+            "UPDATE collection_versions SET version = version + 1 WHERE name = ?", (self.table,)
+        )
+        self.sync()
+
+    @contextmanager
+    def transaction(self):
+        """
+        BEGIN IMMEDIATE so concurrent writers queue up instead of failing.
+        Nests per thread and database file: collections sharing a file
+        share its connection, and so its transaction.
+        """
+        depths = getattr(_local, "depth", None)
+        if depths is None:
+            depths = _local.depth = {}
+        depth = depths.get(self.db_path, 0)
+        if depth == 0:
+            self.conn.execute("BEGIN IMMEDIATE")
+        depths[self.db_path] = depth + 1
+        try:
+            yield
+        except BaseException:
+            depths[self.db_path] = depth
+            if depth == 0:
+                self.conn.execute("ROLLBACK")
+            raise
+        depths[self.db_path] = depth
+        if depth == 0:
+            self.conn.execute("COMMIT")
+
+    def save(self):
+        """Every mutation is already written; kept for API parity."""
+
+    # -------------------------
+    # Queries
+    # -------------------------
+    def _email_key(self, record):
+        if self.email_of is None:
+            return None
+        return (self.email_of(record) or "").lower()
+
+    def _parse(self, body):
+        record = json.loads(body)
+        return self.record_type.from_dict(record) if self.record_type else record
+
+    def _columns(self):
+        return ["email", *self.fields, "body"]
+
+    def _row(self, record):
+        """Column values for `record`, in _columns() order."""
+        return [self._email_key(record), *(fn(record) for fn in self.fields.values()), json.dumps(record, default=json_default)]
+
+    def all(self):
+        rows = self.conn.execute(f"SELECT body FROM {self.table} ORDER BY id {self._order}")
+        return [self._parse(body) for (body,) in rows]
+
+    def count(self):
+        return self.conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+
+    def get(self, rid):
+        try:
+            rid = int(rid)
+        except (TypeError, ValueError):
+            return None
+        row = self.conn.execute(f"SELECT body FROM {self.table} WHERE id = ?", (rid,)).fetchone()
+        return self._parse(row[0]) if row else None
+
+    def get_many(self, rids):
+        """Records for the given ids, in the same order, skipping unknown ids."""
+        ids = []
+        for rid in rids:
+            try:
+                ids.append(int(rid))
+            except (TypeError, ValueError):
+                pass
+        if not ids:
+            return []
+        placeholders = ",".join("?" * len(ids))
+        rows = self.conn.execute(f"SELECT id, body FROM {self.table} WHERE id IN ({placeholders})", ids)
+        by_id = {rid: body for rid, body in rows}
+        return [self._parse(by_id[rid]) for rid in ids if rid in by_id]
+
+    def find_by_email(self, email):
+        rows = self.conn.execute(
+            f"SELECT body FROM {self.table} WHERE email = ? ORDER BY id {self._order}", (email.lower(),)
+        )
+        return [self._parse(body) for (body,) in rows]
+
+    def _where(self, filters, sort):
+        """WHERE clauses and parameters for query()/scan() filters."""
+        from managers.storage import _split_filters
+
+        email, ranges = _split_filters(filters)
+        where, params = [], []
+        if email is not None:
+            where.append("email = ?")
+            params.append(email.lower())
+        for name, (low, high) in ranges.items():
+            if name not in self.fields:
+                raise ValueError(f"unknown field {name!r}")
+            if low is not None:
+                where.append(f"{name} >= ?")
+                params.append(low)
+            if high is not None:
+                where.append(f"{name} <= ?")
+                params.append(high)
+        if sort is not None and sort not in self.fields:
+            raise ValueError(f"unknown field {sort!r}")
+        return where, params
+
+    def query(self, filters=None, sort=None, descending=True, offset=0, limit=50):
+        """
+        One page of records matching `filters`, ordered by the field `sort`
+        (or by id). Same contract as JsonCollection.query; every filter and
+        sort column is indexed. Returns (records, has_more).
+        """
+        where, params = self._where(filters, sort)
+        direction = "DESC" if descending else "ASC"
+        order_by = f"{sort} {direction}, id {direction}" if sort else f"id {direction}"
+        sql = f"SELECT body FROM {self.table}"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += f" ORDER BY {order_by} LIMIT ? OFFSET ?"
+        rows = self.conn.execute(sql, [*params, limit + 1, offset]).fetchall()
+        records = [self._parse(body) for (body,) in rows]
+        return records[:limit], len(records) > limit
+
+    def scan(self, filters=None, sort=None, descending=True, chunk_size=500):
+        """
+        Yield every record matching `filters` in query() order, reading
+        keyset-paged chunks so no read transaction is held open between them.
+        """
+        where, params = self._where(filters, sort)
+        direction = "DESC" if descending else "ASC"
+        cmp = "<" if descending else ">"
+        key = f"({sort}, id)" if sort else "id"
+        order_by = f"{sort} {direction}, id {direction}" if sort else f"id {direction}"
+        select = f"SELECT {sort + ', ' if sort else ''}id, body FROM {self.table}"
+
+        after = None
+        while True:
+            clauses, args = list(where), list(params)
+            if after is not None:
+                clauses.append(f"{key} {cmp} ({', '.join('?' * len(after))})")
+                args.extend(after)
+            sql = select
+            if clauses:
+                sql += " WHERE " + " AND ".join(clauses)
+            sql += f" ORDER BY {order_by} LIMIT ?"
+            rows = self.conn.execute(sql, [*args, chunk_size]).fetchall()
+            if not rows:
+                return
+            for row in rows:
+                yield self._parse(row[-1])
+            after = rows[-1][:-1]
+
+    def next_id(self):
+        (max_id,) = self.conn.execute(f"SELECT COALESCE(MAX(id), 0) FROM {self.table}").fetchone()
+        return max_id + 1
+
+    # -------------------------
+    # Mutations (call inside transaction())
+    # -------------------------
+    def insert(self, record):
+        columns = self._columns()
+        self.conn.execute(
+            f"INSERT INTO {self.table} (id, {', '.join(columns)}) VALUES (?{', ?' * len(columns)})",
+            [record["id"], *self._row(record)],
+        )
+        self._bump_version()
+
+    def update(self, record, **fields):
+        record.update(fields)
+        self.conn.execute(
+            f"UPDATE {self.table} SET {', '.join(f'{c} = ?' for c in self._columns())} WHERE id = ?",
+            [*self._row(record), record["id"]],
+        )
+        self._bump_version()
+
+    def update_many(self, records, **fields):
+        for record in records:
+            record.update(fields)
+        self.conn.executemany(
+            f"UPDATE {self.table} SET {', '.join(f'{c} = ?' for c in self._columns())} WHERE id = ?",
+            [[*self._row(r), r["id"]] for r in records],
+        )
+        self._bump_version()
+
+    def delete(self, rid):
+        self.conn.execute(f"DELETE FROM {self.table} WHERE id = ?", (rid,))
+        self._bump_version()
+
+
+def migrate_from_json(data_dir, db_path):
+    """
+    One-shot copy of products.json, orders.json and customers.json (plus
+    any pending order journal) into a SQLite database.
+    Returns {collection name: rows written}.
+    """
+    from managers.customer_manager import CustomerManager
+    from managers.order_manager import OrderManager
+    from managers.product_manager import ProductManager
+    from managers.storage import JsonCollection
+
+    counts = {}
+    for name, manager in (("products", ProductManager), ("orders", OrderManager), ("customers", CustomerManager)):
+        source = JsonCollection(
+            os.path.join(data_dir, f"{name}.json"),
+            os.path.join(data_dir, f"{name}.journal.jsonl") if name == "orders" else None,
+        )
+        source.load()
+
+        target = SqliteCollection(db_path, name, **manager.COLLECTION_OPTIONS)
+        target.load()
+        with target.transaction():
+            target.conn.execute(f"DELETE FROM {name}")
+            counts[name] = 0
+            for record in source.all():
+                target.insert(record)
+                counts[name] += 1
+    return counts
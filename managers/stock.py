@@ -0,0 +1,266 @@
+# managers/stock.py
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from managers.sqlite_storage import connect
+
+
+class OutOfStock(Exception):
+    """A reservation asked for more units of a product than are available."""
+
+    def __init__(self, product_id, requested, available):
+        super().__init__(f"product {product_id}: {requested} requested, {available} available")
+        self.product_id = product_id
+        self.requested = requested
+        self.available = available
+
+
+class StockLedger:
+    """
+    Per-product stock counts in SQLite, shared by every worker process.
+
+    Each tracked product has one row with `on_hand` and `reserved` units.
+    `reserve()` holds each line with a single conditional INSERT into
+    stock_holds (`on_hand - reserved >= quantity`), whose trigger adds the
+    units to `reserved`: a compare-and-swap on that product's row, run as
+    its own statement so SQLite's write lock is held only that long. When
+    two buyers race for the last jar one insert matches and the other
+    changes nothing, so nothing is oversold; a checkout that loses on a
+    later line gives back the lines it already holds. `commit()` turns a
+    hold into a sale; `release()` gives the units back. Holds expire after
+    `hold_seconds`, so a worker that dies mid-checkout can't strand stock;
+    an expired hold is kept (marked expired) for a day, so a late commit
+    can still take its units if they are there, or raise OutOfStock.
+
+    Products without a row aren't tracked and never run out.
+    """
+
+    # Expired holds are swept at most this often per process
+    SWEEP_INTERVAL = 1.0
+    # ... and forgotten this long after they expire
+    EXPIRED_HOLD_TTL = 86400
+
+    def __init__(self, db_path, hold_seconds=900):
+        self.db_path = db_path
+        self.hold_seconds = hold_seconds
+        self._next_sweep = 0.0
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS stock (
+                product_id INTEGER PRIMARY KEY,
+                on_hand INTEGER NOT NULL,
+                reserved INTEGER NOT NULL DEFAULT 0,
+                CHECK (reserved >= 0 AND reserved <= on_hand)
+            );
+            CREATE TABLE IF NOT EXISTS stock_holds (
+                hold_id TEXT NOT NULL,
+                product_id INTEGER NOT NULL,
+                quantity INTEGER NOT NULL,
+                expires_at REAL NOT NULL,
+                expired INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (hold_id, product_id)
+            );
+            CREATE INDEX IF NOT EXISTS idx_stock_holds_expiry ON stock_holds (expires_at);
+            CREATE TRIGGER IF NOT EXISTS stock_holds_reserve AFTER INSERT ON stock_holds
+            BEGIN
+                UPDATE stock SET reserved = reserved + NEW.quantity WHERE product_id = NEW.product_id;
+            END;
+        """)
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(stock_holds)")}
+        if "expired" not in columns:
+            self.conn.execute("ALTER TABLE stock_holds ADD COLUMN expired INTEGER NOT NULL DEFAULT 0")
+
+    @property
+    def conn(self):
+        return connect(self.db_path)
+
+    @contextmanager
+    def _transaction(self):
+        # Multi-statement writes (commit, release, sweeps); concurrent writers
+        # wait on SQLite's busy timeout rather than on a lock of ours
+        conn = self.conn
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    # -------------------------
+    # Levels
+    # -------------------------
+    @staticmethod
+    def _level(on_hand, reserved):
+        return {"on_hand": on_hand, "reserved": reserved, "available": on_hand - reserved}
+
+    def get(self, pid):
+        """{"on_hand", "reserved", "available"} for a product, or None if untracked."""
+        try:
+            pid = int(pid)
+        except (TypeError, ValueError):
+            return None
+        row = self.conn.execute(
+            "SELECT on_hand, reserved FROM stock WHERE product_id = ?", (pid,)
+        ).fetchone()
+        return self._level(*row) if row else None
+
+    def levels(self):
+        """{product id: level} for every tracked product."""
+        rows = self.conn.execute("SELECT product_id, on_hand, reserved FROM stock")
+        return {pid: self._level(on_hand, reserved) for pid, on_hand, reserved in rows}
+
+    def set(self, pid, on_hand):
+        """
+        Set the units on hand; None stops tracking the product. Units held
+        by open checkouts stay held, so on_hand never drops below them.
+        Returns the new level (None when untracked).
+        """
+        pid = int(pid)
+        with self._transaction() as conn:
+            if on_hand is None:
+                conn.execute("DELETE FROM stock WHERE product_id = ?", (pid,))
+                conn.execute("DELETE FROM stock_holds WHERE product_id = ?", (pid,))
+                return None
+            conn.execute(
+                "INSERT INTO stock (product_id, on_hand) VALUES (?, ?) "
+                "ON CONFLICT (product_id) DO UPDATE SET on_hand = MAX(excluded.on_hand, reserved)",
+                (pid, max(0, int(on_hand))),
+            )
+        return self.get(pid)
+
+    # -------------------------
+    # Reservations
+    # -------------------------
+    def reserve(self, lines):
+        """
+        Hold stock for {product id: quantity}, all lines or none. Returns a
+        hold id for commit()/release(); raises OutOfStock for the first
+        line that can't be covered.
+        """
+        hold_id = uuid.uuid4().hex
+        expires_at = time.time() + self.hold_seconds
+        wanted = sorted((int(pid), int(qty)) for pid, qty in lines.items() if int(qty) > 0)
+        self._sweep()
+        conn = self.conn
+        for pid, qty in wanted:
+            # One autocommit statement per line: no transaction spans the lines
+            cursor = conn.execute(
+                "INSERT INTO stock_holds (hold_id, product_id, quantity, expires_at) "
+                "SELECT ?, product_id, ?, ? FROM stock WHERE product_id = ? AND on_hand - reserved >= ?",
+                (hold_id, qty, expires_at, pid, qty),
+            )
+            if cursor.rowcount:
+                continue
+            row = conn.execute(
+                "SELECT on_hand - reserved FROM stock WHERE product_id = ?", (pid,)
+            ).fetchone()
+            if row is not None:
+                self.release(hold_id)
+                raise OutOfStock(pid, qty, row[0])
+        return hold_id
+
+    def commit(self, hold_id):
+        """
+        Turn a hold into a sale. Returns the ids of products now sold out.
+
+        Lines whose hold has expired (and been given back) are sold only if
+        their units are still available; otherwise OutOfStock is raised and
+        nothing is sold.
+        """
+        with self._transaction() as conn:
+            held = self._take_hold(conn, hold_id)
+            for pid, qty, expired in held:
+                if not expired:
+                    conn.execute(
+                        "UPDATE stock SET on_hand = on_hand - ?, reserved = reserved - ? WHERE product_id = ?",
+                        (qty, qty, pid),
+                    )
+                    continue
+                cursor = conn.execute(
+                    "UPDATE stock SET on_hand = on_hand - ? WHERE product_id = ? AND on_hand - reserved >= ?",
+                    (qty, pid, qty),
+                )
+                if cursor.rowcount:
+                    continue
+                row = conn.execute(
+                    "SELECT on_hand - reserved FROM stock WHERE product_id = ?", (pid,)
+                ).fetchone()
+                if row is not None:
+                    raise OutOfStock(pid, qty, row[0])
+            if not held:
+                return []
+            marks = ",".join("?" * len(held))
+            rows = conn.execute(
+                f"SELECT product_id FROM stock WHERE on_hand = 0 AND product_id IN ({marks})",
+                [pid for pid, _, _ in held],
+            )
+            return [pid for (pid,) in rows]
+
+    def release(self, hold_id):
+        """Give a hold's units back, e.g. when the order couldn't be written."""
+        with self._transaction() as conn:
+            for pid, qty, expired in self._take_hold(conn, hold_id):
+                if not expired:
+                    conn.execute("UPDATE stock SET reserved = reserved - ? WHERE product_id = ?", (qty, pid))
+
+    def restock(self, lines):
+        """Put sold units of {product id: quantity} back on hand, e.g. when a sold order couldn't be written."""
+        with self._transaction() as conn:
+            conn.executemany(
+                "UPDATE stock SET on_hand = on_hand + ? WHERE product_id = ?",
+                [(int(qty), int(pid)) for pid, qty in lines.items() if int(qty) > 0],
+            )
+
+    @staticmethod
+    def _take_hold(conn, hold_id):
+        held = conn.execute(
+            "SELECT product_id, quantity, expired FROM stock_holds WHERE hold_id = ?", (hold_id,)
+        ).fetchall()
+        conn.execute("DELETE FROM stock_holds WHERE hold_id = ?", (hold_id,))
+        return held
+
+    def _sweep(self):
+        """
+        Release holds past their expiry (left by crashed or abandoned
+        checkouts), and forget those that expired EXPIRED_HOLD_TTL ago.
+        """
+        now = time.time()
+        if now < self._next_sweep:
+            return
+        self._next_sweep = now + self.SWEEP_INTERVAL
+        if self.conn.execute(
+            "SELECT 1 FROM stock_holds WHERE expires_at < ? AND NOT expired LIMIT 1", (now,)
+        ).fetchone() is None:
+            return
+        with self._transaction() as conn:
+            expired = conn.execute(
+                "SELECT product_id, SUM(quantity) FROM stock_holds WHERE expires_at < ? AND NOT expired "
+                "GROUP BY product_id", (now,)
+            ).fetchall()
+            conn.executemany(
+                "UPDATE stock SET reserved = reserved - ? WHERE product_id = ?",
+                [(qty, pid) for pid, qty in expired],
+            )
+            conn.execute("UPDATE stock_holds SET expired = 1 WHERE expires_at < ? AND NOT expired", (now,))
+            conn.execute("DELETE FROM stock_holds WHERE expires_at < ?", (now - self.EXPIRED_HOLD_TTL,))
+
+
+_stock = None
+_stock_config = None
+_stock_lock = threading.Lock()
+
+
+def get_stock():
+    """The process-wide stock ledger for the active config."""
+    global _stock, _stock_config
+    from config import active_config
+
+    config = active_config()
+    if _stock_config is not config:
+        with _stock_lock:
+            if _stock_config is not config:
+                _stock = StockLedger(config.STOCK_DB_PATH, config.STOCK_HOLD_SECONDS)
+                _stock_config = config
+    return _stock
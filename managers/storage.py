@@ -0,0 +1,724 @@
+# managers/storage.py
+import json
+import os
+import tempfile
+import threading
+import time
+from bisect import bisect_left, bisect_right, insort
+from contextlib import contextmanager
+from itertools import islice
+
+from managers.records import json_default
+
+try:
+    import fcntl
+except ImportError:  # Windows: fall back to in-process locking only
+    fcntl = None
+
+
+def atomic_write_json(path, data, indent=4):
+    """
+    Write JSON to a temp file in the same directory and rename it over `path`.
+    Readers see either the old file or the new one, never a truncated one.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-", suffix=".json")
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(data, f, indent=indent, default=json_default)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def _file_signature(path):
+    """(inode, size, mtime) of a file, or None if it doesn't exist."""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_ino, st.st_size, st.st_mtime_ns)
+
+
+class JsonStore:
+    """
+    A JSON document shared by every worker process.
+
+    - `lock()` takes an exclusive inter-process lock (re-entrant per thread)
+    - `save()` writes through a temp file + atomic rename
+    - `is_stale()` tells whether another process changed the file since we
+      last loaded or saved it, so callers reload only when needed
+    """
+
+    def __init__(self, path, default=list):
+        self.path = path
+        self.lock_path = path + ".lock"
+        self.default = default
+        self._signature = None
+        self._thread_lock = threading.RLock()
+        self._depth = 0
+        self._lock_file = None
+
+    # -------------------------
+    # Locking
+    # -------------------------
+    @contextmanager
+    def lock(self):
+        with self._thread_lock:
+            if self._depth == 0 and fcntl is not None:
+                self._lock_file = open(self.lock_path, 'a')
+                fcntl.flock(self._lock_file, fcntl.LOCK_EX)
+            self._depth += 1
+            try:
+                yield
+            finally:
+                self._depth -= 1
+                if self._depth == 0 and self._lock_file is not None:
+                    fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+                    self._lock_file.close()
+                    self._lock_file = None
+
+    # -------------------------
+    # Load and Save
+    # -------------------------
+    def signature(self):
+        return _file_signature(self.path)
+
+    def is_stale(self):
+        return self.signature() != self._signature
+
+    def load(self):
+        self._signature = self.signature()
+        return self._read_snapshot()
+
+    def _read_snapshot(self):
+        if not os.path.exists(self.path):
+            return self.default()
+        with open(self.path, 'r') as f:
+            return json.load(f)
+
+    def save(self, data):
+        with self.lock():
+            atomic_write_json(self.path, data)
+            self._signature = self.signature()
+
+
+class JournalStore(JsonStore):
+    """
+    A JSON snapshot plus an append-only JSON-lines journal.
+
+    Writers append one line per change; `compact()` folds the journal back
+    into the snapshot. Other processes pick up new journal lines
+    incrementally via `changes()` and only reload everything after a
+    compaction.
+    """
+
+    # A rotated journal older than this is a leftover from a crashed compaction.
+    STALE_COMPACTION_SECONDS = 60
+
+    def __init__(self, path, journal_path, default=list):
+        super().__init__(path, default)
+        self.journal_path = journal_path
+        self.old_journal_path = journal_path + ".old"
+        self._journal_ino = None
+        self._journal_offset = 0
+        self.entries_since_compaction = 0
+
+    def signature(self):
+        return (
+            _file_signature(self.path),
+            _file_signature(self.old_journal_path),
+            _file_signature(self.journal_path),
+        )
+
+    @staticmethod
+    def _read_lines(path, offset=0):
+        """Yield (entry, end_offset) for each complete line after `offset`."""
+        if not os.path.exists(path):
+            return
+        with open(path, 'rb') as f:
+            f.seek(offset)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    # Torn last line from a crash mid-append; nothing after it.
+                    return
+                offset += len(line)
+                yield json.loads(line), offset
+
+    def _remember_journal(self, offset):
+        sig = _file_signature(self.journal_path)
+        self._journal_ino = sig[0] if sig else None
+        self._journal_offset = offset
+
+    def load(self):
+        """Return (snapshot, journal_entries)."""
+        with self.lock():
+            snapshot = super().load()
+            entries = [entry for entry, _ in self._read_lines(self.old_journal_path)]
+            offset = 0
+            for entry, offset in self._read_lines(self.journal_path):
+                entries.append(entry)
+            self._remember_journal(offset)
+            self._signature = self.signature()
+        self.entries_since_compaction = len(entries)
+        return snapshot, entries
+
+    def changes(self):
+        """
+        Cheap check for writes by other processes.
+        Returns None if nothing changed, a list of new journal entries if
+        only the journal grew, or the string "reload" after a compaction.
+        """
+        sig = self.signature()
+        if sig == self._signature:
+            return None
+        if sig[0] != self._signature[0] or sig[1] != self._signature[1]:
+            return "reload"
+        journal_sig = sig[2]
+        if journal_sig is not None and self._journal_ino is not None and journal_sig[0] != self._journal_ino:
+            return "reload"
+
+        entries = []
+        offset = self._journal_offset
+        for entry, offset in self._read_lines(self.journal_path, self._journal_offset):
+            entries.append(entry)
+        self._remember_journal(offset)
+        self._signature = sig
+        self.entries_since_compaction += len(entries)
+        return entries
+
+    def append(self, entry):
+        """
+        Append one entry to the journal: O(1) regardless of history size.
+        Callers must hold `lock()` and have applied `changes()` first.
+        """
+        line = json.dumps(entry, separators=(",", ":"), default=json_default) + "\n"
+        with self.lock():
+            with open(self.journal_path, 'a') as f:
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+                offset = f.tell()
+            self._remember_journal(offset)
+            self._signature = self.signature()
+            self.entries_since_compaction += 1
+
+    def _write_temp(self, data):
+        """Serialize a snapshot to a synced temp file next to `path`; returns its path."""
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-", suffix=".json")
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(data, f, indent=4, default=json_default)
+                f.flush()
+                os.fsync(f.fileno())
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+        return tmp_path
+
+    def save(self, data):
+        """Write a full snapshot and drop the journal."""
+        with self.lock():
+            os.replace(self._write_temp(data), self.path)
+            for path in (self.journal_path, self.old_journal_path):
+                if os.path.exists(path):
+                    os.remove(path)
+            self._remember_journal(0)
+            self._signature = self.signature()
+            self.entries_since_compaction = 0
+
+    def compact(self, snapshot_fn):
+        """
+        Fold the journal into a new snapshot.
+
+        `snapshot_fn` is called under the lock once the journal has been
+        rotated and must return the data to persist; callers sync first. The
+        snapshot itself is serialized outside the lock so writers keep
+        appending to the fresh journal meanwhile. Returns False if another
+        process is already compacting.
+        """
+        with self.lock():
+            if os.path.exists(self.old_journal_path):
+                age = time.time() - os.path.getmtime(self.old_journal_path)
+                if age < self.STALE_COMPACTION_SECONDS:
+                    return False
+                # Crashed compaction: keep its entries and take it over.
+                if os.path.exists(self.journal_path):
+                    with open(self.journal_path, 'rb') as src, open(self.old_journal_path, 'ab') as dst:
+                        dst.write(src.read())
+                    os.remove(self.journal_path)
+                os.utime(self.old_journal_path)
+            elif os.path.exists(self.journal_path):
+                os.replace(self.journal_path, self.old_journal_path)
+            data = snapshot_fn()
+            self._remember_journal(0)
+            self._signature = self.signature()
+            self.entries_since_compaction = 0
+
+        tmp_path = self._write_temp(data)
+
+        with self.lock():
+            os.replace(tmp_path, self.path)
+            if os.path.exists(self.old_journal_path):
+                os.remove(self.old_journal_path)
+            # Keep the last journal state we actually read, so lines other
+            # processes appended meanwhile are still picked up by changes().
+            self._signature = (_file_signature(self.path), None, self._signature[2])
+        return True
+
+
+# -------------------------
+# Collections
+# -------------------------
+class JsonCollection:
+    """
+    A list of records kept in memory and persisted to a JSON file.
+
+    With a `journal_path`, each change is appended to a JournalStore and
+    compacted into the snapshot in the background; without one, every
+    change rewrites the whole file atomically. Records are held as
+    `record_type` (see managers/records.py) when given, else as dicts.
+    """
+
+    def __init__(self, path, journal_path=None, newest_first=False, email_of=None,
+                 fields=None, compact_threshold=500, record_type=None):
+        if journal_path:
+            self.store = JournalStore(path, journal_path)
+        else:
+            self.store = JsonStore(path)
+        self.journaled = journal_path is not None
+        self.newest_first = newest_first
+        self.email_of = email_of
+        # Queryable fields: name -> fn(record) giving a sortable key
+        self.fields = fields or {}
+        self.compact_threshold = compact_threshold
+        self.record_type = record_type
+        self.records = []
+        # id -> record and lower-cased email -> [records], in list order
+        self._by_id = {}
+        self._by_email = {}
+        # field name -> sorted [(key, id)], for range filters and ordering
+        self._sorted = {name: [] for name in self.fields}
+        self._compacting = False
+
+    # -------------------------
+    # Load and Sync
+    # -------------------------
+    def load(self):
+        if self.journaled:
+            snapshot, entries = self.store.load()
+            self._set_records([self._wrap(r) for r in snapshot])
+            for entry in entries:
+                self._apply(entry)
+        else:
+            self._set_records([self._wrap(r) for r in self.store.load()])
+
+    def sync(self):
+        """Pick up changes written by other worker processes."""
+        if self.journaled:
+            changes = self.store.changes()
+            if changes == "reload":
+                self.load()
+            elif changes:
+                for entry in changes:
+                    self._apply(entry)
+        elif self.store.is_stale():
+            self.load()
+
+    @contextmanager
+    def transaction(self):
+        """Hold the inter-process lock on a freshly synced collection."""
+        with self.store.lock():
+            self.sync()
+            yield
+
+    def save(self):
+        self.store.save(self.records)
+
+    @property
+    def version(self):
+        """
+        Changes on every write, and is the same in every process that has
+        synced the same file state (it is derived from the file stat).
+        """
+        return hash(self.store._signature)
+
+    # -------------------------
+    # Indexes
+    # -------------------------
+    @staticmethod
+    def _id_key(rid):
+        try:
+            return int(rid)
+        except (TypeError, ValueError):
+            return None
+
+    def _wrap(self, record):
+        """Parsed JSON -> record_type."""
+        return self.record_type.from_dict(record) if self.record_type else record
+
+    def _email_key(self, record):
+        return (self.email_of(record) or "").lower()
+
+    def _field_key(self, name, record):
+        return (self.fields[name](record), record["id"])
+
+    def _set_records(self, records):
+        self.records = records
+        self._by_id = {r["id"]: r for r in records}
+        self._by_email = {}
+        if self.email_of is not None:
+            for r in records:
+                self._by_email.setdefault(self._email_key(r), []).append(r)
+        self._sorted = {
+            name: sorted(self._field_key(name, r) for r in records)
+            for name in self.fields
+        }
+
+    def _index(self, record):
+        self._by_id[record["id"]] = record
+        self._index_email(record)
+        for name in self.fields:
+            insort(self._sorted[name], self._field_key(name, record))
+
+    def _unindex(self, record):
+        self._by_id.pop(record["id"], None)
+        self._unindex_email(record)
+        for name in self.fields:
+            self._sorted_remove(name, record)
+
+    def _index_email(self, record):
+        if self.email_of is not None:
+            matches = self._by_email.setdefault(self._email_key(record), [])
+            if self.newest_first:
+                matches.insert(0, record)
+            else:
+                matches.append(record)
+
+    def _unindex_email(self, record):
+        if self.email_of is not None:
+            key = self._email_key(record)
+            matches = [r for r in self._by_email.get(key, []) if r is not record]
+            if matches:
+                self._by_email[key] = matches
+            else:
+                self._by_email.pop(key, None)
+
+    def _sorted_remove(self, name, record):
+        entries = self._sorted[name]
+        key = self._field_key(name, record)
+        i = bisect_left(entries, key)
+        if i < len(entries) and entries[i] == key:
+            del entries[i]
+
+    # -------------------------
+    # Queries
+    # -------------------------
+    def all(self):
+        return self.records
+
+    def count(self):
+        return len(self.all())
+
+    def get(self, rid):
+        return self._by_id.get(self._id_key(rid))
+
+    def get_many(self, rids):
+        """Records for the given ids, in the same order, skipping unknown ids."""
+        records = (self.get(rid) for rid in rids)
+        return [r for r in records if r is not None]
+
+    def find_by_email(self, email):
+        return list(self._by_email.get(email.lower(), ()))
+
+    def query(self, filters=None, sort=None, descending=True, offset=0, limit=50):
+        """
+        One page of records matching `filters`, ordered by the field `sort`
+        (or by id). Filters map "email" to an address, or a field name to a
+        value or an inclusive (low, high) range where either end may be None.
+        Returns (records, has_more).
+
+        The page is read off the sorted field indexes, so the cost follows
+        the page size and filter selectivity, not the collection size.
+        """
+        email, ranges = _split_filters(filters)
+
+        if email is not None:
+            candidates = [r for r in self.find_by_email(email) if self._matches(r, ranges)]
+            candidates.sort(key=self._sort_key(sort), reverse=descending)
+            return _page(candidates, offset, limit)
+
+        wanted = offset + limit + 1
+        # Walk the sort order, or collect the narrowest filtered range and sort it
+        # - whichever is expected to look at fewer records.
+        driver = None
+        if ranges:
+            spans = {name: self._span(name, *bounds) for name, bounds in ranges.items()}
+            driver = min(spans, key=lambda name: len(spans[name]))
+            span = spans[driver]
+            selectivity = max(len(span), 1) / max(len(self.records), 1)
+            if sort in ranges or wanted / selectivity <= len(span) * 4:
+                driver = None
+
+        if driver is None:
+            ordered = self._ordered(sort, descending, ranges.get(sort))
+            rest = {name: bounds for name, bounds in ranges.items() if name != sort}
+            if not rest:
+                return _page(ordered, offset, limit)
+            matching = (r for r in ordered if self._matches(r, rest))
+            return _page(list(islice(matching, wanted)), offset, limit)
+
+        candidates = [self._by_id[self._sorted[driver][i][1]] for i in span]
+        candidates = [r for r in candidates if self._matches(r, ranges)]
+        candidates.sort(key=self._sort_key(sort), reverse=descending)
+        return _page(candidates, offset, limit)
+
+    def _span(self, name, low, high):
+        """Positions in the sorted index of `name` whose key is within [low, high]."""
+        entries = self._sorted[name]
+        start = bisect_left(entries, (low,)) if low is not None else 0
+        end = bisect_right(entries, (high, float("inf"))) if high is not None else len(entries)
+        return range(start, max(start, end))
+
+    def scan(self, filters=None, sort=None, descending=True, chunk_size=500):
+        """
+        Yield every record matching `filters` in query() order. Works in
+        chunks that resume after the last key seen, so records inserted or
+        moved while a long export is being streamed don't shift the output.
+        """
+        email, ranges = _split_filters(filters)
+        if email is not None:
+            matches = [r for r in self.find_by_email(email) if self._matches(r, ranges)]
+            matches.sort(key=self._sort_key(sort), reverse=descending)
+            yield from matches
+            return
+
+        rest = {name: bounds for name, bounds in ranges.items() if name != sort}
+        after = None
+        while True:
+            records, after = self._chunk(sort, descending, ranges.get(sort), after, chunk_size)
+            if not records:
+                return
+            for record in records:
+                if not rest or self._matches(record, rest):
+                    yield record
+
+    def _chunk(self, sort, descending, bounds, after, size):
+        """Up to `size` records following the key `after` in sort order, and the new last key."""
+        if sort is None:
+            records = self.records
+            # bisect needs ascending keys, whichever way the list is stored
+            sign = -1 if self.newest_first else 1
+            forward = descending == self.newest_first
+            if after is None:
+                start = 0 if forward else len(records)
+            elif forward:
+                start = bisect_right(records, sign * after, key=lambda r: sign * r["id"])
+            else:
+                start = bisect_left(records, sign * after, key=lambda r: sign * r["id"])
+            page = records[start:start + size] if forward else records[max(0, start - size):start][::-1]
+            return page, page[-1]["id"] if page else after
+
+        entries = self._sorted[sort]
+        span = self._span(sort, *(bounds or (None, None)))
+        start, stop = span.start, span.stop
+        if after is not None:
+            if descending:
+                stop = min(stop, bisect_left(entries, after))
+            else:
+                start = max(start, bisect_right(entries, after))
+        if descending:
+            positions = range(stop - 1, max(start, stop - size) - 1, -1)
+        else:
+            positions = range(start, min(stop, start + size))
+        if not positions:
+            return [], after
+        return [self._by_id[entries[i][1]] for i in positions], entries[positions[-1]]
+
+    def _ordered(self, sort, descending, bounds=None):
+        """A lazily indexable sequence of records in `sort` order."""
+        if sort is None:
+            return self.records if descending == self.newest_first else _Reversed(self.records)
+        span = self._span(sort, *(bounds or (None, None)))
+        if descending:
+            span = span[::-1]
+        return _Mapped(span, lambda i: self._by_id[self._sorted[sort][i][1]])
+
+    def _sort_key(self, sort):
+        if sort is None:
+            return lambda r: r["id"]
+        return lambda r: self._field_key(sort, r)
+
+    def _matches(self, record, ranges):
+        for name, (low, high) in ranges.items():
+            key = self.fields[name](record)
+            if (low is not None and key < low) or (high is not None and key > high):
+                return False
+        return True
+
+    def next_id(self):
+        if not self.records:
+            return 1
+        return self.records[0 if self.newest_first else -1]["id"] + 1
+
+    # -------------------------
+    # Mutations (call inside transaction())
+    # -------------------------
+    def insert(self, record):
+        self._apply({"op": "create", "record": record})
+        self._persist({"op": "create", "record": record})
+
+    def update(self, record, **fields):
+        self._apply({"op": "update", "id": record["id"], "fields": fields})
+        if record is not self.get(record["id"]):
+            record.update(fields)
+        self._persist({"op": "update", "id": record["id"], "fields": fields})
+
+    def update_many(self, records, **fields):
+        """Apply the same field changes to several records in one write."""
+        ids = [r["id"] for r in records]
+        self._apply({"op": "update_many", "ids": ids, "fields": fields})
+        for record in records:
+            if record is not self.get(record["id"]):
+                record.update(fields)
+        self._persist({"op": "update_many", "ids": ids, "fields": fields})
+
+    def delete(self, rid):
+        self._apply({"op": "delete", "id": rid})
+        self._persist({"op": "delete", "id": rid})
+
+    def _apply(self, entry):
+        """Apply one change to the in-memory records. Replays are idempotent."""
+        op = entry["op"]
+        if op == "create":
+            record = self._wrap(entry["record"])
+            if self.get(record["id"]) is None:
+                if self.newest_first:
+                    self.records.insert(0, record)
+                else:
+                    self.records.append(record)
+                self._index(record)
+        elif op == "update":
+            self._update_record(self.get(entry["id"]), entry["fields"])
+        elif op == "update_many":
+            for rid in entry["ids"]:
+                self._update_record(self.get(rid), entry["fields"])
+        elif op == "delete":
+            record = self.get(entry["id"])
+            if record is not None:
+                self._unindex(record)
+                self.records = [r for r in self.records if r is not record]
+
+    def _update_record(self, record, fields):
+        if record is None:
+            return
+        # Only re-index what the change actually moves.
+        updated = {**record, **fields}
+        email_moved = (self.email_of is not None
+                       and self._email_key(updated) != self._email_key(record))
+        moved = [name for name, key_of in self.fields.items() if key_of(updated) != key_of(record)]
+        if email_moved:
+            self._unindex_email(record)
+        for name in moved:
+            self._sorted_remove(name, record)
+        record.update(fields)
+        if email_moved:
+            self._index_email(record)
+        for name in moved:
+            insort(self._sorted[name], self._field_key(name, record))
+
+    def _persist(self, entry):
+        if not self.journaled:
+            self.save()
+            return
+        self.store.append(entry)
+        if self.store.entries_since_compaction >= self.compact_threshold and not self._compacting:
+            self._compacting = True
+            threading.Thread(target=self.compact, daemon=True).start()
+
+    def compact(self):
+        """Fold the journal into a fresh snapshot."""
+        try:
+            with self.store.lock():
+                self.sync()
+                self.store.compact(lambda: list(self.records))
+        finally:
+            self._compacting = False
+
+
+def _split_filters(filters):
+    """Drop empty filters; return (email or None, {field: (low, high)})."""
+    email = None
+    ranges = {}
+    for name, value in (filters or {}).items():
+        if value is None or value == "" or value == (None, None):
+            continue
+        if name == "email":
+            email = value
+        elif isinstance(value, tuple):
+            ranges[name] = value
+        else:
+            ranges[name] = (value, value)
+    return email, ranges
+
+
+def _page(sequence, offset, limit):
+    page = list(sequence[offset:offset + limit + 1])
+    return page[:limit], len(page) > limit
+
+
+class _Mapped:
+    """Sliceable view applying `fn` to the items of a range."""
+
+    def __init__(self, positions, fn):
+        self.positions = positions
+        self.fn = fn
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            return _Mapped(self.positions[item], self.fn)
+        return self.fn(self.positions[item])
+
+    def __len__(self):
+        return len(self.positions)
+
+    def __iter__(self):
+        return map(self.fn, self.positions)
+
+
+class _Reversed(_Mapped):
+    def __init__(self, items):
+        super().__init__(range(len(items) - 1, -1, -1), items.__getitem__)
+
+
+def open_collection(name, newest_first=False, email_of=None, fields=None, record_type=None,
+                    journaled=False, lazy=False):
+    """
+    Build the collection for `name` ("products", "orders", "customers")
+    using the storage engine of the active config. With the JSON engine,
+    `lazy` journaled collections keep only an index in memory and read
+    record bodies from disk (see managers/lazy_storage.py).
+    """
+    from config import active_config
+
+    config = active_config()
+    if config.STORAGE_ENGINE == "sqlite":
+        from managers.sqlite_storage import SqliteCollection
+        return SqliteCollection(config.SQLITE_PATH, name, newest_first=newest_first,
+                                email_of=email_of, fields=fields, record_type=record_type)
+
+    path = os.path.join(config.DATA_DIR, f"{name}.json")
+    journal_path = os.path.join(config.DATA_DIR, f"{name}.journal.jsonl") if journaled else None
+    if lazy and journaled:
+        from managers.lazy_storage import LazyJsonCollection
+        return LazyJsonCollection(path, journal_path, newest_first=newest_first, email_of=email_of,
+                                  fields=fields, compact_threshold=config.JOURNAL_COMPACT_THRESHOLD,
+                                  record_type=record_type)
+    return JsonCollection(path, journal_path, newest_first=newest_first, email_of=email_of,
+                          fields=fields, compact_threshold=config.JOURNAL_COMPACT_THRESHOLD,
+                          record_type=record_type)
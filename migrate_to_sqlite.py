@@ -0,0 +1,27 @@
+"""
+One-shot migration of the JSON files in data/ into the SQLite store.
+
+    python migrate_to_sqlite.py [--data-dir data] [--db data/store.db]
+
+Then set STORAGE_ENGINE=sqlite in your .env.
+"""
+import argparse
+
+from config import Config
+from managers.sqlite_storage import migrate_from_json
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--data-dir", default=Config.DATA_DIR)
+    parser.add_argument("--db", default=Config.SQLITE_PATH)
+    args = parser.parse_args()
+
+    counts = migrate_from_json(args.data_dir, args.db)
+    for name, count in counts.items():
+        print(f"{name}: {count} records")
+    print(f"Migrated into {args.db}")
+
+
+if __name__ == "__main__":
+    main()
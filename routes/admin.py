@@ -1,19 +1,15 @@
-from flask import Blueprint, session, redirect, url_for, render_template, request
+from flask import Blueprint, current_app, session, redirect, url_for, render_template, request, jsonify, Response, stream_with_context
 from functools import wraps
 import json
-import os
-from werkzeug.security import check_password_hash, generate_password_hash
+from werkzeug.security import check_password_hash
 from managers.product_manager import ProductManager
 from managers.order_manager import OrderManager
 from managers.customer_manager import CustomerManager
+from managers.analytics import get_analytics
+from managers.image_store import InvalidImage, get_image_store, variant_name
+from utils.export import ORDER_LINE_COLUMNS, CUSTOMER_COLUMNS, order_lines, customer_rows, stream_csv, stream_jsonl
 
 
-ADMIN_USERNAME = os.getenv("ADMIN_USERNAME")
-ADMIN_PASSWORD_HASH = generate_password_hash(os.getenv("ADMIN_PASSWORD"))
-ProductManager.load_products()
-OrderManager.load_orders()
-CustomerManager.load_customers()
-
 admin_bp = Blueprint('admin', __name__, url_prefix='/admin')
 
 # -----------------------------
@@ -27,6 +23,48 @@ def admin_required(func):
         return redirect(url_for("admin.login"))
     return wrapper
 
+def page_args(default_per_page=50, max_per_page=200):
+    """(page, per_page, offset) from the query string, clamped to sane values."""
+    page = max(request.args.get("page", 1, type=int), 1)
+    per_page = min(max(request.args.get("per_page", default_per_page, type=int), 1), max_per_page)
+    return page, per_page, (page - 1) * per_page
+
+def uploaded_images():
+    """
+    Store the product form's uploaded image, if any. Returns its "images"
+    metadata or None; raises InvalidImage.
+    """
+    upload = request.files.get("image_file")
+    if not upload or not upload.filename:
+        return None
+    return get_image_store().save(upload.read(get_image_store().MAX_BYTES + 1))
+
+def analytics_rebuilding():
+    """
+    True while the sales aggregates are being (re)built. Starts building
+    them in the background if they never were, e.g. on a fresh install.
+    """
+    stats = get_analytics()
+    if stats.is_rebuilding():
+        return True
+    if not stats.is_built():
+        OrderManager.rebuild_analytics(only_if_missing=True)
+        return True
+    return False
+
+def stock_arg():
+    """
+    Units on hand from the product form; blank means stock isn't tracked.
+    Raises ValueError if it isn't a whole number.
+    """
+    value = (request.form.get("stock") or "").strip()
+    if not value:
+        return None
+    try:
+        return max(int(value), 0)
+    except ValueError:
+        raise ValueError("Stock must be a whole number, or blank for unlimited.") from None
+
 # -----------------------------
 # ADMIN LOGIN
 # -----------------------------
@@ -41,7 +79,9 @@ def login():
         username = request.form.get("username")
         password = request.form.get("password")
 
-        if username == ADMIN_USERNAME and check_password_hash(ADMIN_PASSWORD_HASH, password):
+        password_hash = current_app.config.get("ADMIN_PASSWORD_HASH")
+        if (username == current_app.config.get("ADMIN_USERNAME") and password_hash
+                and check_password_hash(password_hash, password or "")):
             session["is_admin"] = True
             session.permanent = True
             return redirect(url_for("admin.dashboard"))
@@ -57,25 +97,77 @@ def login():
 @admin_bp.route('/')
 @admin_required
 def dashboard():
-    orders = OrderManager.get_all()
-    customers = CustomerManager.get_all()
-    products = ProductManager.get_all()
+    analytics = get_analytics()
+    rebuilding = analytics_rebuilding()
+    summary = analytics.summary()
 
     return render_template(
         'admin/dashboard.html',
-        total_orders=len(orders),
-        total_customers=len(customers),
-        total_products=len(products)
+        total_orders=OrderManager.count(),
+        total_revenue=summary["revenue"],
+        orders_per_status=analytics.orders_per_status(),
+        top_products=analytics.top_products(5),
+        analytics_rebuilding=rebuilding,
+        total_customers=CustomerManager.count(),
+        total_products=ProductManager.count()
     )
 
+# -----------------------------
+# SALES ANALYTICS (JSON)
+# -----------------------------
+@admin_bp.route('/analytics')
+@admin_required
+def analytics():
+    stats = get_analytics()
+    limit = min(max(request.args.get("limit", 10, type=int), 1), 100)
+    return jsonify({
+        "rebuilding": analytics_rebuilding(),
+        "summary": stats.summary(),
+        "revenue_per_day": stats.revenue_per_day(
+            request.args.get("date_from") or None,
+            request.args.get("date_to") or None
+        ),
+        "orders_per_status": stats.orders_per_status(),
+        "top_products": stats.top_products(limit),
+        "top_customers": stats.top_customers(limit)
+    })
+
+@admin_bp.route('/analytics/rebuild', methods=['POST'])
+@admin_required
+def rebuild_analytics():
+    if not OrderManager.rebuild_analytics():
+        return jsonify({"success": False, "rebuilding": True, "message": "A rebuild is already running."}), 409
+    return jsonify({"success": True, "rebuilding": True}), 202
+
 # -----------------------------
 # VIEW ALL ORDERS
 # -----------------------------
 @admin_bp.route('/orders')
 @admin_required
 def view_orders():
-    orders = OrderManager.get_all()
-    return render_template('admin/view_orders.html', orders=orders)
+    page, per_page, offset = page_args()
+    filters = {
+        "status": request.args.get("status", "").strip(),
+        "email": request.args.get("email", "").strip(),
+        "date_from": request.args.get("date_from", "").strip(),
+        "date_to": request.args.get("date_to", "").strip(),
+    }
+    sort = request.args.get("sort", "date")
+    order = request.args.get("order", "desc")
+
+    orders, has_more = OrderManager.query(
+        **filters, sort=sort, descending=(order != "asc"), offset=offset, limit=per_page
+    )
+    return render_template(
+        'admin/view_orders.html',
+        orders=orders,
+        filters=filters,
+        sort=sort,
+        order=order,
+        page=page,
+        per_page=per_page,
+        has_more=has_more
+    )
 
 # -----------------------------
 # VIEW SINGLE ORDER
@@ -98,10 +190,10 @@ def order_details(oid):
 def update_order_status(oid):
     new_status = request.form.get("status")
 
-    order = OrderManager.get(oid)
-    order["status"] = new_status
+    order = OrderManager.update_status(oid, new_status)
+    if not order:
+        return "Order not found", 404
 
-    OrderManager.save_orders()
     from utils.email_utils import send_email
 
     send_email(
@@ -113,14 +205,64 @@ def update_order_status(oid):
 
     return redirect(url_for("admin.order_details", oid=oid))
 
+# -----------------------------
+# BULK UPDATE ORDER STATUS
+# -----------------------------
+@admin_bp.route('/orders/bulk-update', methods=['POST'])
+@admin_required
+def bulk_update_order_status():
+    new_status = request.form.get("status")
+    order_ids = request.form.getlist("order_ids")
+    if not new_status or not order_ids:
+        return redirect(url_for("admin.view_orders"))
+
+    orders = OrderManager.update_status_many(order_ids, new_status)
+
+    from utils.email_utils import send_emails
+
+    # Queued, not sent here: the outbox worker delivers them (and retries
+    # failures) without holding up the request
+    messages = [
+        (
+            order["user"]["email"],
+            "Order Status Updated",
+            f"Hello {order['user']['name']},\n\nYour order #{order['id']} status has been updated to: {new_status}.\n\nThank you for shopping with us!"
+        )
+        for order in orders
+    ]
+    queued = send_emails(messages) if messages else True
+
+    return render_template(
+        "admin/bulk_status_result.html",
+        status=new_status,
+        orders=orders,
+        queued=queued
+    )
+
 # -----------------------------
 # VIEW ALL CUSTOMERS
 # -----------------------------
 @admin_bp.route('/customers')
 @admin_required
 def view_customers():
-    customers = CustomerManager.get_all()
-    return render_template("admin/view_customers.html", customers=customers)
+    page, per_page, offset = page_args()
+    email = request.args.get("email", "").strip()
+    sort = request.args.get("sort", "")
+    order = request.args.get("order", "desc")
+
+    customers, has_more = CustomerManager.query(
+        email=email, sort=sort, descending=(order != "asc"), offset=offset, limit=per_page
+    )
+    return render_template(
+        "admin/view_customers.html",
+        customers=customers,
+        email=email,
+        sort=sort,
+        order=order,
+        page=page,
+        per_page=per_page,
+        has_more=has_more
+    )
 
 # -----------------------------
 # VIEW CUSTOMER DETAILS + ORDERS
@@ -133,9 +275,7 @@ def customer_details(cid):
     if not customer:
         return "Customer not found"
 
-    customer_orders = [
-        OrderManager.get(order_id) for order_id  in customer['orders'] 
-    ]
+    customer_orders = OrderManager.get_many(customer['orders'])
 
     return render_template(
         "admin/customer_details.html",
@@ -144,6 +284,43 @@ def customer_details(cid):
         total_orders = len(customer['orders'])
     )
 
+# -----------------------------
+# EXPORT ORDERS / CUSTOMERS (CSV or JSON lines)
+# -----------------------------
+EXPORT_TYPES = {"csv": "text/csv", "jsonl": "application/x-ndjson"}
+
+def export_response(rows, columns, name, fmt):
+    """Stream `rows` as a download; nothing is collected in memory."""
+    body = stream_csv(rows, columns) if fmt == "csv" else stream_jsonl(rows)
+    return Response(
+        stream_with_context(body),
+        mimetype=EXPORT_TYPES[fmt],
+        headers={"Content-Disposition": f"attachment; filename={name}.{fmt}"}
+    )
+
+@admin_bp.route('/export/orders.<fmt>')
+@admin_required
+def export_orders(fmt):
+    if fmt not in EXPORT_TYPES:
+        return "Unknown export format", 404
+
+    orders = OrderManager.scan(
+        status=request.args.get("status", "").strip(),
+        email=request.args.get("email", "").strip(),
+        date_from=request.args.get("date_from", "").strip(),
+        date_to=request.args.get("date_to", "").strip()
+    )
+    return export_response(order_lines(orders), ORDER_LINE_COLUMNS, "orders", fmt)
+
+@admin_bp.route('/export/customers.<fmt>')
+@admin_required
+def export_customers(fmt):
+    if fmt not in EXPORT_TYPES:
+        return "Unknown export format", 404
+
+    customers = CustomerManager.scan(email=request.args.get("email", "").strip())
+    return export_response(customer_rows(customers), CUSTOMER_COLUMNS, "customers", fmt)
+
 # -----------------------------
 # VIEW ALL PRODUCTS
 # -----------------------------
@@ -151,7 +328,8 @@ def customer_details(cid):
 @admin_required
 def manage_products():
     products = ProductManager.get_all()
-    return render_template("admin/manage_products.html", products=products)
+    stock = ProductManager.stock_levels()
+    return render_template("admin/manage_products.html", products=products, stock=stock)
 
 # -----------------------------
 # ADD PRODUCT
@@ -168,8 +346,17 @@ def add_product():
             "description": request.form.get("description"),
             "image": request.form.get("image")
         }
-
-        ProductManager.add_product(new_product)
+        try:
+            stock = stock_arg()
+            images = uploaded_images()
+        except (InvalidImage, ValueError) as e:
+            return render_template("admin/add_product.html", error=str(e)), 400
+        if images:
+            new_product["images"] = images
+            new_product["image"] = url_for("main.product_image", key=images["key"], filename=variant_name(images))
+
+        product = ProductManager.add_product(new_product)
+        ProductManager.set_stock(product["id"], stock)
 
         return redirect(url_for("admin.manage_products"))
 
@@ -181,8 +368,7 @@ def add_product():
 @admin_bp.route('/products/edit/<int:pid>', methods=['GET', 'POST'])
 @admin_required
 def edit_product(pid):
-    products = ProductManager.get_all()
-    product = next((p for p in products if p["id"] == pid), None)
+    product = ProductManager.get(pid)
 
     if not product:
         return "Product not found"
@@ -194,11 +380,27 @@ def edit_product(pid):
             "description": request.form.get("description"),
             "image": request.form.get("image")
         }
+        try:
+            stock = stock_arg()
+            images = uploaded_images()
+        except (InvalidImage, ValueError) as e:
+            return render_template("admin/edit_product.html", product=product,
+                                   stock=ProductManager.stock(pid), error=str(e)), 400
+        if images:
+            new_product["images"] = images
+            new_product["image"] = url_for("main.product_image", key=images["key"], filename=variant_name(images))
+        elif new_product["image"] != product["image"]:
+            # Switched to an image URL: the uploaded variants no longer apply
+            new_product["images"] = None
 
         ProductManager.update_product(pid, new_product)
+        # Only when changed: re-saving the count shown in the form would undo
+        # any sales made while it was open
+        if (request.form.get("stock") or "").strip() != request.form.get("stock_was", ""):
+            ProductManager.set_stock(pid, stock)
         return redirect(url_for("admin.manage_products"))
 
-    return render_template("admin/edit_product.html", product=product)
+    return render_template("admin/edit_product.html", product=product, stock=ProductManager.stock(pid))
 
 # -----------------------------
 # DELETE PRODUCT
@@ -1,16 +1,48 @@
-from flask import Blueprint, render_template, url_for, session, request, jsonify, flash, redirect
+from flask import Blueprint, render_template, url_for, session, request, jsonify, flash, redirect, abort, send_file
+import os
 from managers.product_manager import ProductManager
 from managers.order_manager import OrderManager
 from managers.customer_manager import CustomerManager
 from managers.cart_manager import CartManager
+from managers.search import ProductSearch
+from managers.order_tracking import OrderTracking
+from managers.stock import OutOfStock
+from managers.image_store import get_image_store, variant_name
+from utils.assets import CACHE_CONTROL
 from utils.email_utils import send_email
+from utils.page_cache import page_cache
+from utils.rate_limit import TokenBucketLimiter, rate_limited
+from config import Config
 
 main_bp = Blueprint('main', __name__)
 
-# Load data on app startup
-OrderManager.load_orders()
-ProductManager.load_products()
-CustomerManager.load_customers()
+# Drop cached storefront pages as soon as the catalog changes
+ProductManager.subscribe(page_cache.clear)
+# Keep the search index in step with product edits
+ProductManager.subscribe(ProductSearch.on_product_change)
+# Forget cached tracking results for customers whose orders change
+OrderManager.subscribe(OrderTracking.on_order_change)
+
+tracking_limiter = TokenBucketLimiter(
+    rate=Config.TRACKING_RATE_PER_MINUTE / 60,
+    burst=Config.TRACKING_BURST
+)
+
+
+@main_bp.record
+def configure_tracking(state):
+    """Size the tracking cache and rate limit from the config of the app being set up."""
+    config = state.app.config
+    OrderTracking.configure(config["TRACKING_CACHE_SIZE"], config["TRACKING_CACHE_TTL"])
+    tracking_limiter.configure(config["TRACKING_RATE_PER_MINUTE"] / 60, config["TRACKING_BURST"])
+
+
+@main_bp.before_app_request
+def sync_stores():
+    """Reload any store another worker process has written to since our last look."""
+    ProductManager.sync()
+    OrderManager.sync()
+    CustomerManager.sync()
 
 
 # ---------------------------
@@ -18,7 +50,11 @@ CustomerManager.load_customers()
 # ---------------------------
 @main_bp.route('/')
 def index():
-    return render_template('index.html', products=ProductManager.get_all())
+    return page_cache.render(
+        'index.html',
+        ProductManager.catalog_version(),
+        lambda: {"products": ProductManager.get_all()}
+    )
 
 
 # ---------------------------
@@ -29,7 +65,69 @@ def product_page(pid):
     product = ProductManager.get(pid)
     if not product:
         return "Product not found", 404
-    return render_template('product_page.html', product=product)
+    return page_cache.render(
+        'product_page.html',
+        ProductManager.catalog_version(),
+        lambda: {"product": product},
+        key=pid
+    )
+
+
+# ---------------------------
+# Product images
+# ---------------------------
+@main_bp.route('/images/<key>/<filename>')
+def product_image(key, filename):
+    path = get_image_store().path(key, filename)
+    if path is None or not os.path.isfile(path):
+        abort(404)
+    # Stored under a hash of the upload, so a URL's content never changes
+    response = send_file(path)
+    response.headers["Cache-Control"] = CACHE_CONTROL
+    return response
+
+
+@main_bp.app_template_global()
+def image_url(images, width=None, webp=False):
+    """URL of the smallest stored variant at least `width` pixels wide."""
+    return url_for('main.product_image', key=images["key"], filename=variant_name(images, width, webp))
+
+
+@main_bp.app_template_global()
+def image_srcset(images, webp=False):
+    return ", ".join(f"{image_url(images, w, webp)} {w}w" for w in images.get("widths") or [])
+
+
+# ---------------------------
+# Search
+# ---------------------------
+@main_bp.route('/search')
+def search():
+    query = request.args.get('q', '').strip()
+    results = ProductSearch.search(query, limit=60) if query else []
+    return render_template(
+        'search.html',
+        query=query,
+        products=[product for product, _ in results]
+    )
+
+
+@main_bp.route('/search/suggest')
+def search_suggest():
+    """Type-ahead matches for the search box; the last word may be partly typed."""
+    query = request.args.get('q', '')
+    limit = min(request.args.get('limit', 8, type=int), 20)
+    results = ProductSearch.search(query, limit=limit) if query.strip() else []
+    return jsonify([
+        {
+            "id": p["id"],
+            "name": p["name"],
+            "price": p["price"],
+            "url": url_for('main.product_page', pid=p["id"]),
+            "score": round(score, 3),
+        }
+        for p, score in results
+    ])
 
 
 # ---------------------------
@@ -42,28 +140,38 @@ def cart():
     return render_template('cart.html', cart_products=cart_products, total=total, total_qty=total_qty)
 
 
+def unknown_product():
+    return jsonify({"success": False, "message": "Unknown product."}), 400
+
+
 @main_bp.route('/add_to_cart', methods=['POST'])
 def add_to_cart():
-    data = request.get_json()
-    product_id = str(data.get('id'))
-    CartManager.add_to_cart(session, product_id)
+    data = request.get_json(silent=True)
+    product_id = CartManager.product_id(data.get('id')) if isinstance(data, dict) else None
+    if product_id is None:
+        return unknown_product()
+    added = CartManager.add_to_cart(session, product_id)
     total_items = CartManager.get_total_qty(session)
-    return jsonify({"message": "Added to cart successfully!", "cartCount": total_items})
+    if not added:
+        return jsonify({"success": False, "message": "No more of this item in stock.", "cartCount": total_items})
+    return jsonify({"success": True, "message": "Added to cart successfully!", "cartCount": total_items})
 
 
 @main_bp.route('/update_cart', methods=['POST'])
 def update_cart():
-    data = request.get_json()
-    product_id = str(data.get('id'))
+    data = request.get_json(silent=True)
+    product_id = CartManager.product_id(data.get('id')) if isinstance(data, dict) else None
+    if product_id is None:
+        return unknown_product()
     action = data.get('action')
     CartManager.update_cart(session, product_id, action)
 
-    cart_products, total, total_qty = CartManager.build_cart_details(session.get('cart', {}))
-    qty = session['cart'].get(product_id, 0)
+    total, total_qty = CartManager.get_totals(session)
+    qty = CartManager.get_cart(session).get(product_id, 0)
 
     return jsonify({
         "success": True,
-        "total": total,
+        "total": float(total),
         "total_qty": total_qty,
         "qty": qty
     })
@@ -71,12 +179,34 @@ def update_cart():
 
 @main_bp.route('/remove_item', methods=['POST'])
 def remove_item():
-    data = request.get_json()
+    # Not checked against the catalog: lines for deleted products must still go
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return unknown_product()
     product_id = str(data.get('id'))
     CartManager.remove_item(session, product_id)
 
-    cart_products, total, total_qty = CartManager.build_cart_details(session.get('cart', {}))
-    return jsonify({"success": True, "total": total, "total_qty": total_qty})
+    total, total_qty = CartManager.get_totals(session)
+    return jsonify({"success": True, "total": float(total), "total_qty": total_qty})
+
+
+@main_bp.route('/cart/batch', methods=['POST'])
+def cart_batch():
+    """Apply several add/update/remove operations at once (see CartManager.apply_batch)."""
+    data = request.get_json(silent=True)
+    operations = data.get('operations') if isinstance(data, dict) else None
+    try:
+        quantities = CartManager.apply_batch(session, operations)
+    except ValueError as e:
+        return jsonify({"success": False, "message": str(e)}), 400
+
+    total, total_qty = CartManager.get_totals(session)
+    return jsonify({
+        "success": True,
+        "total": float(total),
+        "total_qty": total_qty,
+        "items": quantities
+    })
 
 
 @main_bp.route('/cart_count')
@@ -115,19 +245,31 @@ def checkout_details():
         # 2. Build cart product list
         cart_products, total, total_qty = CartManager.build_cart_details(cart)
 
-        # 3. Create order
-        order = OrderManager.add_order(user_data=user_data, items=cart_products, total=total)
+        # 3. Hold the stock, so concurrent buyers can't sell the same jars,
+        # then create the order (which sells the held stock)
+        try:
+            hold = CartManager.reserve_stock(cart_products)
+            order = OrderManager.add_order(user_data=user_data, items=cart_products, total=total, reservation=hold)
+        except OutOfStock as e:
+            product = ProductManager.get(e.product_id)
+            name = product["name"] if product else "an item"
+            if e.available > 0:
+                flash(f"Sorry, only {e.available} of {name} left in stock.", "warning")
+            else:
+                flash(f"Sorry, {name} just sold out.", "warning")
+            return redirect(url_for('main.cart'))
+
         order_id = order["id"]
 
-        # 4. Update customer
+        # 5. Update customer
         CustomerManager.add_or_update_customer(user_data, order_id)
 
-        # 5. Clear cart + save user session
+        # 6. Clear cart + save user session
         CartManager.clear_cart(session)
         session['user_info'] = user_data
         session.modified = True
 
-        # 6. Send confirmation email
+        # 7. Send confirmation email
         send_email(
             to=user_data["email"],
             subject="Your Order Has Been Placed",
@@ -162,6 +304,7 @@ def checkout_success():
 # Order tracking
 # ---------------------------
 @main_bp.route('/track', methods=['GET', 'POST'])
+@rate_limited(tracking_limiter)
 def track_order():
     if request.method == "POST":
         email = request.form.get("email").strip().lower()
@@ -170,9 +313,10 @@ def track_order():
 
 
 @main_bp.route('/track/email/<email>')
+@rate_limited(tracking_limiter)
 def track_by_email(email):
     email = email.lower()
-    user_orders = OrderManager.get_by_email(email)
+    user_orders = OrderTracking.orders_for(email)
     if not user_orders:
         return render_template("track_not_found.html", email=email)
     return render_template("track_result_email.html", orders=user_orders, email=email)
@@ -57,76 +57,167 @@ document.addEventListener('DOMContentLoaded', async () => {
     });
 
     // -----------------------------
-    // INCREASE / DECREASE QUANTITY
+    // CART CHANGES (+ / - / REMOVE)
     // -----------------------------
-    document.querySelectorAll('.increase-btn, .decrease-btn').forEach(btn => {
-        btn.addEventListener('click', async () => {
-            const id = btn.getAttribute('data-id');
-            const action = btn.classList.contains('increase-btn') ? 'increase' : 'decrease';
+    // Clicks update the page at once; the new quantities are sent together
+    // as one /cart/batch request when the clicks pause, so tapping "+" ten
+    // times costs one round-trip instead of ten.
+    const pendingQty = new Map();   // product id -> quantity to send
+    let sendingQty = new Map();     // ... and those in the batch in flight
+    let flushTimer = null;
+    let inFlight = null;
+
+    function queueQuantity(id, quantity) {
+        pendingQty.set(id, quantity);
+        clearTimeout(flushTimer);
+        flushTimer = setTimeout(flushCart, 300);
+    }
 
-            try {
-                const res = await fetch('/update_cart', {
-                    method: 'POST',
-                    headers: { 
-                        'Content-Type': 'application/json',
-                        'X-CSRFToken': csrfToken
-                    },
-                    body: JSON.stringify({ id, action })
-                });
-                const data = await res.json();
+    function postBatch(quantities, keepalive = false) {
+        const operations = [...quantities].map(([id, quantity]) =>
+            quantity > 0 ? { op: 'update', id, quantity } : { op: 'remove', id });
+        return fetch('/cart/batch', {
+            method: 'POST',
+            keepalive,
+            headers: {
+                'Content-Type': 'application/json',
+                'X-CSRFToken': csrfToken
+            },
+            body: JSON.stringify({ operations })
+        });
+    }
 
-                if (data.success) {
-                    const qtyElement = document.getElementById(`qty-${id}`);
-                    qtyElement.textContent = data.qty;
+    async function flushCart() {
+        clearTimeout(flushTimer);
+        // One batch at a time, so the server applies them in click order
+        while (inFlight) await inFlight;
+        if (!pendingQty.size) return;
 
-                    // Update totals
-                    document.getElementById('total-price').textContent = data.total.toFixed(2);
-                    document.getElementById('total-items').textContent = data.total_qty;
+        sendingQty = new Map(pendingQty);
+        pendingQty.clear();
 
-                    // Update navbar counter
-                    updateCartCounter(data.total_qty);
-                }
-            } catch (err) {
+        inFlight = postBatch(sendingQty)
+            .then(res => res.json())
+            .then(data => data.success ? showCartTotals(data) : resyncCart(data.message))
+            .catch(err => {
                 console.error(err);
-            }
+                resyncCart();
+            })
+            .finally(() => {
+                sendingQty = new Map();
+                inFlight = null;
+            });
+        await inFlight;
+    }
+
+    // The page no longer matches the saved cart (a rejected batch, or the
+    // network failed): reload it to show what the server actually has
+    function resyncCart(message) {
+        pendingQty.clear();
+        if (message) alert(message);
+        window.location.reload();
+    }
+
+    function showCartTotals(data) {
+        // The server may have capped a quantity (stock); show what it kept,
+        // unless the customer has clicked again since
+        Object.entries(data.items).forEach(([id, quantity]) => {
+            const qtyElement = document.getElementById(`qty-${id}`);
+            if (qtyElement && !pendingQty.has(id)) qtyElement.textContent = quantity;
+        });
+
+        document.getElementById('total-price').textContent = data.total.toFixed(2);
+        document.getElementById('total-items').textContent = data.total_qty;
+        localStorage.setItem('cartCount', data.total_qty);
+        updateCartCounter(data.total_qty);
+
+        if (data.total_qty === 0) {
+            document.querySelector('.col-md-8').innerHTML = "<p>Your cart is empty.</p>";
+        }
+    }
+
+    document.querySelectorAll('.increase-btn, .decrease-btn').forEach(btn => {
+        btn.addEventListener('click', () => {
+            const id = btn.getAttribute('data-id');
+            const qtyElement = document.getElementById(`qty-${id}`);
+            const current = parseInt(qtyElement.textContent, 10) || 1;
+            const quantity = btn.classList.contains('increase-btn') ? current + 1 : Math.max(1, current - 1);
+            if (quantity === current) return;
+
+            qtyElement.textContent = quantity;
+            queueQuantity(id, quantity);
         });
     });
 
-    // -----------------------------
-    // REMOVE ITEM
-    // -----------------------------
     document.querySelectorAll('.remove-btn').forEach(btn => {
-        btn.addEventListener('click', async () => {
+        btn.addEventListener('click', () => {
             const id = btn.getAttribute('data-id');
-            try {
-                const res = await fetch('/remove_item', {
-                    method: 'POST',
-                    headers: { 
-                        'Content-Type': 'application/json',
-                        'X-CSRFToken': csrfToken
-                    },
-                    body: JSON.stringify({ id })
-                });
-                const data = await res.json();
-
-                if (data.success) {
-                    btn.closest('.card').remove();
-                    document.getElementById('total-price').textContent = data.total.toFixed(2);
-                    document.getElementById('total-items').textContent = data.total_qty;
+            btn.closest('.card').remove();
+            queueQuantity(id, 0);
+        });
+    });
 
-                    // Update navbar counter
-                    localStorage.setItem('cartCount', data.total_qty);
-                    updateCartCounter(data.total_qty);
+    // Don't lose clicks still waiting for the debounce when the page goes
+    // away. The request must start inside the handler (awaiting anything
+    // first would be too late), so it can't wait for a batch in flight;
+    // it repeats that batch's quantities instead, in case leaving the page
+    // cancelled it. (sendBeacon can't carry the CSRF header.)
+    window.addEventListener('pagehide', () => {
+        clearTimeout(flushTimer);
+        if (!pendingQty.size && !sendingQty.size) return;
+        postBatch(new Map([...sendingQty, ...pendingQty]), true).catch(err => console.error(err));
+        pendingQty.clear();
+    });
 
-                    if (data.total_qty === 0) {
-                        document.querySelector('.col-md-8').innerHTML = "<p>Your cart is empty.</p>";
-                    }
-                }
-            } catch (err) {
-                console.error(err);
+    // -----------------------------
+    // SEARCH TYPE-AHEAD
+    // -----------------------------
+    const searchInput = document.getElementById('search-input');
+    const suggestions = document.getElementById('search-suggestions');
+    if (searchInput && suggestions) {
+        let timer = null;
+        let latest = 0;
+
+        const hideSuggestions = () => suggestions.classList.remove('show');
+
+        searchInput.addEventListener('input', () => {
+            clearTimeout(timer);
+            const query = searchInput.value;
+            if (!query.trim()) {
+                hideSuggestions();
+                return;
             }
+            timer = setTimeout(async () => {
+                const request = ++latest;
+                try {
+                    const res = await fetch(`/search/suggest?q=${encodeURIComponent(query)}`);
+                    const results = await res.json();
+                    // Ignore answers to queries the user has already typed past
+                    if (request !== latest) return;
+
+                    suggestions.innerHTML = '';
+                    results.forEach(item => {
+                        const li = document.createElement('li');
+                        const link = document.createElement('a');
+                        link.className = 'dropdown-item d-flex justify-content-between';
+                        link.href = item.url;
+                        link.textContent = item.name;
+                        const price = document.createElement('span');
+                        price.className = 'text-muted ms-3';
+                        price.textContent = `$${item.price}`;
+                        link.appendChild(price);
+                        li.appendChild(link);
+                        suggestions.appendChild(li);
+                    });
+                    suggestions.classList.toggle('show', results.length > 0);
+                } catch (err) {
+                    console.error(err);
+                }
+            }, 150);
         });
-    });
+
+        searchInput.addEventListener('blur', () => setTimeout(hideSuggestions, 200));
+    }
 
     // -----------------------------
     // CHECKOUT BUTTON
@@ -136,6 +227,7 @@ document.addEventListener('DOMContentLoaded', async () => {
         checkoutBtn.addEventListener('click', async (e) => {
             e.preventDefault();
             try {
+                await flushCart();
                 const res = await fetch('/checkout', {
                     method: 'POST',
                     headers: { 
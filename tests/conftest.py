@@ -0,0 +1,45 @@
+import json
+import multiprocessing
+
+import pytest
+
+from config import Config, use_config
+
+PRODUCTS = [
+    {"id": 1, "name": "Strawberry Jam", "description": "", "price": 5.99, "image": "", "status": "available"},
+    {"id": 2, "name": "Apricot Jam", "description": "", "price": 6.75, "image": "", "status": "available"},
+    {"id": 3, "name": "Mango Jam", "description": "", "price": 7.5, "image": "", "status": "available"},
+]
+
+
+@pytest.fixture
+def config(tmp_path):
+    """A config whose data files and databases all live under tmp_path, made the active one."""
+    data_dir = tmp_path / "data"
+    data_dir.mkdir()
+    (data_dir / "products.json").write_text(json.dumps(PRODUCTS))
+
+    class TestConfig(Config):
+        DATA_DIR = str(data_dir)
+        SQLITE_PATH = str(data_dir / "store.db")
+        OUTBOX_PATH = str(data_dir / "outbox.db")
+        ANALYTICS_DB_PATH = str(data_dir / "analytics.db")
+        IMAGE_DIR = str(data_dir / "images")
+        STOCK_DB_PATH = str(data_dir / "stock.db")
+        CART_DB_PATH = str(data_dir / "carts.db")
+        PROFILE_DIR = str(data_dir / "profiles")
+
+    use_config(TestConfig)
+    yield TestConfig
+    use_config(Config)
+
+
+def run_in_processes(target, *arg_lists, timeout=60):
+    """Run target(*args) in one forked process per argument tuple and wait for all of them."""
+    context = multiprocessing.get_context("fork")
+    processes = [context.Process(target=target, args=args) for args in arg_lists]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join(timeout)
+        assert process.exitcode == 0, f"{process.name} exited with {process.exitcode}"
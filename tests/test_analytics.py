@@ -0,0 +1,107 @@
+import json
+import threading
+
+import pytest
+
+from managers.analytics import get_analytics
+from managers.order_manager import OrderManager
+from managers.product_manager import ProductManager
+
+CUSTOMERS = [
+    {"name": "Ayesha", "email": "ayesha@example.com", "phone": "1", "address": "a"},
+    {"name": "Bilal", "email": "Bilal@Example.com", "phone": "2", "address": "b"},
+    {"name": "Chen", "email": "chen@example.com", "phone": "3", "address": "c"},
+]
+STATUSES = ["Pending", "Shipped", "Delivered", "Cancelled"]
+
+
+def line(pid, quantity):
+    price = {1: 5.99, 2: 6.75, 3: 7.5}[pid]
+    return {"id": pid, "name": f"Jam {pid}", "price": price, "quantity": quantity,
+            "subtotal": round(price * quantity, 2)}
+
+
+def make_order(n):
+    items = [line(1 + n % 3, 1 + n % 4)] + ([line(1 + (n + 1) % 3, 2)] if n % 2 else [])
+    return {
+        "id": n,
+        "user": CUSTOMERS[n % 3],
+        "items": items,
+        "total": round(sum(item["subtotal"] for item in items), 2),
+        "datetime": f"2025-03-{1 + n % 5:02d} 12:00:00",
+        "status": STATUSES[n % 4],
+    }
+
+
+@pytest.fixture
+def analytics(config):
+    with open(f"{config.DATA_DIR}/orders.json", "w") as f:
+        json.dump([make_order(n) for n in range(20, 0, -1)], f)
+    ProductManager.load_products()
+    OrderManager.load_orders()
+    assert OrderManager.rebuild_analytics(wait=True)
+    return get_analytics()
+
+
+def aggregates(analytics):
+    """Everything the dashboard reads, in an order that doesn't depend on ties."""
+    return {
+        "summary": analytics.summary(),
+        "statuses": analytics.orders_per_status(),
+        "days": analytics.revenue_per_day(),
+        "products": sorted(analytics.top_products(100), key=lambda p: p["id"]),
+        "customers": sorted(analytics.top_customers(100), key=lambda c: c["email"]),
+    }
+
+
+def rebuilt(analytics):
+    assert OrderManager.rebuild_analytics(wait=True)
+    return aggregates(analytics)
+
+
+def change_orders():
+    """New orders, status changes, and cancellations undone and redone."""
+    for n in range(3):
+        OrderManager.add_order(CUSTOMERS[n], [line(1 + n, 3)], round(line(1 + n, 3)["subtotal"], 2))
+    OrderManager.update_status(1, "Shipped")          # Shipped -> Shipped: no change
+    OrderManager.update_status(2, "Cancelled")
+    OrderManager.update_status(4, "Pending")          # un-cancelled
+    OrderManager.update_status_many([5, 6, 8, 21], "Cancelled")
+    OrderManager.update_status(21, "Delivered")
+
+
+def test_incremental_updates_match_a_rebuild(analytics):
+    initial = aggregates(analytics)
+    assert initial["summary"]["orders"] == 20
+    assert initial == rebuilt(analytics)
+
+    change_orders()
+    incremental = aggregates(analytics)
+
+    assert incremental["summary"]["orders"] == 23
+    assert incremental["statuses"]["cancelled"] == initial["statuses"]["cancelled"] + 4
+    assert incremental == rebuilt(analytics)
+
+
+def test_changes_made_during_a_rebuild_are_not_lost(analytics):
+    counting, resume = threading.Event(), threading.Event()
+
+    def slow_orders():
+        # Count part of the orders, then let the test change orders mid-rebuild
+        for n, order in enumerate(list(OrderManager.get_all())):
+            if n == 10:
+                counting.set()
+                assert resume.wait(10)
+            yield order
+
+    thread = get_analytics().start_rebuild(slow_orders)
+    assert counting.wait(10)
+    assert not OrderManager.rebuild_analytics()  # one rebuild at a time
+    change_orders()
+    resume.set()
+    thread.join(10)
+
+    assert not analytics.is_rebuilding()
+    after = aggregates(analytics)
+    assert after["summary"]["orders"] == 23
+    assert after == rebuilt(analytics)
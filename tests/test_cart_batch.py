@@ -0,0 +1,101 @@
+from decimal import Decimal
+
+import pytest
+
+from managers.cart_manager import CartManager
+from managers.cart_store import ServerCartBackend
+from managers.product_manager import ProductManager
+
+
+class Session(dict):
+    """Stands in for Flask's session: a dict with a `modified` flag."""
+
+    modified = False
+
+
+@pytest.fixture
+def session(config):
+    ProductManager.load_products()
+    return Session()
+
+
+def test_batch_applies_every_operation_in_order(session):
+    CartManager.add_to_cart(session, "3")
+
+    quantities = CartManager.apply_batch(session, [
+        {"op": "add", "id": 1, "quantity": 2},
+        {"op": "add", "id": "1"},
+        {"op": "update", "id": 2, "quantity": 4},
+        {"op": "remove", "id": 3},
+    ])
+
+    assert quantities == {"1": 3, "2": 4, "3": 0}
+    assert CartManager.get_cart(session) == {"1": 3, "2": 4}
+    assert CartManager.get_totals(session) == (Decimal("5.99") * 3 + Decimal("6.75") * 4, 7)
+
+
+@pytest.mark.parametrize("operations", [
+    None,
+    {"op": "add", "id": 1},
+    [],
+    [{"op": "add", "id": 1}] * (CartManager.MAX_BATCH_OPERATIONS + 1),
+    ["add 1"],
+    [{"op": "delete", "id": 1}],
+    [{"op": "add", "id": 42}],
+    [{"op": "add", "id": "abc"}],
+    [{"op": "add"}],
+    [{"op": "add", "id": 1, "quantity": 0}],
+    [{"op": "update", "id": 1}],
+    [{"op": "update", "id": 1, "quantity": -1}],
+    [{"op": "update", "id": 1, "quantity": CartManager.MAX_LINE_QUANTITY + 1}],
+    [{"op": "update", "id": 1, "quantity": "2"}],
+    [{"op": "update", "id": 1, "quantity": 2.0}],
+    [{"op": "update", "id": 1, "quantity": True}],
+])
+def test_malformed_batches_are_rejected(session, operations):
+    with pytest.raises(ValueError):
+        CartManager.apply_batch(session, operations)
+
+
+def test_a_bad_operation_leaves_the_cart_untouched(session):
+    CartManager.add_to_cart(session, "1")
+
+    with pytest.raises(ValueError):
+        CartManager.apply_batch(session, [
+            {"op": "update", "id": 1, "quantity": 5},
+            {"op": "add", "id": 2},
+            {"op": "add", "id": 42},
+        ])
+
+    assert CartManager.get_cart(session) == {"1": 1}
+    assert CartManager.get_totals(session) == (Decimal("5.99"), 1)
+
+
+def test_quantities_are_capped_at_the_stock(session):
+    ProductManager.set_stock(2, 3)
+
+    quantities = CartManager.apply_batch(session, [{"op": "add", "id": 2, "quantity": 5}])
+
+    assert quantities == {"2": 3}
+    assert CartManager.get_cart(session) == {"2": 3}
+
+
+def test_product_id_accepts_only_catalog_products(session):
+    assert CartManager.product_id(2) == "2"
+    assert CartManager.product_id("2") == "2"
+    assert [CartManager.product_id(v) for v in (42, "abc", None, "-1", "1.0")] == [None] * 5
+
+
+def test_server_carts_keep_both_of_two_concurrent_changes(tmp_path, session):
+    backend = ServerCartBackend(str(tmp_path / "carts.db"))
+    backend.update(session, lambda state: state.setdefault("cart", {}).update({"1": 1}))
+    # Two requests from the same browser, both sent with the same cookie
+    first, second = Session(session), Session(session)
+
+    backend.update(first, lambda state: state["cart"].update({"2": 1}))
+    backend.update(second, lambda state: state["cart"].update({"3": 2}))
+
+    assert backend.load(second)["cart"] == {"1": 1, "2": 1, "3": 2}
+    # load() hands out a copy, not the cached cart
+    backend.load(second)["cart"]["1"] = 99
+    assert backend.load(second)["cart"]["1"] == 1
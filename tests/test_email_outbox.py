@@ -0,0 +1,135 @@
+import time
+
+import pytest
+
+from utils.email_outbox import EmailOutbox
+
+
+class FakeSMTP:
+    """smtp_factory stand-in: records what is sent, fails while `failures` > 0."""
+
+    sent = []
+    failures = 0
+    timeouts = []
+    delay = 0
+
+    def __init__(self, host, port, timeout=None):
+        FakeSMTP.timeouts.append(timeout)
+
+    def starttls(self):
+        pass
+
+    def login(self, *args):
+        pass
+
+    def send_message(self, message):
+        time.sleep(FakeSMTP.delay)
+        if FakeSMTP.failures:
+            FakeSMTP.failures -= 1
+            raise OSError("mail server unavailable")
+        FakeSMTP.sent.append(message["To"])
+
+    def quit(self):
+        pass
+
+
+@pytest.fixture
+def outbox(tmp_path, monkeypatch):
+    FakeSMTP.sent, FakeSMTP.failures, FakeSMTP.timeouts, FakeSMTP.delay = [], 0, [], 0
+    box = EmailOutbox(str(tmp_path / "outbox.db"), smtp_factory=FakeSMTP,
+                      max_attempts=3, retry_base=30, smtp_timeout=7)
+    # Drive process_due() from the test instead of the background thread
+    monkeypatch.setattr(box, "ensure_worker", lambda: None)
+    return box
+
+
+def status(box, mid):
+    return box.conn.execute("SELECT status, attempts, next_attempt_at FROM outbox WHERE id = ?", (mid,)).fetchone()
+
+
+def make_due(box):
+    box.conn.execute("UPDATE outbox SET next_attempt_at = 0 WHERE status = 'queued'")
+
+
+def test_sends_due_messages_over_one_connection(outbox):
+    for n in range(3):
+        outbox.enqueue(f"c{n}@example.com", "Hi", "Body")
+
+    assert outbox.process_due() == 3
+    assert FakeSMTP.sent == ["c0@example.com", "c1@example.com", "c2@example.com"]
+    assert FakeSMTP.timeouts == [7]
+    assert outbox.pending_count() == 0
+
+
+def test_failure_is_retried_with_backoff(outbox):
+    mid = outbox.enqueue("c@example.com", "Hi", "Body")
+    FakeSMTP.failures = 1
+
+    before = time.time()
+    assert outbox.process_due() == 0
+    state, attempts, next_attempt_at = status(outbox, mid)
+    assert (state, attempts) == ("queued", 1)
+    assert next_attempt_at >= before + 30
+
+    # Not due yet
+    assert outbox.process_due() == 0
+    assert FakeSMTP.sent == []
+
+    make_due(outbox)
+    FakeSMTP.failures = 1
+    outbox.process_due()
+    state, attempts, next_attempt_at = status(outbox, mid)
+    assert attempts == 2
+    assert next_attempt_at >= before + 60
+
+    make_due(outbox)
+    assert outbox.process_due() == 1
+    assert FakeSMTP.sent == ["c@example.com"]
+    assert status(outbox, mid) is None
+
+
+def test_gives_up_after_max_attempts(outbox):
+    mid = outbox.enqueue("c@example.com", "Hi", "Body")
+    FakeSMTP.failures = 99
+    for _ in range(3):
+        make_due(outbox)
+        outbox.process_due()
+
+    assert status(outbox, mid)[:2] == ("dead", 3)
+    assert outbox.pending_count() == 0
+    (dead,) = outbox.dead_letters()
+    assert dead["id"] == mid and "unavailable" in dead["last_error"]
+
+    # Dead letters stay put until retried by hand
+    make_due(outbox)
+    FakeSMTP.failures = 0
+    assert outbox.process_due() == 0
+
+    outbox.retry_dead(mid)
+    assert outbox.process_due() == 1
+    assert outbox.dead_letters() == []
+
+
+def test_past_deadline_leaves_messages_queued(outbox):
+    mid = outbox.enqueue("c@example.com", "Hi", "Body")
+
+    assert outbox.process_due(deadline=time.monotonic() - 1) == 0
+    assert status(outbox, mid)[:2] == ("queued", 0)
+    assert outbox.process_due() == 1
+
+
+def test_deadline_mid_batch_puts_unsent_claims_back(outbox):
+    mids = [outbox.enqueue(f"c{n}@example.com", "Hi", "Body") for n in range(3)]
+    FakeSMTP.delay = 0.2
+
+    assert outbox.process_due(deadline=time.monotonic() + 0.1) == 1
+    assert [status(outbox, mid)[:2] for mid in mids[1:]] == [("queued", 0)] * 2
+
+
+def test_enqueue_many_queues_every_message_once(outbox):
+    ids = outbox.enqueue_many([(f"c{n}@example.com", "Status", "Body") for n in range(3)])
+
+    assert len(ids) == 3 and outbox.pending_count() == 3
+    assert outbox.process_due() == 3
+    assert outbox.process_due() == 0
+    assert sorted(FakeSMTP.sent) == ["c0@example.com", "c1@example.com", "c2@example.com"]
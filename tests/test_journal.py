@@ -0,0 +1,95 @@
+import os
+
+from managers.storage import JsonCollection
+from tests.conftest import run_in_processes
+
+
+def open_orders(directory):
+    collection = JsonCollection(
+        os.path.join(directory, "orders.json"),
+        os.path.join(directory, "orders.journal.jsonl"),
+        email_of=lambda r: r.get("email"),
+        compact_threshold=10 ** 6,
+    )
+    collection.load()
+    return collection
+
+
+def add_orders(directory, tag, count):
+    orders = open_orders(directory)
+    for n in range(count):
+        with orders.transaction():
+            orders.insert({"id": orders.next_id(), "tag": tag, "n": n, "email": f"{tag}@example.com",
+                           "status": "Pending"})
+
+
+def ship_orders(directory, ids):
+    orders = open_orders(directory)
+    with orders.transaction():
+        orders.update_many(orders.get_many(ids), status="Shipped")
+
+
+def compact(directory):
+    open_orders(directory).compact()
+
+
+def snapshot(collection):
+    return sorted((dict(r) for r in collection.all()), key=lambda r: r["id"])
+
+
+def test_writers_in_several_processes_get_distinct_ids(tmp_path):
+    orders = open_orders(tmp_path)
+    run_in_processes(add_orders, (tmp_path, "a", 20), (tmp_path, "b", 20), (tmp_path, "c", 20))
+
+    orders.sync()
+    assert [r["id"] for r in snapshot(orders)] == list(range(1, 61))
+    assert len(orders.find_by_email("b@example.com")) == 20
+
+
+def test_sync_replays_another_process_journal_entries(tmp_path):
+    add_orders(tmp_path, "a", 5)
+    orders = open_orders(tmp_path)
+    kept = orders.get(3)
+
+    run_in_processes(ship_orders, (tmp_path, [2, 4]))
+    orders.sync()
+
+    assert [r["status"] for r in snapshot(orders)] == ["Pending", "Shipped", "Pending", "Shipped", "Pending"]
+    # Replayed onto the records in memory, not reloaded from scratch
+    assert orders.get(3) is kept
+    assert snapshot(open_orders(tmp_path)) == snapshot(orders)
+
+
+def test_compaction_by_another_process_is_picked_up(tmp_path):
+    add_orders(tmp_path, "a", 10)
+    orders = open_orders(tmp_path)
+
+    run_in_processes(compact, (tmp_path,))
+    assert not os.path.exists(tmp_path / "orders.journal.jsonl")
+    run_in_processes(ship_orders, (tmp_path, [1]))
+    orders.sync()
+
+    assert len(snapshot(orders)) == 10
+    assert orders.get(1)["status"] == "Shipped"
+    assert snapshot(open_orders(tmp_path)) == snapshot(orders)
+
+
+def compact_or_write(directory, role):
+    if role == "compact":
+        for _ in range(5):
+            compact(directory)
+    else:
+        add_orders(directory, "b", 40)
+
+
+def test_writes_during_compaction_are_kept(tmp_path):
+    add_orders(tmp_path, "a", 50)
+    orders = open_orders(tmp_path)
+
+    # One process compacts repeatedly while another keeps appending
+    run_in_processes(compact_or_write, (tmp_path, "compact"), (tmp_path, "write"))
+    orders.sync()
+
+    records = snapshot(orders)
+    assert [r["id"] for r in records] == list(range(1, 91))
+    assert snapshot(open_orders(tmp_path)) == records
@@ -0,0 +1,102 @@
+import json
+import os
+
+import pytest
+
+from managers.lazy_storage import LazyJsonCollection
+from managers.order_manager import OrderManager
+from managers.records import json_default
+from tests.conftest import run_in_processes
+
+
+def open_orders(directory):
+    collection = LazyJsonCollection(
+        os.path.join(directory, "orders.json"),
+        os.path.join(directory, "orders.journal.jsonl"),
+        compact_threshold=10 ** 6,
+        **OrderManager.COLLECTION_OPTIONS,
+    )
+    collection.load()
+    return collection
+
+
+def plain(records):
+    return [json.loads(json.dumps(r, default=json_default)) for r in records]
+
+
+def views(collection):
+    """Everything the storefront and admin read, as plain data."""
+    return {
+        "all": plain(collection.all()),
+        "get": plain([collection.get(7), collection.get(41)]),
+        "email": plain(collection.find_by_email("C3@example.com")),
+        "shipped": plain(collection.query({"status": ("shipped", "shipped")}, sort="total", limit=100)[0]),
+        "page": plain(collection.query(sort="datetime", offset=5, limit=10)[0]),
+    }
+
+
+@pytest.fixture
+def orders(tmp_path):
+    """40 orders in a compacted snapshot (with its index), then 5 more and some updates in the journal."""
+    collection = open_orders(tmp_path)
+
+    def add(n):
+        with collection.transaction():
+            collection.insert({
+                "id": collection.next_id(),
+                "user": {"name": f"Customer {n % 7}", "email": f"c{n % 7}@example.com"},
+                "items": [{"id": 1 + n % 3, "name": "Jam", "price": 5.0, "quantity": 1 + n % 4}],
+                "total": 5.0 * (1 + n % 4),
+                "datetime": f"2025-01-{1 + n % 28:02d} 10:00:{n % 60:02d}",
+                "status": "Pending",
+            })
+
+    for n in range(40):
+        add(n)
+    collection.compact()
+    for n in range(40, 45):
+        add(n)
+    with collection.transaction():
+        collection.update_many(collection.get_many([3, 7, 41]), status="Shipped")
+    return collection
+
+
+def test_cold_load_from_index_matches_warm_collection(tmp_path, orders):
+    assert os.path.exists(tmp_path / "orders.json.idx")
+    cold = open_orders(tmp_path)
+
+    assert len(cold.all()) == 45
+    assert views(cold) == views(orders)
+
+
+def test_cold_load_without_index_rebuilds_it(tmp_path, orders):
+    os.remove(tmp_path / "orders.json.idx")
+    cold = open_orders(tmp_path)
+
+    assert views(cold) == views(orders)
+    assert os.path.exists(tmp_path / "orders.json.idx")
+
+
+def test_cold_load_ignores_an_index_for_another_snapshot(tmp_path, orders):
+    expected = views(orders)
+    # A hand-edited snapshot: same records, different layout, index left behind
+    path = tmp_path / "orders.json"
+    with open(path) as f:
+        records = json.load(f)
+    with open(path, "w") as f:
+        json.dump(records, f, indent=2)
+
+    assert views(open_orders(tmp_path)) == expected
+
+
+def compact(directory):
+    open_orders(directory).compact()
+
+
+def test_reloads_after_compaction_by_another_process(tmp_path, orders):
+    before = views(orders)
+    run_in_processes(compact, (tmp_path,))
+    orders.sync()
+
+    assert not orders.state.overlay
+    assert views(orders) == before
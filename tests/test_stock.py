@@ -0,0 +1,114 @@
+import os
+import threading
+import time
+
+import pytest
+
+from managers.stock import OutOfStock, StockLedger
+from tests.conftest import run_in_processes
+
+
+@pytest.fixture
+def ledger(tmp_path):
+    return StockLedger(str(tmp_path / "stock.db"))
+
+
+def buy_until_sold_out(db_path, product_ids, results_dir, name):
+    """Check out one unit at a time until every product is gone; record how many were bought."""
+    ledger = StockLedger(db_path)
+    bought = 0
+    for attempt in range(10_000):
+        pid = product_ids[attempt % len(product_ids)]
+        try:
+            hold = ledger.reserve({pid: 1, 99: 1})  # 99 isn't tracked and never runs out
+        except OutOfStock:
+            if all(ledger.get(p)["available"] == 0 for p in product_ids):
+                break
+            continue
+        if attempt % 5 == 0:
+            ledger.release(hold)  # an abandoned checkout
+            continue
+        ledger.commit(hold)
+        bought += 1
+    with open(os.path.join(results_dir, name), "w") as f:
+        f.write(str(bought))
+
+
+def test_concurrent_buyers_in_several_processes_never_oversell(tmp_path, ledger):
+    ledger.set(1, 40)
+    ledger.set(2, 25)
+
+    run_in_processes(buy_until_sold_out, *[
+        (ledger.db_path, [1, 2], str(tmp_path), f"buyer-{n}") for n in range(4)
+    ])
+
+    bought = sum(int((tmp_path / f"buyer-{n}").read_text()) for n in range(4))
+    assert bought == 65
+    assert ledger.levels() == {
+        1: {"on_hand": 0, "reserved": 0, "available": 0},
+        2: {"on_hand": 0, "reserved": 0, "available": 0},
+    }
+
+
+def test_concurrent_threads_never_oversell(ledger):
+    ledger.set(1, 30)
+    sold = []
+
+    def buyer():
+        local = StockLedger(ledger.db_path)
+        for _ in range(20):
+            try:
+                local.commit(local.reserve({1: 2}))
+                sold.append(2)
+            except OutOfStock:
+                pass
+
+    threads = [threading.Thread(target=buyer) for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sum(sold) == 30
+    assert ledger.get(1) == {"on_hand": 0, "reserved": 0, "available": 0}
+
+
+def test_a_short_line_releases_the_lines_already_held(ledger):
+    ledger.set(1, 5)
+    ledger.set(2, 1)
+
+    with pytest.raises(OutOfStock) as raised:
+        ledger.reserve({1: 3, 2: 2})
+
+    assert (raised.value.product_id, raised.value.requested, raised.value.available) == (2, 2, 1)
+    assert ledger.get(1)["reserved"] == 0 and ledger.get(2)["reserved"] == 0
+
+
+def expire_holds(ledger):
+    time.sleep(0.05)
+    ledger._next_sweep = 0
+    ledger._sweep()
+
+
+def test_commit_of_an_expired_hold_sells_units_still_there(tmp_path):
+    ledger = StockLedger(str(tmp_path / "stock.db"), hold_seconds=0.01)
+    ledger.set(1, 3)
+    hold = ledger.reserve({1: 2})
+    expire_holds(ledger)
+    assert ledger.get(1)["reserved"] == 0
+
+    ledger.commit(hold)
+    assert ledger.get(1) == {"on_hand": 1, "reserved": 0, "available": 1}
+
+
+def test_commit_of_an_expired_hold_whose_units_were_sold_fails(tmp_path):
+    ledger = StockLedger(str(tmp_path / "stock.db"), hold_seconds=0.01)
+    ledger.set(1, 2)
+    late = ledger.reserve({1: 2})
+    expire_holds(ledger)
+    ledger.commit(ledger.reserve({1: 2}))
+
+    with pytest.raises(OutOfStock):
+        ledger.commit(late)
+    ledger.release(late)
+    assert ledger.get(1) == {"on_hand": 0, "reserved": 0, "available": 0}
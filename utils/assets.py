@@ -0,0 +1,165 @@
+"""
+Fingerprinted, precompressed static assets.
+
+    python build_assets.py      # static/ -> static/dist/ + manifest.json
+
+The build copies every file under static/ to static/dist/ with a content
+hash in its name (css/style.css -> css/style.3f2a9c1b0d4e.css), writes
+.gz (and .br, if the brotli package is installed) next to each text
+asset, and records the mapping in static/dist/manifest.json.
+
+init_app() then makes `url_for('static', filename=...)` in templates
+emit /assets/<hashed name> for every file in the manifest. /assets serves
+the best precompressed variant the browser accepts, with a one-year
+`Cache-Control: immutable`: a changed file gets a new name, so browsers
+never have to revalidate. Without a manifest (or in debug mode) the
+plain /static URLs are used.
+"""
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import re
+
+from flask import current_app, request, send_from_directory, url_for
+from werkzeug.security import safe_join
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+DIST = "dist"
+MANIFEST = "manifest.json"
+HASH_LENGTH = 12
+# Worth precompressing; images and fonts are compressed already
+COMPRESSIBLE = {".css", ".js", ".svg", ".json", ".txt", ".html", ".map", ".xml"}
+CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+CSS_URL = re.compile(r"""url\(\s*(['"]?)([^'")]+)\1\s*\)""")
+
+
+# -------------------------
+# Build
+# -------------------------
+def _fingerprinted(name, data):
+    stem, ext = os.path.splitext(name)
+    return f"{stem}.{hashlib.sha256(data).hexdigest()[:HASH_LENGTH]}{ext}"
+
+
+def _rewrite_css_urls(css_name, text, manifest):
+    """Point url(...) references in a stylesheet at the hashed files."""
+    base = os.path.dirname(css_name)
+
+    def replace(match):
+        quote, target = match.groups()
+        if re.match(r"^([a-z]+:|/|#)", target):
+            return match.group(0)
+        path, _, suffix = target.partition("?")
+        resolved = os.path.normpath(os.path.join(base, path)).replace(os.sep, "/")
+        hashed = manifest.get(resolved)
+        if hashed is None:
+            return match.group(0)
+        relative = os.path.relpath(hashed, base or ".").replace(os.sep, "/")
+        return f"url({quote}{relative}{'?' + suffix if suffix else ''}{quote})"
+
+    return CSS_URL.sub(replace, text)
+
+
+def _write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+def _precompress(path, data):
+    """Write .gz/.br siblings of `path`; a variant that doesn't save space is skipped."""
+    # mtime=0 keeps the output byte-identical across builds
+    variants = [(".gz", gzip.compress(data, compresslevel=9, mtime=0))]
+    if brotli is not None:
+        variants.append((".br", brotli.compress(data, quality=11)))
+    for suffix, compressed in variants:
+        if len(compressed) < len(data):
+            _write(path + suffix, compressed)
+
+
+def build(static_dir):
+    """
+    Fingerprint and precompress everything in `static_dir` into its dist/
+    folder. Files from earlier builds are left in place, so pages still
+    cached with old names keep working. Returns the manifest.
+    """
+    dist_dir = os.path.join(static_dir, DIST)
+    sources = []
+    for root, dirs, files in os.walk(static_dir):
+        if os.path.abspath(root) == os.path.abspath(static_dir):
+            dirs[:] = [d for d in dirs if d != DIST]
+        for name in files:
+            full = os.path.join(root, name)
+            sources.append(os.path.relpath(full, static_dir).replace(os.sep, "/"))
+
+    # Stylesheets last, so their url() references can be rewritten to hashed names
+    sources.sort(key=lambda name: (name.endswith(".css"), name))
+    manifest = {}
+    for name in sources:
+        with open(os.path.join(static_dir, name), "rb") as f:
+            data = f.read()
+        if name.endswith(".css"):
+            data = _rewrite_css_urls(name, data.decode("utf-8"), manifest).encode("utf-8")
+        hashed = _fingerprinted(name, data)
+        target = os.path.join(dist_dir, hashed)
+        if not os.path.exists(target):
+            _write(target, data)
+            if os.path.splitext(name)[1].lower() in COMPRESSIBLE:
+                _precompress(target, data)
+        manifest[name] = hashed
+
+    tmp = os.path.join(dist_dir, MANIFEST + ".tmp")
+    _write(tmp, json.dumps(manifest, indent=2, sort_keys=True).encode("utf-8"))
+    os.replace(tmp, os.path.join(dist_dir, MANIFEST))
+    return manifest
+
+
+def load_manifest(static_dir):
+    try:
+        with open(os.path.join(static_dir, DIST, MANIFEST)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+# -------------------------
+# Serving
+# -------------------------
+def init_app(app):
+    """Serve /assets and make url_for('static', ...) use the manifest's hashed names."""
+    manifest = load_manifest(app.static_folder)
+    dist_dir = os.path.join(app.static_folder, DIST)
+
+    def asset_url_for(endpoint, **values):
+        if endpoint == "static" and not current_app.debug:
+            hashed = manifest.get(values.get("filename"))
+            if hashed is not None:
+                values["filename"] = hashed
+                return url_for("assets", **values)
+        return url_for(endpoint, **values)
+
+    def serve(filename):
+        mimetype = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+        accepted = request.accept_encodings
+        for suffix, encoding in ((".br", "br"), (".gz", "gzip")):
+            variant = safe_join(dist_dir, filename + suffix)
+            if accepted[encoding] and variant is not None and os.path.isfile(variant):
+                response = send_from_directory(dist_dir, filename + suffix, mimetype=mimetype)
+                response.headers["Content-Encoding"] = encoding
+                break
+        else:
+            response = send_from_directory(dist_dir, filename, mimetype=mimetype)
+        response.headers["Cache-Control"] = CACHE_CONTROL
+        response.vary.add("Accept-Encoding")
+        return response
+
+    app.jinja_env.globals["url_for"] = asset_url_for
+    app.add_url_rule("/assets/<path:filename>", "assets", serve)
+    return manifest
@@ -0,0 +1,80 @@
+"""
+Dynamic response compression and conditional GETs.
+
+    init_app(app)
+
+Compresses text responses (HTML, JSON, CSS, JS, CSV...) larger than
+COMPRESS_MIN_SIZE bytes with brotli, when the package is installed and
+the browser accepts it, or gzip otherwise, at COMPRESS_LEVEL /
+COMPRESS_BROTLI_QUALITY. Responses that are already encoded (/assets),
+streamed (CSV exports) or served straight from a file (/images) pass
+through untouched.
+
+GET responses without a validator get a weak ETag over the uncompressed
+body, and a matching If-None-Match is answered with an empty 304. Pages
+from page_cache already carry their own ETag and are left alone.
+"""
+import gzip
+import hashlib
+
+from flask import request
+
+from utils.metrics import span
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE = {
+    "text/html", "text/plain", "text/css", "text/csv", "text/xml", "text/javascript",
+    "application/json", "application/javascript", "application/xml", "image/svg+xml",
+}
+
+
+def _compress(data, encoding, level, brotli_quality):
+    if encoding == "br":
+        return brotli.compress(data, quality=brotli_quality)
+    return gzip.compress(data, compresslevel=level, mtime=0)
+
+
+def init_app(app):
+    """Register the compression/ETag hook. Call it after metrics.init_app so the time shows in Server-Timing."""
+    min_size = app.config.get("COMPRESS_MIN_SIZE", 500)
+    level = app.config.get("COMPRESS_LEVEL", 6)
+    brotli_quality = app.config.get("COMPRESS_BROTLI_QUALITY", 4)
+
+    @app.after_request
+    def compress_response(response):
+        if (response.direct_passthrough or response.is_streamed
+                or response.status_code < 200 or response.status_code in (204, 304)
+                or "Content-Encoding" in response.headers
+                or response.mimetype not in COMPRESSIBLE):
+            return response
+        data = response.get_data()
+
+        if request.method in ("GET", "HEAD") and response.status_code == 200 and not response.get_etag()[0]:
+            response.set_etag(hashlib.sha1(data).hexdigest()[:20], weak=True)
+            response.make_conditional(request)
+            if response.status_code == 304:
+                return response
+
+        response.vary.add("Accept-Encoding")
+        if len(data) < min_size:
+            return response
+        accepted = request.accept_encodings
+        if brotli is not None and accepted["br"]:
+            encoding = "br"
+        elif accepted["gzip"]:
+            encoding = "gzip"
+        else:
+            return response
+
+        with span("compress"):
+            compressed = _compress(data, encoding, level, brotli_quality)
+        if len(compressed) < len(data):
+            response.set_data(compressed)
+            response.headers["Content-Encoding"] = encoding
+        return response
+
+    return compress_response
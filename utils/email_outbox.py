@@ -0,0 +1,277 @@
+import atexit
+import os
+import threading
+import time
+
+from managers.sqlite_storage import connect
+from utils.email_utils import SMTPConnection, build_message
+from utils.metrics import span
+
+
+class EmailOutbox:
+    """
+    Persistent email queue backed by SQLite.
+
+    Requests call `enqueue()` and return immediately. A background thread
+    claims due messages, sends them over one reused SMTP connection and
+    retries failures with exponential backoff. Messages that still fail
+    after `max_attempts` are parked as "dead" (see `dead_letters()`).
+    Several worker processes can share one outbox; claims are atomic.
+    A process that started the sender drains the queue when it exits.
+    """
+
+    # A message stuck in "sending" longer than this belonged to a worker
+    # that died mid-send, and is queued again.
+    CLAIM_TIMEOUT = 300
+
+    def __init__(self, db_path, smtp_factory=None, max_attempts=5, retry_base=30,
+                 poll_interval=2.0, batch_size=20, smtp_timeout=30):
+        self.db_path = db_path
+        self.smtp_factory = smtp_factory
+        self.smtp_timeout = smtp_timeout
+        self.max_attempts = max_attempts
+        self.retry_base = retry_base
+        self.poll_interval = poll_interval
+        self.batch_size = batch_size
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = None
+        self._pid = None
+        self._drain_registered = False
+        self._create_table()
+
+    @property
+    def conn(self):
+        return connect(self.db_path)
+
+    def _create_table(self):
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS outbox (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                recipient TEXT NOT NULL,
+                subject TEXT NOT NULL,
+                body TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'queued',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                next_attempt_at REAL NOT NULL,
+                claimed_at REAL,
+                last_error TEXT,
+                created_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_outbox_due ON outbox (status, next_attempt_at);
+        """)
+
+    # -------------------------
+    # Queue
+    # -------------------------
+    def enqueue(self, to, subject, message):
+        now = time.time()
+        cur = self.conn.execute(
+            "INSERT INTO outbox (recipient, subject, body, next_attempt_at, created_at) VALUES (?, ?, ?, ?, ?)",
+            (to, subject, message, now, now),
+        )
+        self.ensure_worker()
+        self._wakeup.set()
+        return cur.lastrowid
+
+    def enqueue_many(self, messages):
+        """Queue [(to, subject, message)] in one transaction. Returns their ids."""
+        now = time.time()
+        conn = self.conn
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            ids = [
+                conn.execute(
+                    "INSERT INTO outbox (recipient, subject, body, next_attempt_at, created_at) VALUES (?, ?, ?, ?, ?)",
+                    (to, subject, message, now, now),
+                ).lastrowid
+                for to, subject, message in messages
+            ]
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        self.ensure_worker()
+        self._wakeup.set()
+        return ids
+
+    def _claim(self):
+        """Atomically mark a batch of due messages as being sent by us."""
+        now = time.time()
+        conn = self.conn
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                "UPDATE outbox SET status = 'queued' WHERE status = 'sending' AND claimed_at < ?",
+                (now - self.CLAIM_TIMEOUT,),
+            )
+            rows = conn.execute(
+                "SELECT id, recipient, subject, body, attempts FROM outbox "
+                "WHERE status = 'queued' AND next_attempt_at <= ? ORDER BY next_attempt_at LIMIT ?",
+                (now, self.batch_size),
+            ).fetchall()
+            conn.executemany(
+                "UPDATE outbox SET status = 'sending', claimed_at = ? WHERE id = ?",
+                [(now, row[0]) for row in rows],
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return rows
+
+    def _connection(self):
+        return SMTPConnection(smtp_factory=self.smtp_factory, timeout=self.smtp_timeout)
+
+    def process_due(self, connection=None, deadline=None):
+        """
+        Send every message that is due. Returns the number sent successfully.
+        With a `deadline` (time.monotonic()), no new message is started after
+        it; messages already claimed go back to the queue untouched.
+        """
+        own_connection = connection is None
+        connection = connection or self._connection()
+        sent = 0
+        try:
+            while deadline is None or time.monotonic() < deadline:
+                rows = self._claim()
+                if not rows:
+                    break
+                for i, (mid, to, subject, body, attempts) in enumerate(rows):
+                    if deadline is not None and time.monotonic() >= deadline:
+                        self._unclaim([row[0] for row in rows[i:]])
+                        break
+                    try:
+                        with span("email.send"):
+                            connection.send(build_message(to, subject, body))
+                    except Exception as e:
+                        connection.close()
+                        self._failed(mid, attempts + 1, e)
+                    else:
+                        self.conn.execute("DELETE FROM outbox WHERE id = ?", (mid,))
+                        sent += 1
+        finally:
+            if own_connection:
+                connection.close()
+        return sent
+
+    def _unclaim(self, mids):
+        self.conn.executemany("UPDATE outbox SET status = 'queued' WHERE id = ?", [(mid,) for mid in mids])
+
+    def _failed(self, mid, attempts, error):
+        if attempts >= self.max_attempts:
+            self.conn.execute(
+                "UPDATE outbox SET status = 'dead', attempts = ?, last_error = ? WHERE id = ?",
+                (attempts, str(error), mid),
+            )
+            print("EMAIL ERROR: giving up on message", mid, error)
+            return
+        delay = self.retry_base * 2 ** (attempts - 1)
+        self.conn.execute(
+            "UPDATE outbox SET status = 'queued', attempts = ?, last_error = ?, next_attempt_at = ? WHERE id = ?",
+            (attempts, str(error), time.time() + delay, mid),
+        )
+
+    # -------------------------
+    # Dead letters
+    # -------------------------
+    def pending_count(self):
+        (count,) = self.conn.execute("SELECT COUNT(*) FROM outbox WHERE status != 'dead'").fetchone()
+        return count
+
+    def dead_letters(self):
+        rows = self.conn.execute(
+            "SELECT id, recipient, subject, attempts, last_error, created_at FROM outbox "
+            "WHERE status = 'dead' ORDER BY id"
+        )
+        keys = ("id", "to", "subject", "attempts", "last_error", "created_at")
+        return [dict(zip(keys, row)) for row in rows]
+
+    def retry_dead(self, mid=None):
+        """Put dead messages (one, or all) back in the queue."""
+        query = "UPDATE outbox SET status = 'queued', attempts = 0, next_attempt_at = ? WHERE status = 'dead'"
+        params = [time.time()]
+        if mid is not None:
+            query += " AND id = ?"
+            params.append(mid)
+        self.conn.execute(query, params)
+        self._wakeup.set()
+
+    # -------------------------
+    # Background worker
+    # -------------------------
+    def ensure_worker(self):
+        """Start the sender thread in this process if it isn't running (e.g. after a fork)."""
+        if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+            return
+        self._pid = os.getpid()
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name="email-outbox", daemon=True)
+        self._thread.start()
+        if not self._drain_registered:
+            # The thread is a daemon: without this, mail queued just before
+            # exit (e.g. by a script) would wait for the next start
+            atexit.register(self.drain)
+            self._drain_registered = True
+
+    def stop(self, timeout=5):
+        self._stopping.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def drain(self, timeout=5):
+        """
+        Stop the sender thread, then send what is due for up to `timeout`
+        seconds in all (plus at most one SMTP timeout for a message already
+        being sent). Failures and anything left stay queued for the next start.
+        """
+        deadline = time.monotonic() + timeout
+        self.stop(timeout)
+        if self._thread is not None and self._thread.is_alive():
+            # Still stuck mid-send; its claims are retried after CLAIM_TIMEOUT
+            return
+        try:
+            self.process_due(deadline=deadline)
+        except Exception as e:
+            print("EMAIL ERROR:", e)
+
+    def _run(self):
+        connection = self._connection()
+        try:
+            while not self._stopping.is_set():
+                try:
+                    self.process_due(connection)
+                except Exception as e:
+                    print("EMAIL ERROR:", e)
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+                connection.close_if_idle()
+        finally:
+            connection.close()
+
+
+_outbox = None
+_outbox_config = None
+_outbox_lock = threading.Lock()
+
+
+def get_outbox():
+    """The process-wide outbox for the active config."""
+    global _outbox, _outbox_config
+    from config import active_config
+
+    config = active_config()
+    if _outbox_config is not config:
+        with _outbox_lock:
+            if _outbox_config is not config:
+                if _outbox is not None:
+                    _outbox.stop()
+                _outbox = EmailOutbox(
+                    config.OUTBOX_PATH,
+                    max_attempts=config.EMAIL_MAX_ATTEMPTS,
+                    retry_base=config.EMAIL_RETRY_BASE_SECONDS,
+                    smtp_timeout=config.EMAIL_SMTP_TIMEOUT,
+                )
+                _outbox_config = config
+    return _outbox
@@ -1,21 +1,113 @@
 import smtplib
+import time
 from email.message import EmailMessage
 import os
 
+from utils.metrics import span
+
+
+def build_message(to, subject, message):
+    email = EmailMessage()
+    email["From"] = os.getenv("MAIL_USERNAME")
+    email["To"] = to
+    email["Subject"] = subject
+    email.set_content(message)
+    return email
+
+
+class SMTPConnection:
+    """
+    A reusable SMTP session: connect + STARTTLS + login happen once and
+    the connection is kept open for later messages. It reconnects once if
+    the server dropped an idle connection, and closes itself after
+    `idle_timeout` seconds without use. Every socket operation gives up
+    after `timeout` seconds, so a stalled server can't hang the sender.
+
+    `smtp_factory` defaults to smtplib.SMTP; tests pass a fake class.
+    """
+
+    def __init__(self, host=None, port=None, username=None, password=None,
+                 smtp_factory=None, idle_timeout=60, timeout=30):
+        self.host = host or os.getenv("MAIL_SERVER")
+        self.port = int(port or os.getenv("MAIL_PORT") or 587)
+        self.username = username or os.getenv("MAIL_USERNAME")
+        self.password = password or os.getenv("MAIL_PASSWORD")
+        self.smtp_factory = smtp_factory or smtplib.SMTP
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+        self._smtp = None
+        self._last_used = 0
+
+    def _connect(self):
+        smtp = self.smtp_factory(self.host, self.port, timeout=self.timeout)
+        smtp.starttls()
+        if self.username:
+            smtp.login(self.username, self.password)
+        self._smtp = smtp
+
+    def send(self, email):
+        self.close_if_idle()
+        if self._smtp is None:
+            self._connect()
+        try:
+            self._smtp.send_message(email)
+        except smtplib.SMTPServerDisconnected:
+            self.close()
+            self._connect()
+            self._smtp.send_message(email)
+        self._last_used = time.monotonic()
+
+    def close_if_idle(self):
+        if self._smtp is not None and time.monotonic() - self._last_used > self.idle_timeout:
+            self.close()
+
+    def close(self):
+        if self._smtp is not None:
+            try:
+                self._smtp.quit()
+            except Exception:
+                pass
+            self._smtp = None
+
+
+def deliver(to, subject, message, connection=None):
+    """Send one email right now. Raises on failure."""
+    own_connection = connection is None
+    connection = connection or SMTPConnection()
+    try:
+        connection.send(build_message(to, subject, message))
+    finally:
+        if own_connection:
+            connection.close()
+
+
 def send_email(to, subject, message):
+    """
+    Queue an email in the outbox; a background worker delivers it.
+    Returns True once the message is safely queued.
+    """
+    from utils.email_outbox import get_outbox
+
     try:
-        email = EmailMessage()
-        email["From"] = os.getenv("MAIL_USERNAME")
-        email["To"] = to
-        email["Subject"] = subject
-        email.set_content(message)
-
-        # Send email
-        with smtplib.SMTP(os.getenv("MAIL_SERVER"), int(os.getenv("MAIL_PORT"))) as smtp:
-            smtp.starttls()
-            smtp.login(os.getenv("MAIL_USERNAME"), os.getenv("MAIL_PASSWORD"))
-            smtp.send_message(email)
+        with span("email.enqueue"):
+            get_outbox().enqueue(to, subject, message)
+        return True
+
+    except Exception as e:
+        print("EMAIL ERROR:", e)
+        return False
 
+
+def send_emails(messages):
+    """
+    Queue several emails, given as (to, subject, message), in one write;
+    the outbox worker delivers them. Returns True once all are queued.
+    """
+    from utils.email_outbox import get_outbox
+
+    try:
+        with span("email.enqueue"):
+            get_outbox().enqueue_many(messages)
         return True
 
     except Exception as e:
@@ -0,0 +1,76 @@
+import csv
+import io
+import json
+
+ORDER_LINE_COLUMNS = [
+    "order_id", "datetime", "status", "order_total",
+    "customer_name", "customer_email", "customer_phone", "customer_address",
+    "product_id", "product_name", "unit_price", "quantity", "line_subtotal",
+]
+
+CUSTOMER_COLUMNS = ["customer_id", "name", "email", "phone", "address", "order_count", "order_ids"]
+
+
+def order_lines(orders):
+    """Flatten orders into one row per item (an order without items gets one empty-item row)."""
+    for order in orders:
+        user = order.get("user", {})
+        head = {
+            "order_id": order["id"],
+            "datetime": order.get("datetime", ""),
+            "status": order.get("status", ""),
+            "order_total": order.get("total", 0),
+            "customer_name": user.get("name", ""),
+            "customer_email": user.get("email", ""),
+            "customer_phone": user.get("phone", ""),
+            "customer_address": user.get("address", ""),
+        }
+        items = order.get("items") or [{}]
+        for item in items:
+            yield {
+                **head,
+                "product_id": item.get("id", ""),
+                "product_name": item.get("name", ""),
+                "unit_price": item.get("price", ""),
+                "quantity": item.get("quantity", ""),
+                "line_subtotal": item.get("subtotal", ""),
+            }
+
+
+def customer_rows(customers):
+    for customer in customers:
+        orders = customer.get("orders", [])
+        yield {
+            "customer_id": customer["id"],
+            "name": customer.get("name", ""),
+            "email": customer.get("email", ""),
+            "phone": customer.get("phone", ""),
+            "address": customer.get("address", ""),
+            "order_count": len(orders),
+            "order_ids": " ".join(str(oid) for oid in orders),
+        }
+
+
+def stream_csv(rows, columns, batch_size=200):
+    """Encode dict rows as CSV text, yielding a chunk every `batch_size` rows."""
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=columns, extrasaction="ignore")
+    writer.writeheader()
+    for n, row in enumerate(rows, 1):
+        writer.writerow(row)
+        if n % batch_size == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def stream_jsonl(rows, batch_size=200):
+    """Encode dict rows as JSON lines, yielding a chunk every `batch_size` rows."""
+    lines = []
+    for row in rows:
+        lines.append(json.dumps(row) + "\n")
+        if len(lines) == batch_size:
+            yield "".join(lines)
+            lines.clear()
+    yield "".join(lines)
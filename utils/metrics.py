@@ -0,0 +1,392 @@
+"""
+Request timing and hot-path instrumentation.
+
+    init_app(app)          # per-route latency, Server-Timing, /metrics
+    with span("orders.add"): ...
+    @timed("products.load")
+
+Every request is recorded in a latency histogram labelled by route
+pattern and method. Spans (manager load/save, email sends, template
+rendering) feed a second histogram and, inside a request, are summed
+into that response's `Server-Timing` header so the browser dev tools
+show where the time went. `/metrics` serves both in the Prometheus text
+format to a logged-in admin or a scraper holding METRICS_TOKEN.
+
+With PROFILE_SLOW_REQUEST_MS set, a background thread samples the stack
+of every in-flight request and, for requests slower than the threshold,
+writes the samples as folded stacks (flamegraph.pl / speedscope input)
+to PROFILE_DIR.
+"""
+import hmac
+import json
+import os
+import sys
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter as _Tally
+from contextlib import contextmanager
+from functools import wraps
+
+from flask import Response, abort, before_render_template, g, has_request_context, request, session, template_rendered
+
+# Prometheus' default latency buckets, in seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+# -------------------------
+# Metric types
+# -------------------------
+class Histogram:
+    """Latency histogram per label set; counts are stored per bucket, not cumulative."""
+    kind = "histogram"
+
+    def __init__(self, name, help, labels, buckets=BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, label_values, seconds):
+        slot = bisect_left(self.buckets, seconds)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                # One count per bucket, one for +Inf, then the running sum
+                series = self._series[label_values] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[slot] += 1
+            series[-1] += seconds
+
+    def snapshot(self):
+        with self._lock:
+            return [[list(k), list(v)] for k, v in self._series.items()]
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, help, labels):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def inc(self, label_values, amount=1):
+        with self._lock:
+            self._series[label_values] = self._series.get(label_values, 0) + amount
+
+    def snapshot(self):
+        with self._lock:
+            return [[list(k), v] for k, v in self._series.items()]
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+
+    def histogram(self, name, help, labels, buckets=BUCKETS):
+        return self.metrics.setdefault(name, Histogram(name, help, labels, buckets))
+
+    def counter(self, name, help, labels):
+        return self.metrics.setdefault(name, Counter(name, help, labels))
+
+    def snapshot(self):
+        """This process's metrics as plain JSON-able data."""
+        return {
+            name: {
+                "kind": m.kind, "help": m.help, "labels": list(m.labels),
+                "buckets": list(getattr(m, "buckets", ())), "series": m.snapshot(),
+            }
+            for name, m in self.metrics.items()
+        }
+
+
+registry = Registry()
+
+REQUEST_LATENCY = registry.histogram(
+    "jam_http_request_duration_seconds", "Request latency by route.", ("route", "method"))
+REQUESTS = registry.counter(
+    "jam_http_requests_total", "Requests by route and status.", ("route", "method", "status"))
+SPAN_LATENCY = registry.histogram(
+    "jam_span_duration_seconds", "Time spent in instrumented operations.", ("span",))
+
+
+# -------------------------
+# Spans
+# -------------------------
+def _record_span(name, seconds):
+    SPAN_LATENCY.observe((name,), seconds)
+    if has_request_context():
+        spans = g.setdefault("_spans", {})
+        spans[name] = spans.get(name, 0.0) + seconds
+
+
+@contextmanager
+def span(name):
+    """Time a block; inside a request it also shows up in Server-Timing."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _record_span(name, time.perf_counter() - start)
+
+
+def timed(name):
+    """Decorator form of span(); put it under @classmethod."""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                _record_span(name, time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+
+# -------------------------
+# Prometheus exposition
+# -------------------------
+def merge(snapshots):
+    """Add up snapshots from several worker processes."""
+    merged = {}
+    for snapshot in snapshots:
+        for name, metric in snapshot.items():
+            target = merged.setdefault(name, dict(metric, series={}))
+            for labels, value in metric["series"]:
+                key = tuple(labels)
+                if metric["kind"] == "counter":
+                    target["series"][key] = target["series"].get(key, 0) + value
+                else:
+                    current = target["series"].get(key)
+                    target["series"][key] = value if current is None else [a + b for a, b in zip(current, value)]
+    for metric in merged.values():
+        metric["series"] = [[list(k), v] for k, v in metric["series"].items()]
+    return merged
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=()):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    pairs.extend(f'{n}="{v}"' for n, v in extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def render_prometheus(snapshot):
+    lines = []
+    for name, metric in sorted(snapshot.items()):
+        lines.append(f"# HELP {name} {metric['help']}")
+        lines.append(f"# TYPE {name} {metric['kind']}")
+        names = metric["labels"]
+        for values, data in sorted(metric["series"], key=lambda s: s[0]):
+            if metric["kind"] == "counter":
+                lines.append(f"{name}{_labels(names, values)} {data}")
+                continue
+            cumulative = 0
+            for bound, count in zip(metric["buckets"] + ["+Inf"], data[:-1]):
+                cumulative += count
+                le = bound if bound == "+Inf" else repr(float(bound))
+                lines.append(f"{name}_bucket{_labels(names, values, [('le', le)])} {cumulative}")
+            lines.append(f"{name}_sum{_labels(names, values)} {data[-1]:.6f}")
+            lines.append(f"{name}_count{_labels(names, values)} {cumulative}")
+    return "\n".join(lines) + "\n"
+
+
+# -------------------------
+# Cross-process snapshots
+# -------------------------
+class SnapshotStore:
+    """
+    Each worker writes its own snapshot to `directory` (at most every
+    `interval` seconds, from the request path) so whichever worker serves
+    /metrics can report the sum for the whole server. Files of workers
+    that have exited are kept so counters never go backwards; clear the
+    directory when the server is redeployed.
+    """
+
+    def __init__(self, directory, interval=5.0):
+        self.directory = directory
+        self.interval = interval
+        self._last_write = 0.0
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self):
+        return os.path.join(self.directory, f"metrics-{os.getpid()}.json")
+
+    def maybe_write(self):
+        now = time.monotonic()
+        if now - self._last_write < self.interval:
+            return
+        self._last_write = now
+        self.write()
+
+    def write(self):
+        path = self._path()
+        tmp = f"{path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(registry.snapshot(), f)
+        os.replace(tmp, path)
+
+    def collect(self):
+        own = self._path()
+        snapshots = [registry.snapshot()]
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if not name.endswith(".json") or path == own:
+                continue
+            try:
+                with open(path) as f:
+                    snapshots.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+        return merge(snapshots)
+
+
+# -------------------------
+# Sampling profiler
+# -------------------------
+class SamplingProfiler:
+    """
+    Samples the stacks of in-flight request threads every `interval`
+    seconds. Requests that end up slower than `threshold` get their
+    samples written to `directory` as folded stacks, one file each.
+    """
+
+    def __init__(self, directory, threshold, interval=0.005):
+        self.directory = directory
+        self.threshold = threshold
+        self.interval = interval
+        self._active = {}
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        os.makedirs(directory, exist_ok=True)
+
+    def ensure_thread(self):
+        """Start the sampler in this process if it isn't running (e.g. after a fork)."""
+        if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+            return
+        self._pid = os.getpid()
+        self._active = {}
+        self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+        self._thread.start()
+
+    def start(self):
+        self.ensure_thread()
+        with self._lock:
+            self._active[threading.get_ident()] = _Tally()
+
+    def finish(self, seconds, label):
+        with self._lock:
+            samples = self._active.pop(threading.get_ident(), None)
+        if not samples or seconds < self.threshold:
+            return None
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        safe = "".join(c if c.isalnum() else "_" for c in label).strip("_") or "request"
+        path = os.path.join(self.directory, f"{stamp}-{int(seconds * 1000)}ms-{safe}-{os.getpid()}.folded")
+        with open(path, "w") as f:
+            for stack, count in samples.most_common():
+                f.write(f"{stack} {count}\n")
+        return path
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                if not self._active:
+                    continue
+                frames = sys._current_frames()
+                for ident, samples in self._active.items():
+                    frame = frames.get(ident)
+                    if frame is not None:
+                        samples[_fold(frame)] += 1
+
+
+def _fold(frame):
+    stack = []
+    while frame is not None:
+        code = frame.f_code
+        stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+        frame = frame.f_back
+    return ";".join(reversed(stack))
+
+
+# -------------------------
+# Flask wiring
+# -------------------------
+def init_app(app):
+    """
+    Register the timing hooks and /metrics. Call it before registering
+    blueprints so the total also covers their before_request hooks.
+    """
+    server_timing = app.config.get("SERVER_TIMING", True)
+    token = app.config.get("METRICS_TOKEN")
+    store = SnapshotStore(app.config["METRICS_DIR"]) if app.config.get("METRICS_DIR") else None
+    threshold_ms = app.config.get("PROFILE_SLOW_REQUEST_MS", 0)
+    profiler = None
+    if threshold_ms:
+        profiler = SamplingProfiler(
+            app.config["PROFILE_DIR"], threshold_ms / 1000,
+            interval=app.config.get("PROFILE_INTERVAL_MS", 5) / 1000,
+        )
+
+    @app.before_request
+    def start_timer():
+        g._request_start = time.perf_counter()
+        if profiler is not None:
+            profiler.start()
+
+    @app.after_request
+    def record_request(response):
+        start = g.pop("_request_start", None)
+        if start is None:
+            return response
+        elapsed = time.perf_counter() - start
+        route = request.url_rule.rule if request.url_rule is not None else "<unmatched>"
+        REQUEST_LATENCY.observe((route, request.method), elapsed)
+        REQUESTS.inc((route, request.method, str(response.status_code)))
+        if server_timing:
+            parts = [f"{name};dur={seconds * 1000:.2f}" for name, seconds in g.get("_spans", {}).items()]
+            parts.append(f"total;dur={elapsed * 1000:.2f}")
+            response.headers.add("Server-Timing", ", ".join(parts))
+        if profiler is not None:
+            profiler.finish(elapsed, f"{request.method} {route}")
+        if store is not None:
+            store.maybe_write()
+        return response
+
+    @app.teardown_request
+    def drop_profile(exc):
+        # Requests that never reached after_request (e.g. a client disconnect)
+        if profiler is not None and "_request_start" in g:
+            profiler.finish(0, "")
+
+    def render_started(sender, template, context, **extra):
+        g.setdefault("_render_starts", []).append(time.perf_counter())
+
+    def render_finished(sender, template, context, **extra):
+        starts = g.get("_render_starts")
+        if starts:
+            _record_span("render", time.perf_counter() - starts.pop())
+
+    before_render_template.connect(render_started, app, weak=False)
+    template_rendered.connect(render_finished, app, weak=False)
+
+    def metrics():
+        authorized = session.get("is_admin")
+        if not authorized and token:
+            supplied = request.headers.get("Authorization", "")
+            authorized = hmac.compare_digest(supplied.encode(), f"Bearer {token}".encode())
+        if not authorized:
+            abort(403)
+        snapshot = store.collect() if store is not None else registry.snapshot()
+        return Response(render_prometheus(snapshot), mimetype="text/plain; version=0.0.4")
+
+    app.add_url_rule("/metrics", "metrics", metrics)
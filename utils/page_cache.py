@@ -0,0 +1,60 @@
+import hashlib
+import time
+
+from flask import current_app, make_response, render_template, request, session
+from flask_wtf.csrf import generate_csrf
+
+from utils.cache import LRUCache
+
+# Rendered pages are cached with this in place of the per-session CSRF
+# token, which is swapped in for each response.
+CSRF_PLACEHOLDER = "__CSRF_TOKEN_PLACEHOLDER__"
+
+
+class PageCache:
+    """
+    Bounded LRU of rendered pages keyed on template + arguments + data version.
+
+    Pages that only change when the catalog changes (the storefront index
+    and product pages) are rendered once per catalog version. Responses
+    carry a weak ETag and Last-Modified so browsers can revalidate and get
+    a 304 without a render.
+    """
+
+    def __init__(self, maxsize=256):
+        self.cache = LRUCache(maxsize=maxsize)
+
+    def clear(self, *args):
+        self.cache.clear()
+
+    def render(self, template, version, context_fn, key=()):
+        """
+        Return a conditional response for `template`.
+        `context_fn()` builds the template context and is only called on a miss.
+        """
+        cache_key = (template, key, version)
+        entry = self.cache.get(cache_key)
+        if entry is None:
+            html = render_template(template, csrf_token=lambda: CSRF_PLACEHOLDER, **context_fn())
+            entry = (html, time.time())
+            self.cache.set(cache_key, entry)
+        html, rendered_at = entry
+
+        # The page embeds this session's CSRF token, so the validator must
+        # change with the token, and before a cached token can expire.
+        token = generate_csrf()
+        time_limit = current_app.config.get("WTF_CSRF_TIME_LIMIT") or 0
+        bucket = int(time.time() // (time_limit / 2)) if time_limit else 0
+        etag = hashlib.sha1(
+            repr((cache_key, session.get("csrf_token"), bucket)).encode()
+        ).hexdigest()[:20]
+
+        response = make_response(html.replace(CSRF_PLACEHOLDER, token))
+        response.set_etag(etag, weak=True)
+        response.last_modified = rendered_at
+        response.cache_control.private = True
+        response.cache_control.no_cache = True
+        return response.make_conditional(request)
+
+
+page_cache = PageCache()
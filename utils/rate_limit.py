@@ -0,0 +1,65 @@
+import math
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import make_response, request
+
+
+class TokenBucketLimiter:
+    """
+    Per-client token buckets.
+
+    Each client starts with `burst` tokens, spends one per request and
+    regains `rate` tokens per second, so short bursts pass and sustained
+    traffic is held to `rate`. Buckets are kept for at most `maxsize`
+    clients (least recently seen dropped first). Limits are per worker
+    process.
+    """
+
+    def __init__(self, rate, burst, maxsize=10000):
+        self.rate = rate
+        self.burst = burst
+        self.maxsize = maxsize
+        # client key -> (tokens, last refill time)
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def configure(self, rate, burst):
+        """Change the limits; every client starts over with a full bucket."""
+        with self._lock:
+            self.rate = rate
+            self.burst = burst
+            self._buckets.clear()
+
+    def acquire(self, key):
+        """Take a token for `key`. Returns 0 if allowed, else seconds until one is available."""
+        now = time.monotonic()
+        with self._lock:
+            tokens, stamp = self._buckets.pop(key, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - stamp) * self.rate)
+            if tokens >= 1:
+                tokens -= 1
+                wait = 0
+            else:
+                wait = (1 - tokens) / self.rate
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > self.maxsize:
+                self._buckets.popitem(last=False)
+        return wait
+
+
+def rate_limited(limiter, key_fn=lambda: request.remote_addr):
+    """Route decorator: answer 429 with Retry-After once a client's bucket is empty."""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            wait = limiter.acquire(key_fn())
+            if wait:
+                response = make_response("Too many requests, please try again shortly.", 429)
+                response.headers["Retry-After"] = str(math.ceil(wait))
+                return response
+            return func(*args, **kwargs)
+        return wrapper
+    return decorator